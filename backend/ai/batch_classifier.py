@@ -0,0 +1,227 @@
+#COSA FA: classifica con la CNN tutte le immagini di immagini_piante ancora con processed: false.
+#Lavora a blocchi (miniature lette in parallelo, un forward pass per blocco, bulk_write dei risultati)
+#e salva un checkpoint dopo ogni blocco: se il processo si interrompe, riparte da dove era arrivato.
+#
+#   python -m ai.batch_classifier                    → elabora tutto l'arretrato
+#   python -m ai.batch_classifier --rate 20          → al massimo 20 immagini/s (per non saturare la CPU)
+#   python -m ai.batch_classifier --restart          → ignora il checkpoint e riparte dall'inizio
+
+import os
+import time
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+import numpy as np
+from pymongo import UpdateOne, errors
+
+from database import db
+from ai.cnn_service import cnn_classifier, BACKEND, USE_INT8
+
+# Config da ENV
+JOB_BATCH = int(os.getenv("CNN_JOB_BATCH", "32"))                  # immagini per forward pass
+JOB_MAX_PER_SECOND = float(os.getenv("CNN_JOB_MAX_PER_SECOND", "0"))  # 0 = nessun limite
+JOB_DECODE_WORKERS = int(os.getenv("CNN_JOB_DECODE_WORKERS", "4"))   # letture/decodifiche in parallelo
+
+JOB_ID = "batch_classifier"
+
+images_collection = db["immagini_piante"]
+jobs_collection = db["cnn_jobs"]
+
+# Un solo job per processo (CLI o endpoint admin)
+_RUNNING = threading.Lock()
+_STOP = threading.Event()
+
+
+def cnn_results_doc(result: Dict[str, Any], processed_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Risultato di predict/classify nel formato cnnresults di immagini_piante (models.imageModel.CNNResults)."""
+    return {
+        "disease_detected": result.get("label"),
+        "confidence": result.get("confidence"),
+        "recommendations": [result["advice"]] if result.get("advice") else [],
+        "processed_at": processed_at or datetime.utcnow(),
+        "model_version": BACKEND + ("-int8" if USE_INT8 else ""),
+    }
+
+
+def _load_checkpoint() -> Dict[str, Any]:
+    return jobs_collection.find_one({"_id": JOB_ID}) or {}
+
+
+def _save_checkpoint(**fields):
+    jobs_collection.update_one(
+        {"_id": JOB_ID},
+        {"$set": {**fields, "updatedAt": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def _read_image(doc: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Miniatura (384px, più veloce da decodificare), altrimenti l'immagine intera."""
+    for key in ("filepaththumb", "filepathfull"):
+        path = doc.get(key)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                return cnn_classifier.decode_image(f.read())
+    return None
+
+
+def _safe_read(doc):
+    try:
+        return _read_image(doc), None
+    except Exception as e:
+        return None, str(e)
+
+
+def run_batch_job(batch_size: int = JOB_BATCH, max_per_second: float = JOB_MAX_PER_SECOND,
+                  restart: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Elabora l'arretrato in ordine di _id. Il checkpoint (ultimo _id completato + contatori)
+    è in cnn_jobs: le immagini illeggibili restano processed: false con cnnerror, ma non
+    vengono ritentate a ogni ripresa.
+    """
+    if not _RUNNING.acquire(blocking=False):
+        raise RuntimeError("Classificazione batch già in corso")
+    try:
+        return _run_job(batch_size, max_per_second, restart, limit)
+    finally:
+        _RUNNING.release()
+
+
+def _run_job(batch_size: int = JOB_BATCH, max_per_second: float = JOB_MAX_PER_SECOND,
+             restart: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+    # Da chiamare con _RUNNING acquisito
+    _STOP.clear()
+    try:
+        if not cnn_classifier.wait_ready():
+            raise RuntimeError("Modello CNN non disponibile")
+
+        state = {} if restart else _load_checkpoint()
+        last_id = state.get("lastId")
+        done, failed = (0, 0) if restart else (state.get("processed", 0), state.get("failed", 0))
+        _save_checkpoint(status="running", startedAt=datetime.utcnow(), lastId=last_id, processed=done, failed=failed)
+        print(f"[CNN JOB] Avvio{' (ripresa da ' + str(last_id) + ')' if last_id else ''}: "
+              f"batch {batch_size}, limite {max_per_second or '∞'} img/s")
+
+        buffer = np.empty((batch_size, *cnn_classifier.IMG_SIZE, 3), dtype=np.float32)
+        t_start = time.perf_counter()
+        session = 0
+        with ThreadPoolExecutor(max_workers=JOB_DECODE_WORKERS, thread_name_prefix="cnn-job") as pool:
+            while not _STOP.is_set() and (limit is None or session < limit):
+                query = {"processed": False}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                n = batch_size if limit is None else min(batch_size, limit - session)
+                # Una query per blocco invece di un cursore aperto per ore (niente timeout del cursore)
+                docs = list(images_collection.find(
+                    query, {"filepaththumb": 1, "filepathfull": 1, "planttype": 1}
+                ).sort("_id", 1).limit(n))
+                if not docs:
+                    break
+
+                t0 = time.perf_counter()
+                loaded = list(pool.map(_safe_read, docs))
+                ok = [(d, img) for d, (img, _) in zip(docs, loaded) if img is not None]
+                results = cnn_classifier.classify_batch(
+                    [img for _, img in ok], [d.get("planttype") for d, _ in ok], out=buffer
+                ) if ok else []
+
+                now = datetime.utcnow()
+                ops = [
+                    UpdateOne({"_id": d["_id"], "processed": False}, {"$set": {
+                        "processed": True,
+                        "processedtimestamp": now,
+                        "cnnresults": cnn_results_doc(r, now),
+                    }, "$unset": {"cnnerror": ""}})
+                    for (d, _), r in zip(ok, results)
+                ]
+                ops += [
+                    UpdateOne({"_id": d["_id"]}, {"$set": {"cnnerror": err or "Immagine non trovata su disco"}})
+                    for d, (img, err) in zip(docs, loaded) if img is None
+                ]
+                images_collection.bulk_write(ops, ordered=False)
+
+                # Checkpoint solo dopo la scrittura: una ripresa può al più rifare l'ultimo blocco
+                last_id = docs[-1]["_id"]
+                done += len(ok)
+                failed += len(docs) - len(ok)
+                session += len(docs)
+                elapsed = time.perf_counter() - t_start
+                rate = session / elapsed if elapsed > 0 else 0.0
+                _save_checkpoint(lastId=last_id, processed=done, failed=failed, imagesPerSecond=round(rate, 2))
+                print(f"[CNN JOB] +{len(ok)} ok, +{len(docs) - len(ok)} errori "
+                      f"({(time.perf_counter() - t0) * 1000:.0f} ms) | totale {done} | {rate:.1f} img/s")
+
+                # Limite di throughput: si aspetta quanto basta per restare sotto max_per_second
+                if max_per_second > 0:
+                    ahead = session / max_per_second - (time.perf_counter() - t_start)
+                    if ahead > 0:
+                        _STOP.wait(ahead)
+
+        status = "stopped" if _STOP.is_set() else "completed"
+        elapsed = time.perf_counter() - t_start
+        summary = {
+            "status": status,
+            "processed": done,
+            "failed": failed,
+            "session": session,
+            "seconds": round(elapsed, 1),
+            "imagesPerSecond": round(session / elapsed, 2) if elapsed > 0 else None,
+        }
+        _save_checkpoint(**{k: v for k, v in summary.items() if k != "session"}, lastId=last_id)
+        print(f"[CNN JOB] {status}: {session} immagini in {elapsed:.1f}s")
+        return summary
+    except Exception as e:
+        _save_checkpoint(status="error", error=str(e))
+        raise
+
+
+def start_in_background(**kwargs) -> bool:
+    """
+    Avvia il job in un thread (endpoint admin); False se è già in corso.
+    Il lock si prende qui, nel thread della richiesta, e lo rilascia il thread del job.
+    """
+    if not _RUNNING.acquire(blocking=False):
+        return False
+
+    def _run():
+        try:
+            _run_job(**kwargs)
+        except Exception as e:
+            print(f"[CNN JOB] Interrotto: {e}")
+        finally:
+            _RUNNING.release()
+
+    threading.Thread(target=_run, name="cnn-batch-job", daemon=True).start()
+    return True
+
+
+def stop():
+    """Ferma il job alla fine del blocco corrente (il checkpoint resta valido)."""
+    _STOP.set()
+
+
+def get_job_status() -> Dict[str, Any]:
+    try:
+        state = _load_checkpoint()
+        backlog = images_collection.count_documents({"processed": False})
+    except errors.PyMongoError as e:
+        return {"running": _RUNNING.locked(), "error": str(e)}
+    state.pop("_id", None)
+    return {"running": _RUNNING.locked(), "backlog": backlog, "checkpoint": state}
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Classificazione CNN delle immagini non ancora processate")
+    cli.add_argument("--batch", type=int, default=JOB_BATCH, help="immagini per forward pass")
+    cli.add_argument("--rate", type=float, default=JOB_MAX_PER_SECOND, help="massimo immagini/s (0 = nessun limite)")
+    cli.add_argument("--limit", type=int, default=None, help="ferma dopo N immagini")
+    cli.add_argument("--restart", action="store_true", help="ignora il checkpoint e riparte dall'inizio")
+    args = cli.parse_args()
+    try:
+        run_batch_job(args.batch, args.rate, args.restart, args.limit)
+    except KeyboardInterrupt:
+        _save_checkpoint(status="interrupted")
+        print("\n[CNN JOB] Interrotto: il prossimo avvio riprende dall'ultimo checkpoint.")
@@ -0,0 +1,174 @@
+#COSA FA: misura latenza e throughput del classificatore CNN su questa macchina.
+#Per ogni configurazione di thread (intra:inter op) avvia un processo separato — TF e onnxruntime
+#fissano i thread all'avvio — carica il modello del runtime scelto (CNN_BACKEND / CNN_INT8) e misura:
+#  - preprocessing per immagine (decodifica + resize, normalizzazione);
+#  - inferenza per batch da 1, 4, 8, 16, 32 immagini: p50/p95/p99 e immagini/s.
+#
+#   python -m ai.benchmark --images <cartella> --threads 0:0,1:1,4:1 --out bench_onnx.json
+#   CNN_BACKEND=onnx CNN_INT8=1 python -m ai.benchmark --images <cartella>
+#
+# Il JSON contiene runtime, macchina e configurazione: file di run diversi si confrontano direttamente.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+BATCH_SIZES = [1, 4, 8, 16, 32]
+THREAD_CONFIGS = "0:0,1:1,2:1,4:1"     # intra:inter, 0 = default del runtime
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _summary(seconds: list) -> dict:
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "meanMs": round(float(ms.mean()), 3),
+        "p50Ms": round(float(np.percentile(ms, 50)), 3),
+        "p95Ms": round(float(np.percentile(ms, 95)), 3),
+        "p99Ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def _load_images(folder: str, limit: int) -> list:
+    files = []
+    for root, _, names in sorted(os.walk(folder)):
+        files += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(IMAGE_EXT)]
+    if not files:
+        raise SystemExit(f"ERRORE: nessuna immagine in {folder}")
+    data = []
+    for path in files[:limit]:
+        with open(path, "rb") as f:
+            data.append(f.read())
+    return data
+
+
+def run_config(images: list, batch_sizes=BATCH_SIZES, iterations: int = 30, warmup: int = 3) -> dict:
+    """
+    Misure nel processo corrente (thread già fissati dalle variabili d'ambiente).
+    Le immagini sono già in memoria: il disco non entra nei tempi.
+    """
+    from ai.cnn_service import cnn_classifier, load_backend, normalize_into, BACKEND, USE_INT8
+
+    t0 = time.perf_counter()
+    model = load_backend(BACKEND, USE_INT8)
+    if model is None:
+        raise SystemExit(f"ERRORE: modello {BACKEND}{' int8' if USE_INT8 else ''} non trovato")
+    load_seconds = time.perf_counter() - t0
+
+    # Preprocessing: una misura per immagine
+    decode_t, norm_t, decoded = [], [], []
+    row = np.empty((*cnn_classifier.IMG_SIZE, 3), dtype=np.float32)
+    for data in images:
+        t = time.perf_counter()
+        img = cnn_classifier.decode_image(data)
+        decode_t.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        normalize_into(img, row)
+        norm_t.append(time.perf_counter() - t)
+        decoded.append(img)
+
+    preprocess = {"decode": _summary(decode_t), "normalize": _summary(norm_t)}
+    pre_per_image = float(np.mean(decode_t) + np.mean(norm_t))
+
+    batches = []
+    buffer = np.empty((max(batch_sizes), *cnn_classifier.IMG_SIZE, 3), dtype=np.float32)
+    for bs in batch_sizes:
+        batch = buffer[:bs]
+        for i in range(bs):
+            normalize_into(decoded[i % len(decoded)], batch[i])
+        # Le prime chiamate per una nuova shape includono tracing/allocazioni: fuori dalle misure
+        for _ in range(warmup):
+            model.predict_on_batch(batch)
+        lat = []
+        for _ in range(iterations):
+            t = time.perf_counter()
+            model.predict_on_batch(batch)
+            lat.append(time.perf_counter() - t)
+        mean = float(np.mean(lat))
+        batches.append({
+            "batchSize": bs,
+            **_summary(lat),
+            "msPerImage": round(mean / bs * 1000.0, 3),
+            "imagesPerSecond": round(bs / mean, 1),
+            # Con preprocessing sequenziale sullo stesso core (limite inferiore del throughput reale)
+            "endToEndImagesPerSecond": round(bs / (mean + pre_per_image * bs), 1),
+        })
+        print(f"   batch {bs:>2}: p50 {batches[-1]['p50Ms']:.1f} ms, p99 {batches[-1]['p99Ms']:.1f} ms, "
+              f"{batches[-1]['imagesPerSecond']:.1f} img/s", file=sys.stderr)
+
+    return {
+        "backend": BACKEND + ("-int8" if USE_INT8 else ""),
+        "threads": {
+            "intraOp": int(os.getenv("CNN_TF_INTRA_OP_THREADS", "0")),
+            "interOp": int(os.getenv("CNN_TF_INTER_OP_THREADS", "0")),
+        },
+        "loadSeconds": round(load_seconds, 2),
+        "images": len(images),
+        "iterations": iterations,
+        "preprocess": preprocess,
+        "batches": batches,
+    }
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Benchmark latenza/throughput del classificatore CNN")
+    cli.add_argument("--images", required=True, help="cartella di immagini di esempio")
+    cli.add_argument("--limit", type=int, default=64, help="immagini caricate in memoria")
+    cli.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    cli.add_argument("--threads", default=THREAD_CONFIGS, help="configurazioni intra:inter separate da virgola")
+    cli.add_argument("--iterations", type=int, default=30, help="misure per batch size")
+    cli.add_argument("--out", default=None, help="file JSON dei risultati")
+    cli.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = cli.parse_args()
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    if args.worker:
+        # Processo figlio: una sola configurazione, risultato su stdout
+        result = run_config(_load_images(args.images, args.limit), batch_sizes, args.iterations)
+        print(json.dumps(result))
+        return
+
+    runs = []
+    for cfg in args.threads.split(","):
+        intra, inter = (cfg.split(":") + ["0"])[:2]
+        print(f"▶ Thread intra-op {intra or 'default'}, inter-op {inter or 'default'}", file=sys.stderr)
+        env = {**os.environ, "CNN_TF_INTRA_OP_THREADS": intra or "0", "CNN_TF_INTER_OP_THREADS": inter or "0"}
+        cmd = [sys.executable, "-m", "ai.benchmark", "--worker", "--images", args.images, "--limit", str(args.limit),
+               "--batch-sizes", args.batch_sizes, "--iterations", str(args.iterations)]
+        proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if proc.returncode != 0:
+            print(f"❌ Configurazione {cfg} fallita", file=sys.stderr)
+            continue
+        runs.append(json.loads(proc.stdout.decode("utf-8").strip().splitlines()[-1]))
+
+    report = {
+        "createdAt": datetime.utcnow().isoformat(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpuCount": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "imagesDir": os.path.abspath(args.images),
+        "runs": runs,
+    }
+    # Migliore configurazione per throughput, a colpo d'occhio
+    if runs:
+        best = max(((r, b) for r in runs for b in r["batches"]), key=lambda rb: rb[1]["imagesPerSecond"])
+        report["best"] = {"threads": best[0]["threads"], "batchSize": best[1]["batchSize"],
+                          "imagesPerSecond": best[1]["imagesPerSecond"]}
+
+    out = args.out or f"benchmark_{runs[0]['backend'] if runs else 'cnn'}_{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Risultati salvati in: {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,233 @@
 import logging
+import threading
+import queue
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
-from PIL import Image
-import tensorflow as tf
+from PIL import Image, ImageOps
+from datetime import datetime
 from io import BytesIO
 import os
 import json
+import time
+from typing import Union
+
+from ai.health_cache import health_cache, phash
 
 logger = logging.getLogger(__name__)
 
+# TensorFlow viene importato solo al caricamento del modello (diversi secondi per worker):
+# l'import di questo modulo resta leggero e /health risponde subito.
+tf = None
+
+
+def _import_tf():
+    global tf
+    if tf is None:
+        import tensorflow
+        # I thread di TF si configurano solo prima della prima operazione (0 = default di TF)
+        if TF_INTRA_OP_THREADS:
+            tensorflow.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+        if TF_INTER_OP_THREADS:
+            tensorflow.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+        tf = tensorflow
+    return tf
+
+
+class ModelNotReadyError(Exception):
+    """Il classificatore sta ancora caricando il modello (le route rispondono 503)."""
+    pass
+
+
+class QueueFullError(Exception):
+    """Troppe analisi in attesa (le route rispondono 429)."""
+    pass
+
+
+# Config da ENV
+BATCH_MAX_SIZE = int(os.getenv("CNN_BATCH_MAX_SIZE", "8"))              # immagini per forward pass
+BATCH_MAX_WAIT_MS = float(os.getenv("CNN_BATCH_MAX_WAIT_MS", "10"))     # attesa max per riempire il batch
+MAX_PENDING = int(os.getenv("CNN_MAX_PENDING", "32"))                   # analisi in corso/in coda prima del 429
+PREPROCESS_WORKERS = int(os.getenv("CNN_PREPROCESS_WORKERS", "2"))      # thread dedicati a decodifica e resize
+TF_INTRA_OP_THREADS = int(os.getenv("CNN_TF_INTRA_OP_THREADS", "0"))    # thread per singola operazione TF
+TF_INTER_OP_THREADS = int(os.getenv("CNN_TF_INTER_OP_THREADS", "0"))    # operazioni TF in parallelo
+# Runtime di inferenza: keras (.h5), onnx (onnxruntime) o tflite; con CNN_INT8=1 la variante quantizzata
+BACKEND = os.getenv("CNN_BACKEND", "keras").lower()
+USE_INT8 = os.getenv("CNN_INT8", "0") == "1"
+
+# Suggerimento al client (header Retry-After) mentre il modello carica o la coda è piena
+RETRY_AFTER_SECONDS = 5
+
+# Stati del classificatore
+STATUS_IDLE = "idle"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_UNAVAILABLE = "unavailable"
+
+
+def normalize_into(images: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """uint8 0-255 -> float32 0-1 scritto direttamente in 'out' (nessun array intermedio)."""
+    return np.multiply(images, np.float32(1.0 / 255.0), out=out)
+
+
+def model_path(backend: str, int8: bool = False) -> str:
+    """Percorso del modello per runtime (gli artefatti ONNX/TFLite si generano con ai.export_model)."""
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    if backend == "keras":
+        return os.path.join(models_dir, "plant_disease_model.h5")
+    ext = {"onnx": "onnx", "tflite": "tflite"}[backend]
+    return os.path.join(models_dir, f"plant_disease_model{'.int8' if int8 else ''}.{ext}")
+
+
+class _OnnxBackend:
+    """Modello esportato in ONNX, eseguito con onnxruntime (niente TensorFlow in memoria)."""
+
+    def __init__(self, path: str):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        if TF_INTRA_OP_THREADS:
+            opts.intra_op_num_threads = TF_INTRA_OP_THREADS
+        if TF_INTER_OP_THREADS:
+            opts.inter_op_num_threads = TF_INTER_OP_THREADS
+        self._session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input = self._session.get_inputs()[0].name
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input: batch.astype(np.float32, copy=False)})[0]
+
+
+class _TFLiteBackend:
+    """Modello TFLite (anche int8): usa tflite_runtime se installato, altrimenti l'interprete di TF."""
+
+    def __init__(self, path: str):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = _import_tf().lite.Interpreter
+        self._interp = Interpreter(model_path=path, num_threads=TF_INTRA_OP_THREADS or None)
+        self._interp.allocate_tensors()
+        self._in = self._interp.get_input_details()[0]
+        self._out = self._interp.get_output_details()[0]
+        self._batch = 1
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        # L'interprete ha shape fisse: si ridimensiona solo quando cambia la dimensione del batch
+        if len(batch) != self._batch:
+            self._interp.resize_tensor_input(self._in["index"], [len(batch), *batch.shape[1:]])
+            self._interp.allocate_tensors()
+            self._in = self._interp.get_input_details()[0]
+            self._out = self._interp.get_output_details()[0]
+            self._batch = len(batch)
+
+        # Modelli con input/output interi: (de)quantizzazione con scala e zero point del tensore
+        x = batch
+        if self._in["dtype"] != np.float32:
+            scale, zero = self._in["quantization"]
+            # Fuori dal range calibrato si satura: un cast diretto farebbe il wrap-around (128 -> -128)
+            limits = np.iinfo(self._in["dtype"])
+            x = np.clip(np.round(batch / scale + zero), limits.min, limits.max).astype(self._in["dtype"])
+        self._interp.set_tensor(self._in["index"], x)
+        self._interp.invoke()
+        y = self._interp.get_tensor(self._out["index"])
+        if self._out["dtype"] != np.float32:
+            scale, zero = self._out["quantization"]
+            y = (y.astype(np.float32) - zero) * scale
+        return y
+
+
+def load_backend(backend: str = BACKEND, int8: bool = USE_INT8):
+    """Carica il modello con il runtime scelto; tutti espongono predict_on_batch(batch)."""
+    path = model_path(backend, int8)
+    if not os.path.exists(path):
+        return None
+    if backend == "onnx":
+        return _OnnxBackend(path)
+    if backend == "tflite":
+        return _TFLiteBackend(path)
+    return _import_tf().keras.models.load_model(path)
+
+
+class _MicroBatcher:
+    """
+    Coda di inferenza in-process: un thread raccoglie le richieste concorrenti fino a
+    BATCH_MAX_SIZE immagini o BATCH_MAX_WAIT_MS millisecondi dalla prima, esegue un solo
+    forward pass e risolve il Future di ciascun chiamante con la sua riga di probabilità.
+    Con una sola richiesta in coda l'attesa massima è BATCH_MAX_WAIT_MS.
+    Le immagini arrivano come uint8 e vengono normalizzate in un buffer float32 riusato
+    a ogni batch (nessuna allocazione da 600KB per immagine).
+    """
+
+    def __init__(self, predict_fn, max_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self._predict = predict_fn
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._buffer = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Distribuzione delle dimensioni dei batch: {dimensione: numero di batch}
+        self.histogram = {}
+        self.batches = 0
+        self.images = 0
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Accoda un'immagine decodificata (224x224x3 uint8); il Future riceve le probabilità."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="cnn-batcher", daemon=True)
+                    self._thread.start()
+        fut: Future = Future()
+        self._queue.put((image, fut))
+        return fut
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch):
+        live = [(x, f) for x, f in batch if f.set_running_or_notify_cancel()]
+        if not live:
+            return
+        # Metriche prima di risolvere i Future: chi riceve il risultato le vede già aggiornate
+        n = len(live)
+        self.histogram[n] = self.histogram.get(n, 0) + 1
+        self.batches += 1
+        self.images += n
+        try:
+            if self._buffer is None or self._buffer.shape[1:] != live[0][0].shape:
+                self._buffer = np.empty((self.max_size, *live[0][0].shape), dtype=np.float32)
+            # Il buffer è di questo solo thread e il modello lo copia prima di ritornare: riuso sicuro
+            batch_buf = self._buffer[:len(live)]
+            for i, (x, _) in enumerate(live):
+                normalize_into(x, batch_buf[i])
+            preds = self._predict(batch_buf)
+            for (_, f), p in zip(live, preds):
+                f.set_result(p)
+        except Exception as e:
+            for _, f in live:
+                f.set_exception(e)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "images": self.images,
+            "avgBatchSize": round(self.images / self.batches, 2) if self.batches else None,
+            "batchSizeHistogram": {str(k): v for k, v in sorted(self.histogram.items())},
+            "queued": self._queue.qsize(),
+            "config": {"maxBatchSize": self.max_size, "maxWaitMs": self.max_wait * 1000.0},
+        }
+
+
 class PlantClassifierCNN:
     _instance = None
     _model = None
@@ -23,84 +243,268 @@ class PlantClassifierCNN:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(PlantClassifierCNN, cls).__new__(cls)
-            cls._instance._load_resources()
+            cls._instance.status = STATUS_IDLE
+            cls._instance.load_seconds = None
+            cls._instance._lock = threading.Lock()
+            cls._instance._done = threading.Event()
+            cls._instance._batcher = _MicroBatcher(cls._instance._predict_batch)
+            # Decodifica e inferenza non girano mai sull'event loop: pool dedicato + thread del batcher
+            cls._instance._pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="cnn-pre")
+            cls._instance.pending = 0
+            cls._instance.rejected = 0
         return cls._instance
 
+    @property
+    def is_ready(self) -> bool:
+        return self.status == STATUS_READY
+
+    def start_warmup(self) -> threading.Thread:
+        """
+        Avvia (una volta sola) import di TF, caricamento del modello e inferenza di prova
+        in un thread in background. Chiamato allo startup e, in mancanza, alla prima richiesta.
+        """
+        with self._lock:
+            if self.status != STATUS_IDLE:
+                return None
+            self.status = STATUS_LOADING
+        t = threading.Thread(target=self._load_resources, name="cnn-warmup", daemon=True)
+        t.start()
+        return t
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Attende la fine del caricamento (per script e job offline); True se il modello è pronto."""
+        self.start_warmup()
+        self._done.wait(timeout)
+        return self.is_ready
+
     def _load_resources(self):
-        if self._model is None:
-            try:
-                if os.path.exists(self.CLASSES_PATH):
-                    with open(self.CLASSES_PATH, 'r') as f:
-                        self._classes = {int(k): v for k, v in json.load(f).items()}
-                
-                if os.path.exists(self.MODEL_PATH):
-                    self._model = tf.keras.models.load_model(self.MODEL_PATH)
-                    logger.info(f"Modello caricato ({len(self._classes)} classi).")
-                else:
-                    logger.warning("Modello non trovato.")
-            except Exception as e:
-                logger.error(f"Errore caricamento IA: {e}")
+        t0 = time.perf_counter()
+        try:
+            if os.path.exists(self.CLASSES_PATH):
+                with open(self.CLASSES_PATH, 'r') as f:
+                    self._classes = {int(k): v for k, v in json.load(f).items()}
 
-    def preprocess_image(self, image_bytes: bytes) -> np.ndarray:
+            model = load_backend(BACKEND, USE_INT8)
+            if model is not None:
+                # Inferenza di prova: la prima predict costruisce il grafo, meglio non farla pagare a un utente
+                model.predict_on_batch(np.zeros((1, *self.IMG_SIZE, 3), dtype=np.float32))
+                self._model = model
+                self.status = STATUS_READY
+                self.load_seconds = round(time.perf_counter() - t0, 2)
+                logger.info(f"Modello {BACKEND}{' int8' if USE_INT8 else ''} caricato "
+                            f"({len(self._classes)} classi) in {self.load_seconds}s.")
+            else:
+                self.status = STATUS_UNAVAILABLE
+                logger.warning(f"Modello non trovato: {model_path(BACKEND, USE_INT8)}")
+        except Exception as e:
+            self.status = STATUS_UNAVAILABLE
+            logger.error(f"Errore caricamento IA: {e}")
+        finally:
+            self._done.set()
+
+    def decode_image(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Decodifica + resize a 224x224, ritorna uint8 (H, W, 3).
+        Per i JPEG draft() fa scalare già al decoder DCT (1/2, 1/4, 1/8) verso la dimensione
+        finale: una foto da 12MP viene decodificata a ~1/8 dei pixel invece che per intero.
+        """
         img = Image.open(BytesIO(image_bytes))
+        img.draft('RGB', self.IMG_SIZE)
+        return self.prepare_image(ImageOps.exif_transpose(img))
+
+    def prepare_image(self, img: Image.Image) -> np.ndarray:
+        """
+        Input del modello da un'immagine PIL già decodificata e orientata (EXIF), ad esempio
+        quella di utils.images.ingest_image. Riduce prima di un fattore 2/4/8 come fa draft()
+        per i JPEG, poi resize a 224x224: le due route danno al modello (quasi) lo stesso input,
+        e la cache per hash percettivo le riconosce come la stessa foto.
+        """
         if img.mode != 'RGB': img = img.convert('RGB')
+        factor = 1
+        while factor < 8 and img.width // (factor * 2) >= self.IMG_SIZE[0] and img.height // (factor * 2) >= self.IMG_SIZE[1]:
+            factor *= 2
+        if factor > 1:
+            img = img.reduce(factor)
         img = img.resize(self.IMG_SIZE)
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array / 255.0
+        return np.asarray(img, dtype=np.uint8)
+
+    def preprocess_image(self, image_bytes: bytes) -> np.ndarray:
+        """Batch da una immagine (1, H, W, 3) float32 0-1, per export e script offline."""
+        out = np.empty((1, *self.IMG_SIZE, 3), dtype=np.float32)
+        normalize_into(self.decode_image(image_bytes), out[0])
+        return out
+
+    def _predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        # predict_on_batch evita l'overhead di predict() (data adapter, callback) su batch piccoli
+        return np.asarray(self._model.predict_on_batch(batch))
+
+    def _check_ready(self) -> bool:
+        """Solleva ModelNotReadyError durante il caricamento; False se il modello non esiste."""
+        if self.status in (STATUS_IDLE, STATUS_LOADING):
+            self.start_warmup()
+            raise ModelNotReadyError("Modello di analisi in caricamento, riprova tra qualche secondo.")
+        return self._model is not None
+
+    def _acquire_slot(self):
+        """Backpressure: oltre MAX_PENDING analisi contemporanee si rifiuta subito invece di accodare."""
+        with self._lock:
+            if self.pending >= MAX_PENDING:
+                self.rejected += 1
+                raise QueueFullError("Troppe analisi in corso, riprova tra qualche secondo.")
+            self.pending += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self.pending -= 1
+
+    def get_stats(self):
+        """Stato del modello, coda e distribuzione delle dimensioni dei batch di inferenza."""
+        return {
+            "status": self.status,
+            "backend": BACKEND + ("-int8" if USE_INT8 else ""),
+            "loadSeconds": self.load_seconds,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "batching": self._batcher.stats(),
+            "resultCache": health_cache.stats(),
+            "config": {
+                "maxPending": MAX_PENDING,
+                "preprocessWorkers": PREPROCESS_WORKERS,
+                "tfIntraOpThreads": TF_INTRA_OP_THREADS,
+                "tfInterOpThreads": TF_INTER_OP_THREADS,
+            },
+        }
+
+    def _decode_and_hash(self, source):
+        # bytes dall'API, oppure immagine PIL già decodificata da utils.images.ingest_image
+        image = self.prepare_image(source) if isinstance(source, Image.Image) else self.decode_image(source)
+        return image, (phash(image) if health_cache.enabled else None)
+
+    @staticmethod
+    def _cached_result(h, plant_context: str):
+        """Risultato di un'immagine (quasi) identica già analizzata con lo stesso filtro, se c'è."""
+        if h is None:
+            return None
+        hit = health_cache.lookup(h, plant_context)
+        if hit is None:
+            return None
+        entry, distance = hit
+        logger.info(f"♻️ Analisi da cache (distanza {distance}, origine {entry['origin']})")
+        return {
+            **entry["result"],
+            "source": "cache",
+            "cache": {
+                "distance": distance,
+                "origin": entry["origin"],
+                "cachedAt": datetime.utcfromtimestamp(entry["cachedAt"]).isoformat(),
+            },
+        }
+
+    def _model_result(self, predictions: np.ndarray, h, plant_context: str, origin: str):
+        result = self._interpret(predictions, plant_context)
+        if h is not None:
+            health_cache.store(h, plant_context, result, origin)
+        return {**result, "source": "model"}
 
-    def predict_health(self, image_bytes: bytes, plant_context: str = None):
+    def predict_health(self, image_bytes: Union[bytes, Image.Image], plant_context: str = None, origin: str = "analyze-health"):
         """
         Analizza l'immagine. 
         Se 'plant_context' è fornito (es. 'tomato'), filtra i risultati per considerare SOLO quella specie.
+        L'inferenza passa dalla coda di micro-batching: la chiamata blocca fino al risultato.
+        Le foto ricaricate (hash percettivo vicino, stesso filtro) escono dalla cache senza inferenza;
+        'origin' indica la route, per sapere da dove provengono i risultati riusati.
+        'image_bytes' può essere anche un'immagine PIL già decodificata: niente seconda decodifica.
         """
-        if self._model is None:
+        if not self._check_ready():
             return {"label": "Errore", "confidence": 0.0, "advice": "Modello non disponibile."}
 
+        self._acquire_slot()
         try:
-            processed = self.preprocess_image(image_bytes)
-            predictions = self._model.predict(processed)[0] # Array di probabilità
-            
-            #LOGICA DI FILTRO (MASKING)
-            if plant_context and plant_context.lower() != "generic":
-                # Cerchiamo quali indici corrispondono alla pianta selezionata (es. "tomato")
-                target = plant_context.lower()
-                
-                # Mappatura manuale se i nomi non coincidono perfettamente (opzionale)
-                if "pomodoro" in target: target = "tomato"
-                if "patata" in target: target = "potato"
-                if "peperone" in target or "pepper" in target: target = "pepper"
-                if "pesca" in target: target = "peach"
-                if "uva" in target or "vite" in target: target = "grape"
-
-                # Crea una maschera: metti a -1 (o 0) tutte le probabilità delle piante diverse
-                filtered_preds = np.copy(predictions)
-                
-                for idx, label_name in self._classes.items():
-                    if target not in label_name.lower():
-                        filtered_preds[idx] = -1.0 
-
-                
-                if np.max(filtered_preds) > -0.5:
-                    predictions = filtered_preds
-                    logger.info(f"🔍 Filtro IA applicato per: {target}")
-
-            # Trova la classe vincente (tra quelle rimaste)
-            idx = np.argmax(predictions)
-            confidence = float(predictions[idx])
-            raw_label = self._classes.get(idx, "Sconosciuto")
-            advice = self._get_advice(raw_label)
-            clean_label = raw_label.replace("___", " - ").replace("_", " ")
-
-            return {
-                "label": clean_label,
-                "confidence": confidence,
-                "advice": advice
-            }
-            
+            image, h = self._decode_and_hash(image_bytes)
+            cached = self._cached_result(h, plant_context)
+            if cached:
+                return cached
+            predictions = self._batcher.submit(image).result()
+            return self._model_result(predictions, h, plant_context, origin)
+        except Exception as e:
+            logger.error(f"Errore predizione: {e}")
+            raise e
+        finally:
+            self._release_slot()
+
+    async def predict_health_async(self, image_bytes: bytes, plant_context: str = None, origin: str = "analyze-health"):
+        """Come predict_health, senza bloccare l'event loop: le richieste concorrenti finiscono nello stesso batch."""
+        if not self._check_ready():
+            return {"label": "Errore", "confidence": 0.0, "advice": "Modello non disponibile."}
+
+        self._acquire_slot()
+        try:
+            loop = asyncio.get_running_loop()
+            image, h = await loop.run_in_executor(self._pool, self._decode_and_hash, image_bytes)
+            cached = self._cached_result(h, plant_context)
+            if cached:
+                return cached
+            predictions = await asyncio.wrap_future(self._batcher.submit(image))
+            return self._model_result(predictions, h, plant_context, origin)
         except Exception as e:
             logger.error(f"Errore predizione: {e}")
             raise e
+        finally:
+            self._release_slot()
+
+    def classify_batch(self, images: list, plant_contexts: list, out: np.ndarray = None) -> list:
+        """
+        Per i job offline: N immagini decodificate (uint8) in un solo forward pass, senza coda
+        né cache. 'out' è un buffer float32 (>= N, H, W, 3) riusabile tra una chiamata e l'altra.
+        """
+        if not self.wait_ready():
+            raise ModelNotReadyError("Modello non disponibile.")
+        if out is None or len(out) < len(images):
+            out = np.empty((len(images), *self.IMG_SIZE, 3), dtype=np.float32)
+        batch = out[:len(images)]
+        for i, image in enumerate(images):
+            normalize_into(image, batch[i])
+        predictions = self._predict_batch(batch)
+        return [self._interpret(p, ctx) for p, ctx in zip(predictions, plant_contexts)]
+
+    def _interpret(self, predictions: np.ndarray, plant_context: str = None):
+        """Dalle probabilità (array per classe) a etichetta, confidenza e consiglio."""
+        #LOGICA DI FILTRO (MASKING)
+        if plant_context and plant_context.lower() != "generic":
+            # Cerchiamo quali indici corrispondono alla pianta selezionata (es. "tomato")
+            target = plant_context.lower()
+            
+            # Mappatura manuale se i nomi non coincidono perfettamente (opzionale)
+            if "pomodoro" in target: target = "tomato"
+            if "patata" in target: target = "potato"
+            if "peperone" in target or "pepper" in target: target = "pepper"
+            if "pesca" in target: target = "peach"
+            if "uva" in target or "vite" in target: target = "grape"
+
+            # Crea una maschera: metti a -1 (o 0) tutte le probabilità delle piante diverse
+            filtered_preds = np.copy(predictions)
+            
+            for idx, label_name in self._classes.items():
+                if target not in label_name.lower():
+                    filtered_preds[idx] = -1.0 
+
+            
+            if np.max(filtered_preds) > -0.5:
+                predictions = filtered_preds
+                logger.info(f"🔍 Filtro IA applicato per: {target}")
+
+        # Trova la classe vincente (tra quelle rimaste)
+        idx = np.argmax(predictions)
+        confidence = float(predictions[idx])
+        raw_label = self._classes.get(idx, "Sconosciuto")
+        advice = self._get_advice(raw_label)
+        clean_label = raw_label.replace("___", " - ").replace("_", " ")
+
+        return {
+            "label": clean_label,
+            "confidence": confidence,
+            "advice": advice
+        }
 
     def _get_advice(self, raw_label):
         """Traduce le etichette in consigli."""
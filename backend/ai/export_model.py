@@ -0,0 +1,255 @@
+#COSA FA: converte plant_disease_model.h5 in ONNX e/o TFLite (anche quantizzati int8) per l'inferenza su CPU,
+#e verifica che il modello convertito dia la stessa classe del Keras originale su una cartella di validazione.
+#
+#   python -m ai.export_model onnx                              → models/plant_disease_model.onnx
+#   python -m ai.export_model tflite --int8 --calib <cartella>  → models/plant_disease_model.int8.tflite
+#   python -m ai.export_model parity --val <cartella> --backend onnx [--int8]
+#   python -m ai.export_model preprocess --val <cartella>       → stessa classe da upload e da /analyze-health?
+#
+# Poi nel .env: CNN_BACKEND=onnx (o tflite) e CNN_INT8=1 per la variante quantizzata.
+# Dipendenze solo per l'export: tensorflow, tf2onnx, onnxruntime.
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from PIL import Image
+from io import BytesIO
+
+from ai.cnn_service import cnn_classifier, model_path, load_backend, normalize_into, BACKEND, USE_INT8, _import_tf
+from utils.images import decode_upload
+
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".webp")
+CALIB_SAMPLES = 200
+
+
+def _iter_images(folder: str, limit: int = None):
+    """(percorso, nome della sottocartella) per ogni immagine, in ordine stabile."""
+    n = 0
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXT):
+                yield os.path.join(root, name), os.path.basename(root)
+                n += 1
+                if limit and n >= limit:
+                    return
+
+
+def _load(path: str) -> np.ndarray:
+    # Stessa preprocessing del servizio: la calibrazione deve vedere gli input reali
+    with open(path, "rb") as f:
+        return cnn_classifier.preprocess_image(f.read())
+
+
+def _calibration_batches(folder: str, limit: int = CALIB_SAMPLES):
+    if not folder or not os.path.isdir(folder):
+        raise SystemExit(f"ERRORE: cartella di calibrazione non trovata: {folder}")
+    for path, _ in _iter_images(folder, limit):
+        yield _load(path)
+
+
+def export_tflite(int8: bool = False, calib_dir: str = None) -> str:
+    """
+    Converte in TFLite. Con int8 e una cartella di calibrazione: quantizzazione intera
+    (pesi e attivazioni); senza calibrazione: solo pesi int8 (dynamic range).
+    Input e output restano float32, come per il modello Keras.
+    """
+    tf = _import_tf()
+    model = tf.keras.models.load_model(model_path("keras"))
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if int8:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if calib_dir:
+            converter.representative_dataset = lambda: ([x] for x in _calibration_batches(calib_dir))
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        else:
+            print("⚠️ Nessuna cartella di calibrazione: quantizzo solo i pesi (dynamic range).")
+
+    out = model_path("tflite", int8)
+    with open(out, "wb") as f:
+        f.write(converter.convert())
+    print(f"✅ TFLite salvato in: {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+    return out
+
+
+class _CalibrationReader:
+    """CalibrationDataReader di onnxruntime sulle immagini della cartella di calibrazione."""
+
+    def __init__(self, folder: str, input_name: str):
+        self._it = iter(_calibration_batches(folder))
+        self._input = input_name
+
+    def get_next(self):
+        x = next(self._it, None)
+        return None if x is None else {self._input: x}
+
+
+def export_onnx(int8: bool = False, calib_dir: str = None, opset: int = 13) -> str:
+    """
+    Converte in ONNX con tf2onnx. Con int8: quantizzazione statica (QDQ) se c'è
+    una cartella di calibrazione, altrimenti dinamica sui soli pesi.
+    """
+    import tf2onnx
+
+    tf = _import_tf()
+    model = tf.keras.models.load_model(model_path("keras"))
+    spec = (tf.TensorSpec((None, *cnn_classifier.IMG_SIZE, 3), tf.float32, name="input"),)
+    fp32 = model_path("onnx")
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=fp32)
+    print(f"✅ ONNX salvato in: {fp32} ({os.path.getsize(fp32) / 1e6:.1f} MB)")
+    if not int8:
+        return fp32
+
+    from onnxruntime.quantization import quantize_static, quantize_dynamic, QuantType, QuantFormat
+
+    out = model_path("onnx", int8=True)
+    if calib_dir:
+        quantize_static(fp32, out, _CalibrationReader(calib_dir, "input"),
+                        quant_format=QuantFormat.QDQ, weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    else:
+        print("⚠️ Nessuna cartella di calibrazione: quantizzazione dinamica dei soli pesi.")
+        quantize_dynamic(fp32, out, weight_type=QuantType.QInt8)
+    print(f"✅ ONNX int8 salvato in: {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+    return out
+
+
+def parity_check(val_dir: str, backend: str, int8: bool = False, limit: int = None) -> dict:
+    """
+    Confronta la classe top-1 del modello convertito con quella del Keras originale
+    su ogni immagine della cartella (sottocartelle = classi, come il dataset di training).
+    """
+    if not os.path.isdir(val_dir):
+        raise SystemExit(f"ERRORE: cartella di validazione non trovata: {val_dir}")
+    reference = load_backend("keras")
+    candidate = load_backend(backend, int8)
+    if reference is None or candidate is None:
+        raise SystemExit("ERRORE: modello Keras o modello convertito mancante, eseguire prima l'export.")
+
+    with open(cnn_classifier.CLASSES_PATH, "r") as f:
+        classes = {int(k): v for k, v in json.load(f).items()}
+
+    total = agree = ref_ok = cand_ok = labelled = 0
+    max_diff = 0.0
+    t_ref = t_cand = 0.0
+    mismatches = []
+    for path, folder in _iter_images(val_dir, limit):
+        x = _load(path)
+        t0 = time.perf_counter()
+        p_ref = np.asarray(reference.predict_on_batch(x))[0]
+        t1 = time.perf_counter()
+        p_cand = np.asarray(candidate.predict_on_batch(x))[0]
+        t2 = time.perf_counter()
+        t_ref, t_cand = t_ref + (t1 - t0), t_cand + (t2 - t1)
+
+        i_ref, i_cand = int(np.argmax(p_ref)), int(np.argmax(p_cand))
+        total += 1
+        agree += i_ref == i_cand
+        max_diff = max(max_diff, float(np.max(np.abs(p_ref - p_cand))))
+        if i_ref != i_cand and len(mismatches) < 20:
+            mismatches.append({"image": path, "keras": classes.get(i_ref), backend: classes.get(i_cand)})
+        if folder in classes.values():
+            labelled += 1
+            ref_ok += classes.get(i_ref) == folder
+            cand_ok += classes.get(i_cand) == folder
+
+    if not total:
+        raise SystemExit(f"ERRORE: nessuna immagine in {val_dir}")
+    report = {
+        "backend": backend + ("-int8" if int8 else ""),
+        "images": total,
+        "top1Agreement": round(agree / total, 4),
+        "maxProbDiff": round(max_diff, 4),
+        "accuracyKeras": round(ref_ok / labelled, 4) if labelled else None,
+        "accuracyCandidate": round(cand_ok / labelled, 4) if labelled else None,
+        "msPerImageKeras": round(t_ref / total * 1000, 2),
+        "msPerImageCandidate": round(t_cand / total * 1000, 2),
+        "mismatches": mismatches,
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def _legacy_input(data: bytes) -> np.ndarray:
+    # Input di /analyze-health prima dell'orientamento EXIF: solo draft + resize
+    img = Image.open(BytesIO(data))
+    img.draft('RGB', cnn_classifier.IMG_SIZE)
+    return np.asarray(img.convert('RGB').resize(cnn_classifier.IMG_SIZE), dtype=np.uint8)
+
+
+def preprocess_parity(val_dir: str, limit: int = None) -> dict:
+    """
+    Classe top-1 del modello attivo (CNN_BACKEND) con i due ingressi del servizio:
+    - upload (/api/piante/{id}/image): decode_upload → prepare_image;
+    - /analyze-health: decode_image sui byte.
+    Confronta anche con l'input precedente (senza orientamento EXIF), separando le foto ruotate.
+    """
+    if not os.path.isdir(val_dir):
+        raise SystemExit(f"ERRORE: cartella di validazione non trovata: {val_dir}")
+    model = load_backend(BACKEND, USE_INT8)
+    if model is None:
+        raise SystemExit("ERRORE: modello mancante.")
+
+    batch = np.empty((3, *cnn_classifier.IMG_SIZE, 3), dtype=np.float32)
+    total = routes = rotated = prev_same = prev_same_upright = 0
+    max_px = 0.0
+    for path, _ in _iter_images(val_dir, limit):
+        with open(path, "rb") as f:
+            data = f.read()
+        img, _ = decode_upload(data)
+        upload, analyze, legacy = cnn_classifier.prepare_image(img), cnn_classifier.decode_image(data), _legacy_input(data)
+        for i, x in enumerate((upload, analyze, legacy)):
+            normalize_into(x, batch[i])
+        top = np.argmax(np.asarray(model.predict_on_batch(batch)), axis=1)
+
+        is_rotated = Image.open(BytesIO(data)).getexif().get(0x0112, 1) not in (1, None)
+        total += 1
+        rotated += is_rotated
+        routes += top[0] == top[1]
+        prev_same += top[1] == top[2]
+        prev_same_upright += (top[1] == top[2]) and not is_rotated
+        max_px = max(max_px, float(np.mean(np.abs(upload.astype(np.int16) - analyze.astype(np.int16)))))
+
+    if not total:
+        raise SystemExit(f"ERRORE: nessuna immagine in {val_dir}")
+    upright = total - rotated
+    report = {
+        "backend": BACKEND + ("-int8" if USE_INT8 else ""),
+        "images": total,
+        "rotatedImages": rotated,
+        "top1Agreement": round(routes / total, 4),
+        "maxMeanPixelDiff": round(max_px, 3),
+        "vsPreviousInput": round(prev_same / total, 4),
+        "vsPreviousInputUpright": round(prev_same_upright / upright, 4) if upright else None,
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Export e verifica del modello CNN per runtime CPU")
+    cli.add_argument("command", choices=["onnx", "tflite", "parity", "preprocess"])
+    cli.add_argument("--int8", action="store_true", help="quantizzazione int8")
+    cli.add_argument("--calib", default=None, help="cartella di immagini per la calibrazione int8")
+    cli.add_argument("--val", default=None, help="cartella di validazione (parity, preprocess)")
+    cli.add_argument("--backend", choices=["onnx", "tflite"], default="onnx", help="runtime da verificare (parity)")
+    cli.add_argument("--limit", type=int, default=None, help="numero massimo di immagini (parity)")
+    cli.add_argument("--min-agreement", type=float, default=0.99, help="soglia di accordo top-1 (parity)")
+    args = cli.parse_args()
+
+    if args.command == "onnx":
+        export_onnx(args.int8, args.calib)
+    elif args.command == "tflite":
+        export_tflite(args.int8, args.calib)
+    elif args.command == "preprocess":
+        result = preprocess_parity(args.val or "", args.limit)
+        if result["top1Agreement"] < args.min_agreement:
+            raise SystemExit(f"❌ Accordo top-1 tra le route {result['top1Agreement']} sotto la soglia {args.min_agreement}")
+        print("✅ Stessa classe da upload e da /analyze-health.")
+    else:
+        result = parity_check(args.val or "", args.backend, args.int8, args.limit)
+        if result["top1Agreement"] < args.min_agreement:
+            raise SystemExit(f"❌ Accordo top-1 {result['top1Agreement']} sotto la soglia {args.min_agreement}")
+        print("✅ Parità top-1 verificata.")
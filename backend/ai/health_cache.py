@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Config da ENV (TTL = 0 disabilita la cache)
+_CACHE_TTL_SECONDS = int(os.getenv("CNN_CACHE_TTL_SECONDS", "86400"))    # 24 ore
+_CACHE_MAX_ITEMS = int(os.getenv("CNN_CACHE_MAX_ITEMS", "2048"))         # immagini per worker
+_CACHE_MAX_DISTANCE = int(os.getenv("CNN_CACHE_MAX_DISTANCE", "4"))      # bit diversi su 64 per considerarle uguali
+
+_HASH_SIZE = 8      # 8x8 coefficienti DCT -> hash a 64 bit
+_DCT_SIZE = 32      # l'immagine viene ridotta a 32x32 in scala di grigi
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+_BITS = (1 << np.arange(_HASH_SIZE * _HASH_SIZE, dtype=np.uint64)).astype(np.uint64)
+
+
+def phash(image: np.ndarray) -> int:
+    """
+    Hash percettivo a 64 bit di un'immagine decodificata (H, W, 3) uint8: basse frequenze
+    della DCT confrontate con la mediana. Ricompressione, piccoli resize e variazioni
+    di luminosità cambiano pochi bit; foto diverse ne cambiano ~32.
+    """
+    gray = Image.fromarray(image).convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS)
+    coeffs = _DCT @ np.asarray(gray, dtype=np.float64) @ _DCT.T
+    low = coeffs[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    # Il coefficiente DC (luminosità media) non entra nella mediana
+    bits = low > np.median(low[1:])
+    return int(np.bitwise_or.reduce(_BITS[bits])) if bits.any() else 0
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class _ContextBucket:
+    """Hash e risultati di un singolo plant_context, in array per il confronto vettoriale."""
+
+    def __init__(self):
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.expires = np.zeros(0, dtype=np.float64)
+        self.values = []
+
+
+class HealthResultCache:
+    """
+    Cache dei risultati CNN per hash percettivo + plant_context. Una nuova immagine è un hit
+    se dista al più _CACHE_MAX_DISTANCE bit (Hamming) da una già analizzata con lo stesso filtro.
+    In memoria per worker: il lookup è un XOR + popcount su al più _CACHE_MAX_ITEMS hash.
+    """
+
+    def __init__(self, ttl: int = _CACHE_TTL_SECONDS, max_items: int = _CACHE_MAX_ITEMS,
+                 max_distance: int = _CACHE_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_distance = max_distance
+        self._buckets: Dict[str, _ContextBucket] = {}
+        self._lock = threading.Lock()
+        self._stats = {"exactHits": 0, "nearHits": 0, "misses": 0, "stores": 0}
+        # Hit per route che aveva prodotto il risultato in cache
+        self._hits_by_origin: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_items > 0
+
+    @staticmethod
+    def _context_key(plant_context: Optional[str]) -> str:
+        return (plant_context or "generic").strip().lower() or "generic"
+
+    def _size(self) -> int:
+        return sum(len(b.values) for b in self._buckets.values())
+
+    def lookup(self, h: int, plant_context: Optional[str]) -> Optional[Tuple[Dict[str, Any], int]]:
+        """(risultato, distanza) del più vicino entro soglia, oppure None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(self._context_key(plant_context))
+            if bucket is None or not bucket.values:
+                self._stats["misses"] += 1
+                return None
+            dist = _popcount(bucket.hashes ^ np.uint64(h))
+            dist[bucket.expires < time.time()] = _HASH_SIZE * _HASH_SIZE + 1   # scaduti: mai un hit
+            i = int(np.argmin(dist))
+            d = int(dist[i])
+            if d > self.max_distance:
+                self._stats["misses"] += 1
+                return None
+            value = bucket.values[i]
+            self._stats["exactHits" if d == 0 else "nearHits"] += 1
+            origin = value.get("origin") or "unknown"
+            self._hits_by_origin[origin] = self._hits_by_origin.get(origin, 0) + 1
+            return value, d
+
+    def store(self, h: int, plant_context: Optional[str], result: Dict[str, Any], origin: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        value = {"result": dict(result), "origin": origin, "cachedAt": now}
+        with self._lock:
+            bucket = self._buckets.setdefault(self._context_key(plant_context), _ContextBucket())
+            # Scaduti fuori; poi, se la cache è piena, si libera la voce più vecchia del contesto più grande
+            live = bucket.expires >= now
+            if not live.all():
+                bucket.hashes, bucket.expires = bucket.hashes[live], bucket.expires[live]
+                bucket.values = [v for v, keep in zip(bucket.values, live) if keep]
+            if self._size() >= self.max_items:
+                big = max(self._buckets.values(), key=lambda b: len(b.values))
+                big.hashes, big.expires, big.values = big.hashes[1:], big.expires[1:], big.values[1:]
+            bucket.hashes = np.append(bucket.hashes, np.uint64(h))
+            bucket.expires = np.append(bucket.expires, now + self.ttl)
+            bucket.values.append(value)
+            self._stats["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["exactHits"] + self._stats["nearHits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hitRate": round(hits / lookups, 3) if lookups else 0.0,
+            "hitsByOrigin": dict(self._hits_by_origin),
+            "items": self._size(),
+            "config": {"ttlSeconds": self.ttl, "maxItems": self.max_items, "maxDistance": self.max_distance},
+        }
+
+
+health_cache = HealthResultCache()
@@ -1,111 +1,233 @@
 #ATTENZIONE, COSA FA: Legge le immagini dal nostro Desktop, impara a riconoscerle e salva il "cervello" (.h5) dentro la cartella del tuo progetto backend.
+#
+#   python -m ai.train_health                      → training completo (augmentation, backbone congelato ricalcolato a ogni epoca)
+#   python -m ai.train_health --mode bottleneck    → calcola UNA volta le feature del backbone e addestra solo la testa (minuti, non ore)
+#
+# Le immagini passano da una pipeline tf.data: decodifica in parallelo, cache su disco dopo il primo passaggio, prefetch.
 
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
-from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, Input
+from tensorflow.keras.models import Model, Sequential
 from tensorflow.keras.optimizers import Adam
+import numpy as np
+import argparse
+import hashlib
 import os
 import json
 
 # --- 1. CONFIGURAZIONE PERCORSI ---
-DATASET_DIR = "/Users/maure/Desktop/PROGETTO MONGIELLO /PlantVillage"
+DATASET_DIR = os.getenv("PLANT_DATASET_DIR", "/Users/maure/Desktop/PROGETTO MONGIELLO /PlantVillage")
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 MODEL_NAME = "plant_disease_model.h5"
 CLASS_MAP_NAME = "disease_classes.json"
+# Cache della pipeline e feature del backbone (rigenerabili, fuori da git)
+CACHE_DIR = os.path.join(MODEL_DIR, "cache")
 
 IMG_SIZE = (224, 224)
 BATCH_SIZE = 32
-EPOCHS = 10  
-
-def train():
+EPOCHS = 10
+VALIDATION_SPLIT = 0.3
+SEED = 42
+IMAGE_EXT = (".jpg", ".jpeg", ".png")
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def list_dataset(dataset_dir):
+    """
+    File e indici di classe (cartelle in ordine alfabetico, come faceva flow_from_directory),
+    divisi in training/validation con un seed fisso: la divisione è la stessa a ogni run.
+    """
+    classes = sorted(d for d in os.listdir(dataset_dir) if os.path.isdir(os.path.join(dataset_dir, d)))
+    paths, labels = [], []
+    for idx, name in enumerate(classes):
+        folder = os.path.join(dataset_dir, name)
+        for f in sorted(os.listdir(folder)):
+            if f.lower().endswith(IMAGE_EXT):
+                paths.append(os.path.join(folder, f))
+                labels.append(idx)
+
+    order = np.random.default_rng(SEED).permutation(len(paths))
+    paths, labels = np.array(paths)[order], np.array(labels, dtype=np.int32)[order]
+    n_val = int(len(paths) * VALIDATION_SPLIT)
+    return classes, (paths[n_val:], labels[n_val:]), (paths[:n_val], labels[:n_val])
+
+
+def dataset_digest(paths, labels):
+    """Impronta di file + etichette: chiave delle cache su disco (cambia con dataset, split o classi)."""
+    h = hashlib.sha1("\n".join(paths).encode("utf-8"))
+    h.update(np.asarray(labels, dtype=np.int32).tobytes())
+    return h.hexdigest()
+
+
+def _decode(path, label):
+    # uint8 224x224: in cache occupa 1/4 di un float32, la normalizzazione si fa dopo
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    img = tf.image.resize(img, IMG_SIZE)
+    return tf.cast(tf.round(img), tf.uint8), label
+
+
+def _normalize(img, label):
+    # Stessa scala 0-1 usata dal servizio di inferenza (cnn_service.normalize_into)
+    return tf.cast(img, tf.float32) / 255.0, label
+
+
+# Augmentation equivalente a quella del vecchio ImageDataGenerator
+_AUGMENT = Sequential([
+    tf.keras.layers.RandomRotation(25 / 360),
+    tf.keras.layers.RandomTranslation(0.2, 0.2),
+    tf.keras.layers.RandomZoom(0.2),
+    tf.keras.layers.RandomFlip("horizontal"),
+])
+
+
+def make_dataset(paths, labels, num_classes, training, cache_name=None):
+    """
+    tf.data: decodifica parallela → cache (file in CACHE_DIR dopo la prima epoca) →
+    shuffle/augmentation solo in training → batch → prefetch mentre la GPU/CPU lavora.
+    Il file di cache porta l'impronta di immagini ed etichette: un dataset diverso non riusa quello vecchio.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(_decode, num_parallel_calls=AUTOTUNE)
+    if cache_name:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        ds = ds.cache(os.path.join(CACHE_DIR, f"{cache_name}_{dataset_digest(paths, labels)[:12]}.tfcache"))
+    if training:
+        ds = ds.shuffle(4096, seed=SEED, reshuffle_each_iteration=True)
+    ds = ds.batch(BATCH_SIZE).map(_normalize, num_parallel_calls=AUTOTUNE)
+    if training:
+        ds = ds.map(lambda x, y: (_AUGMENT(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda x, y: (x, tf.one_hot(y, num_classes)), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def build_head(num_classes):
+    """La "testa" personalizzata per le tue piante, sopra le feature (1280) di MobileNetV2."""
+    return Sequential([
+        Dense(128, activation='relu'),
+        Dropout(0.5),
+        Dense(num_classes, activation='softmax'),
+    ], name="head")
+
+
+def build_base():
+    # Scarica la struttura di una rete neurale potente ma leggera
+    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+    base_model.trainable = False # Congela la base per non distruggerla subito
+    return base_model
+
+
+def assemble(base_model, head):
+    """Modello finale: stessa interfaccia di sempre (immagine 224x224x3 → probabilità)."""
+    x = GlobalAveragePooling2D()(base_model.output)
+    return Model(inputs=base_model.input, outputs=head(x))
+
+
+def extract_features(base_model, paths, labels, name):
+    """
+    Passa ogni immagine UNA volta nel backbone congelato e salva le feature (N x 1280)
+    in un .npy memory-mapped. Se i file esistono già per le stesse immagini ed etichette, li riusa.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    feat_path = os.path.join(CACHE_DIR, f"{name}_features.npy")
+    label_path = os.path.join(CACHE_DIR, f"{name}_labels.npy")
+    meta_path = os.path.join(CACHE_DIR, f"{name}_features.json")
+    digest = dataset_digest(paths, labels)
+
+    if os.path.exists(meta_path) and os.path.exists(feat_path):
+        with open(meta_path) as f:
+            if json.load(f).get("digest") == digest:
+                print(f" Feature {name} già calcolate, le riuso ({len(paths)} immagini).")
+                return np.load(feat_path, mmap_mode="r"), np.load(label_path)
+
+    extractor = Model(base_model.input, GlobalAveragePooling2D()(base_model.output))
+    dim = extractor.output_shape[-1]
+    features = np.lib.format.open_memmap(feat_path, mode="w+", dtype=np.float32, shape=(len(paths), dim))
+
+    ds = (tf.data.Dataset.from_tensor_slices((paths, labels))
+          .map(_decode, num_parallel_calls=AUTOTUNE)
+          .batch(BATCH_SIZE)
+          .map(_normalize, num_parallel_calls=AUTOTUNE)
+          .prefetch(AUTOTUNE))
+
+    print(f" Calcolo feature {name}: {len(paths)} immagini (una volta sola)...")
+    i = 0
+    for x, _ in ds:
+        out = extractor.predict_on_batch(x)
+        features[i:i + len(out)] = out
+        i += len(out)
+    features.flush()
+    np.save(label_path, labels)
+    with open(meta_path, "w") as f:
+        json.dump({"digest": digest, "count": len(paths), "dim": dim}, f)
+    return np.load(feat_path, mmap_mode="r"), labels
+
+
+def train(mode="full", dataset_dir=DATASET_DIR, epochs=EPOCHS):
     # Verifica che il dataset esista
-    if not os.path.exists(DATASET_DIR):
+    if not os.path.exists(dataset_dir):
         print(f" ERRORE CRITICO: Il percorso del dataset non esiste!")
-        print(f"   Path cercato: {DATASET_DIR}")
+        print(f"   Path cercato: {dataset_dir}")
         return
 
     # Verifica che ci siano cartelle dentro
-    subdirs = [d for d in os.listdir(DATASET_DIR) if os.path.isdir(os.path.join(DATASET_DIR, d))]
+    subdirs = [d for d in os.listdir(dataset_dir) if os.path.isdir(os.path.join(dataset_dir, d))]
     if not subdirs:
         print(f"ERRORE: La cartella sembra vuota o non contiene le sottocartelle delle piante.")
         return
-    
-    print(f"Dataset trovato! Rilevate {len(subdirs)} classi.")
-    print(f"   Esempio classi: {subdirs[:3]}...")
-
-    # 2. Preparazione Dati (Data Augmentation)
-    print(" Preparazione generatori di immagini...")
-    train_datagen = ImageDataGenerator(
-        rescale=1./255,         # Normalizza i pixel (0-1)
-        rotation_range=25,      # Ruota leggermente le immagini
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True,
-        validation_split=0.3    # Usa il 20% delle foto per testare la precisione
-    )
-
-    # Caricamento Training Set
-    train_generator = train_datagen.flow_from_directory(
-        DATASET_DIR,
-        target_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
-        class_mode='categorical',
-        subset='training'
-    )
-
-    # Caricamento Validation Set
-    validation_generator = train_datagen.flow_from_directory(
-        DATASET_DIR,
-        target_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
-        class_mode='categorical',
-        subset='validation'
-    )
+
+    classes, (train_paths, train_labels), (val_paths, val_labels) = list_dataset(dataset_dir)
+    num_classes = len(classes)
+    print(f"Dataset trovato! Rilevate {num_classes} classi, {len(train_paths)} immagini di training e {len(val_paths)} di validazione.")
+    print(f"   Esempio classi: {classes[:3]}...")
 
     # 3. Salvataggio Mappa Classi
     # Questo serve al backend per sapere che "Indice 0" significa "Apple___Black_rot"
-    class_indices = train_generator.class_indices
-    idx_to_class = {v: k for k, v in class_indices.items()}
-    
     os.makedirs(MODEL_DIR, exist_ok=True)
     with open(os.path.join(MODEL_DIR, CLASS_MAP_NAME), 'w') as f:
-        json.dump(idx_to_class, f)
+        json.dump({i: name for i, name in enumerate(classes)}, f)
     print(f" Mappa classi salvata in: {CLASS_MAP_NAME}")
 
-    num_classes = len(class_indices)
-
     # 4. Creazione Modello (MobileNetV2)
-    # Scarica la struttura di una rete neurale potente ma leggera
-    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
-    base_model.trainable = False # Congela la base per non distruggerla subito
-
-    # Aggiunge la "testa" personalizzata per le tue piante
-    x = base_model.output
-    x = GlobalAveragePooling2D()(x)
-    x = Dense(128, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    predictions = Dense(num_classes, activation='softmax')(x)
-
-    model = Model(inputs=base_model.input, outputs=predictions)
-
-    # Compilazione
-    model.compile(optimizer=Adam(learning_rate=0.0001),
-                  loss='categorical_crossentropy',
-                  metrics=['accuracy'])
-
-    # 5. Avvio Addestramento
-    print("\n AVVIO TRAINING (Questo processo richiederà tempo)...")
-    model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // BATCH_SIZE,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // BATCH_SIZE,
-        epochs=EPOCHS
-    )
+    base_model = build_base()
+    head = build_head(num_classes)
+
+    if mode == "bottleneck":
+        # Il backbone è congelato: le sue uscite non cambiano tra un'epoca e l'altra, tanto vale calcolarle una volta.
+        # Niente augmentation in questa modalità (le feature sono fisse); per quella c'è --mode full.
+        x_train, y_train = extract_features(base_model, train_paths, train_labels, "train")
+        x_val, y_val = extract_features(base_model, val_paths, val_labels, "val")
+
+        inputs = Input(shape=(x_train.shape[1],))
+        head_model = Model(inputs, head(inputs))
+        head_model.compile(optimizer=Adam(learning_rate=0.0001),
+                           loss='sparse_categorical_crossentropy',
+                           metrics=['accuracy'])
+
+        print("\n AVVIO TRAINING della sola testa sulle feature salvate...")
+        head_model.fit(
+            x_train, y_train,
+            validation_data=(x_val, y_val),
+            batch_size=BATCH_SIZE,
+            epochs=epochs,
+            shuffle=True
+        )
+        model = assemble(base_model, head)
+    else:
+        train_ds = make_dataset(train_paths, train_labels, num_classes, training=True, cache_name="train")
+        val_ds = make_dataset(val_paths, val_labels, num_classes, training=False, cache_name="val")
+
+        model = assemble(base_model, head)
+
+        # Compilazione
+        model.compile(optimizer=Adam(learning_rate=0.0001),
+                      loss='categorical_crossentropy',
+                      metrics=['accuracy'])
+
+        # 5. Avvio Addestramento
+        print("\n AVVIO TRAINING (Questo processo richiederà tempo)...")
+        model.fit(train_ds, validation_data=val_ds, epochs=epochs)
 
     # 6. Salvataggio Finale
     save_path = os.path.join(MODEL_DIR, MODEL_NAME)
@@ -114,4 +236,10 @@ def train():
     print(" Ora puoi riavviare il backend per caricare il nuovo modello.")
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    cli = argparse.ArgumentParser(description="Training del classificatore malattie (MobileNetV2)")
+    cli.add_argument("--mode", choices=["full", "bottleneck"], default="full",
+                     help="full: augmentation e backbone a ogni epoca; bottleneck: feature calcolate una volta")
+    cli.add_argument("--dataset", default=DATASET_DIR, help="cartella con una sottocartella per classe")
+    cli.add_argument("--epochs", type=int, default=EPOCHS)
+    args = cli.parse_args()
+    train(args.mode, args.dataset, args.epochs)
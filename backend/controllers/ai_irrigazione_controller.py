@@ -8,7 +8,7 @@ from dateutil import parser
 # Database e Servizi
 from database import db
 from controllers.weather_controller import weatherController
-from utils.ai_explainer_service import explain_irrigation_async
+from utils.ai_explanation_worker import schedule_explanation, schedule_batch_explanation, STATUS_PENDING
 from utils.ai_anfis_service import anfisService
 
 # --- HELPER ---
@@ -96,169 +96,248 @@ def _check_recent_fertilization(plant_id_str: str, plant_oid=None) -> str:
 
 # --- CORE LOGIC ---
 
-async def compute_for_plant(plant: dict) -> Dict[str, Any]:
+def _error_result(e: Exception) -> Dict[str, Any]:
+    print(f"[CRITICAL ERROR] {e}")
+    return {"recommendation": "SKIP", "reason": f"Errore: {str(e)}", "liters": 0}
+
+async def _gather_plant_context(plant: dict) -> Dict[str, Any]:
+    """Passi 1-2: meteo reale e bilancio pioggia della pianta."""
+    # Recupero ID Robusto
+    raw_id = plant.get("_id") or plant.get("id")
+    if not raw_id: raise HTTPException(400, "ID Mancante")
+
+    plant_id_str = str(raw_id)
+    # Creiamo plant_oid da usare per le query al DB e il salvataggio
+    try: plant_oid = ObjectId(plant_id_str)
+    except: plant_oid = None
+
+    print(f"\n[AI IBRIDA] --- Analisi per: {plant.get('name')} ---")
+
+    # 1. METEO REALE
+    real_wx = {}
+    # Logica recupero meteo
+    db_lat = plant.get("geoLat")
+    db_lon = plant.get("geoLng")
+    db_city = plant.get("location") or plant.get("addressLocality")
+    try:
+        if db_lat and db_lon:
+            real_wx = await weatherController.get_weather_data(lat=db_lat, lon=db_lon)
+        elif db_city:
+            real_wx = await weatherController.get_weather_data(city=db_city)
+        else:
+            real_wx = await weatherController.get_weather_data()
+    except: pass
+
+    merged_wx = {
+        "temp": real_wx.get("temp", 20.0),
+        "humidity": real_wx.get("humidity", 50.0),
+        "et0": real_wx.get("et0", 2.5),
+        "solar_rad": real_wx.get("solar_rad", 400.0),
+        "wind": real_wx.get("wind", 10.0),
+        "rain_trend": real_wx.get("rain_trend", [])
+    }
+    final_wx = _get_weather_context_fallback(merged_wx)
+
+    # 2. PIOGGIA
+    past_rain_5days = 0.0
+    recent_rain_48h = 0.0
+    future_rain_5days = 0.0
+    rain_tomorrow = 0.0
+
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    yesterday_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    tomorrow_str = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    for day in final_wx.get("rain_trend", []):
+        d_str = day["date"]
+        r = float(day["rain"])
+        if d_str < today_str: past_rain_5days += r
+        elif d_str > today_str: future_rain_5days += r
+        if d_str == today_str or d_str == yesterday_str: recent_rain_48h += r
+        if d_str == tomorrow_str: rain_tomorrow = r
+
+    print(f"   [PIOGGIA] Ieri+Oggi: {recent_rain_48h:.1f}mm | Ultimi 5gg: {past_rain_5days:.1f}mm")
+
+    return {
+        "plant": plant,
+        "plant_id_str": plant_id_str,
+        "plant_oid": plant_oid,
+        "final_wx": final_wx,
+        "past_rain_5days": past_rain_5days,
+        "recent_rain_48h": recent_rain_48h,
+        "future_rain_5days": future_rain_5days,
+        "rain_tomorrow": rain_tomorrow,
+    }
+
+def _predict_liters(contexts: List[Dict[str, Any]]) -> List[float]:
+    """Passo 3: fabbisogno ANFIS per tutte le piante con una sola passata del modello."""
+    wxs = [ctx["final_wx"] for ctx in contexts]
     try:
-        # Recupero ID Robusto
-        raw_id = plant.get("_id") or plant.get("id")
-        if not raw_id: raise HTTPException(400, "ID Mancante")
+        predictions = anfisService.predict_many(
+            temps=[float(wx["temp"]) for wx in wxs],
+            hums=[float(wx["humidity"]) for wx in wxs],
+            rains=[float(ctx["rain_tomorrow"]) for ctx in contexts],
+            et0s=[float(wx["et0"]) for wx in wxs]
+        )
+        return [max(0.5, float(p)) for p in predictions]
+    except:
+        return [max(1.0, float(wx["et0"])) for wx in wxs]
+
+def _finalize_plant(ctx: Dict[str, Any], theoretical_liters: float, batch_jobs: list = None) -> Dict[str, Any]:
+    """Passi 4-9: controlli manuali, supervisore, salvataggio e spiegazione LLM."""
+    plant = ctx["plant"]
+    plant_id_str = ctx["plant_id_str"]
+    plant_oid = ctx["plant_oid"]
+    final_wx = ctx["final_wx"]
+    past_rain_5days = ctx["past_rain_5days"]
+    recent_rain_48h = ctx["recent_rain_48h"]
+    future_rain_5days = ctx["future_rain_5days"]
+    rain_tomorrow = ctx["rain_tomorrow"]
+    prof = plant.get("profile_data") or {"stageNorm": "Vegetativa", "plant_type": plant.get("species", "Generica")}
+
+    print(f"   [ANFIS] Fabbisogno Stimato: {theoretical_liters:.2f}L")
+
+    # 4. CONTROLLI MANUALI (ACQUA E CONCIME)
+    water_today = _calculate_manual_water_today(plant_id_str)
+    recent_fertilizer = _check_recent_fertilization(plant_id_str, plant_oid)
+    
+
+    # 5. SUPERVISORE (REGOLE DI BLOCCO ACQUA)
+    target = theoretical_liters
+    recommendation = "IRRIGARE"
+    reason = f"Modello ANFIS suggerisce {theoretical_liters:.2f}L."
+
+    if water_today >= target:
+        recommendation = "SKIP"
+        reason = f"Fabbisogno ({theoretical_liters:.2f}L) coperto dall'utente."
+    elif recent_rain_48h > 5.0:
+        target = 0.0
+        recommendation = "SKIP"
+        reason = f"Stop per pioggia recente ({recent_rain_48h:.1f}mm)."
+    elif past_rain_5days > 40.0:
+        target = 0.0
+        recommendation = "SKIP"
+        reason = f"Terreno saturo ({past_rain_5days:.1f}mm negli ultimi 5gg)."
+    elif future_rain_5days > 20.0:
+        target = 0.0
+        recommendation = "SKIP"
+        reason = f"Prevista pioggia abbondante ({future_rain_5days:.1f}mm)."
+
+    delta = max(0.0, target - water_today)
+    if recommendation == "IRRIGARE" and delta <= 0.2:
+        recommendation = "SKIP"
+        reason = "Fabbisogno idrico soddisfatto."
+
+    print(f"   [DECISIONE] {recommendation} | Delta: {delta:.2f}L")
+
+    # 6. DATI PER LLM
+    decision = {
+        "recommendation": recommendation,
+        "reason": reason,
+        "quantity": round(delta, 2),
         
-        plant_id_str = str(raw_id)
-        # Creiamo plant_oid da usare per le query al DB e il salvataggio
-        try: plant_oid = ObjectId(plant_id_str)
-        except: plant_oid = None
-
-        print(f"\n[AI IBRIDA] --- Analisi per: {plant.get('name')} ---")
-
-        # 1. METEO REALE
-        real_wx = {}
-        # Logica recupero meteo
-        db_lat = plant.get("geoLat")
-        db_lon = plant.get("geoLng")
-        db_city = plant.get("location") or plant.get("addressLocality")
-        try:
-            if db_lat and db_lon:
-                real_wx = await weatherController.get_weather_data(lat=db_lat, lon=db_lon)
-            elif db_city:
-                real_wx = await weatherController.get_weather_data(city=db_city)
-            else:
-                real_wx = await weatherController.get_weather_data()
-        except: pass
-
-        merged_wx = {
-            "temp": real_wx.get("temp", 20.0),
-            "humidity": real_wx.get("humidity", 50.0),
-            "et0": real_wx.get("et0", 2.5),
-            "solar_rad": real_wx.get("solar_rad", 400.0),
-            "wind": real_wx.get("wind", 10.0),
-            "rain_trend": real_wx.get("rain_trend", [])
-        }
-        final_wx = _get_weather_context_fallback(merged_wx)
-        prof = plant.get("profile_data") or {"stageNorm": "Vegetativa", "plant_type": plant.get("species", "Generica")}
-
-        # 2. PIOGGIA
-        past_rain_5days = 0.0
-        recent_rain_48h = 0.0
-        future_rain_5days = 0.0
-        rain_tomorrow = 0.0
+        "debug_anfis": theoretical_liters,
+        "debug_past_rain": past_rain_5days,
+        "debug_future_rain": future_rain_5days,
+        "debug_user_water": water_today,
+        "debug_recent_rain": recent_rain_48h,
         
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        yesterday_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        tomorrow_str = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        # INFO CONCIME
+        "debug_fertilizer_info": recent_fertilizer 
+    }
 
-        for day in final_wx.get("rain_trend", []):
-            d_str = day["date"]
-            r = float(day["rain"])
-            if d_str < today_str: past_rain_5days += r
-            elif d_str > today_str: future_rain_5days += r
-            if d_str == today_str or d_str == yesterday_str: recent_rain_48h += r
-            if d_str == tomorrow_str: rain_tomorrow = r
+    # 7. SALVATAGGIO
+    final_wx["rainNext24h"] = rain_tomorrow
+    if plant_oid:
+        db["piante"].update_one(
+            {"_id": plant_oid},
+            {"$set": {
+                "weather_data": final_wx,
+                "last_ai_check": datetime.utcnow(),
+                "water_today": water_today
+            }}
+        )
+
+    # 8. AI EXPLAINER IN BACKGROUND (il testo arriva via polling)
+    explain_args = {
+        "plant": plant, "agg": {"weather": final_wx, "profile": prof},
+        "decision": decision, "now": datetime.now()
+    }
+    if batch_jobs is not None:
+        batch_jobs.append({"oid": plant_oid, "resultId": plant_id_str, **explain_args})
+        ai_report = {"text": None, "explanationStatus": STATUS_PENDING}
+    else:
+        ai_report = schedule_explanation(db["piante"], plant_oid, **explain_args)
+
+    # 9. RISPOSTA
+    return {
+        "decision": decision, 
+        "recommendation": decision["recommendation"],
+        "reason": decision["reason"],
+        "liters": decision["quantity"],
+        "weather": final_wx,
+        "explanationLLM": ai_report.get("text"),
+        "explanationStatus": ai_report.get("explanationStatus"),
+        "tech": "Hybrid:ANFIS+Rules" if anfisService.is_trained else "Hybrid:ET0+Rules"
+    }
 
-        print(f"   [PIOGGIA] Ieri+Oggi: {recent_rain_48h:.1f}mm | Ultimi 5gg: {past_rain_5days:.1f}mm")
+async def compute_for_plant(plant: dict, batch_jobs: list = None) -> Dict[str, Any]:
+    """
+    Decisione irrigua ibrida (ANFIS + regole) per una pianta.
+    Se 'batch_jobs' è una lista, la spiegazione LLM non viene avviata qui ma accodata
+    per essere generata insieme alle altre piante del batch.
+    """
+    try:
+        ctx = await _gather_plant_context(plant)
 
         # 3. MODELLO ANFIS
         try:
+            wx = ctx["final_wx"]
             theoretical_liters = anfisService.predict(
-                temp=float(final_wx["temp"]),
-                humidity=float(final_wx["humidity"]),
-                rain=float(rain_tomorrow), 
-                et0=float(final_wx["et0"])
+                temp=float(wx["temp"]),
+                humidity=float(wx["humidity"]),
+                rain=float(ctx["rain_tomorrow"]), 
+                et0=float(wx["et0"])
             )
             theoretical_liters = max(0.5, theoretical_liters)
         except:
-            theoretical_liters = max(1.0, float(final_wx["et0"])) 
+            theoretical_liters = max(1.0, float(ctx["final_wx"]["et0"])) 
 
-        print(f"   [ANFIS] Fabbisogno Stimato: {theoretical_liters:.2f}L")
-
-        # 4. CONTROLLI MANUALI (ACQUA E CONCIME)
-        water_today = _calculate_manual_water_today(plant_id_str)
-        recent_fertilizer = _check_recent_fertilization(plant_id_str, plant_oid)
-        
-
-        # 5. SUPERVISORE (REGOLE DI BLOCCO ACQUA)
-        target = theoretical_liters
-        recommendation = "IRRIGARE"
-        reason = f"Modello ANFIS suggerisce {theoretical_liters:.2f}L."
-
-        if water_today >= target:
-            recommendation = "SKIP"
-            reason = f"Fabbisogno ({theoretical_liters:.2f}L) coperto dall'utente."
-        elif recent_rain_48h > 5.0:
-            target = 0.0
-            recommendation = "SKIP"
-            reason = f"Stop per pioggia recente ({recent_rain_48h:.1f}mm)."
-        elif past_rain_5days > 40.0:
-            target = 0.0
-            recommendation = "SKIP"
-            reason = f"Terreno saturo ({past_rain_5days:.1f}mm negli ultimi 5gg)."
-        elif future_rain_5days > 20.0:
-            target = 0.0
-            recommendation = "SKIP"
-            reason = f"Prevista pioggia abbondante ({future_rain_5days:.1f}mm)."
-
-        delta = max(0.0, target - water_today)
-        if recommendation == "IRRIGARE" and delta <= 0.2:
-            recommendation = "SKIP"
-            reason = "Fabbisogno idrico soddisfatto."
-
-        print(f"   [DECISIONE] {recommendation} | Delta: {delta:.2f}L")
-
-        # 6. DATI PER LLM
-        decision = {
-            "recommendation": recommendation,
-            "reason": reason,
-            "quantity": round(delta, 2),
-            
-            "debug_anfis": theoretical_liters,
-            "debug_past_rain": past_rain_5days,
-            "debug_future_rain": future_rain_5days,
-            "debug_user_water": water_today,
-            "debug_recent_rain": recent_rain_48h,
-            
-            # INFO CONCIME
-            "debug_fertilizer_info": recent_fertilizer 
-        }
-
-        # 7. CHIAMATA AI EXPLAINER
-        final_wx["rainNext24h"] = rain_tomorrow
-        ai_report = await explain_irrigation_async(
-            plant=plant, agg={"weather": final_wx, "profile": prof}, 
-            decision=decision, now=datetime.now()
-        )
-
-        # 8. SALVATAGGIO
-        if plant_oid:
-            db["piante"].update_one(
-                {"_id": plant_oid},
-                {"$set": {
-                    "ai_analysis_report": ai_report,
-                    "weather_data": final_wx,
-                    "last_ai_check": datetime.utcnow(),
-                    "water_today": water_today
-                }}
-            )
-
-        # 9. RISPOSTA
-        return {
-            "decision": decision, 
-            "recommendation": decision["recommendation"],
-            "reason": decision["reason"],
-            "liters": decision["quantity"],
-            "weather": final_wx,
-            "explanationLLM": ai_report.get("text"),
-            "tech": "Hybrid:ANFIS+Rules"
-        }
+        return _finalize_plant(ctx, theoretical_liters, batch_jobs)
 
     except Exception as e:
-        print(f"[CRITICAL ERROR] {e}")
-        return {"recommendation": "SKIP", "reason": f"Errore: {str(e)}", "liters": 0}
+        return _error_result(e)
 
 async def compute_batch(plants: list):
-    results = []
+    # (id, contesto, risultato d'errore): l'ordine delle piante resta quello in ingresso
+    slots = []
     for p in (plants or []):
+        pid = str(p.get("_id") or p.get("id"))
         try:
-            res = await compute_for_plant(p)
-            pid = str(p.get("_id") or p.get("id"))
-            res["id"] = pid
-            results.append(res)
-        except: continue
-    return results
\ No newline at end of file
+            slots.append((pid, await _gather_plant_context(p), None))
+        except Exception as e:
+            slots.append((pid, None, _error_result(e)))
+
+    # 3. MODELLO ANFIS: una sola passata per tutte le piante invece di una per pianta
+    contexts = [ctx for _, ctx, _ in slots if ctx is not None]
+    liters = iter(_predict_liters(contexts) if contexts else [])
+
+    results = []
+    batch_jobs = []
+    for pid, ctx, res in slots:
+        if ctx is not None:
+            try:
+                res = _finalize_plant(ctx, next(liters), batch_jobs)
+            except Exception as e:
+                res = _error_result(e)
+        res["id"] = pid
+        results.append(res)
+
+    # Un solo prompt LLM per più piante (le mancanti ripiegano su chiamate singole)
+    reports = schedule_batch_explanation(db["piante"], batch_jobs)
+    for res in results:
+        report = reports.get(res["id"])
+        if report:
+            res["explanationLLM"] = report.get("text")
+            res["explanationStatus"] = report.get("explanationStatus")
+    return results
@@ -5,15 +5,14 @@ from pymongo import DESCENDING
 from bson import ObjectId
 from bson.errors import InvalidId
 from datetime import datetime, timedelta
-from PIL import Image
-from io import BytesIO
+from fastapi.concurrency import run_in_threadpool
 import os
 import random
 import dateutil.parser 
 
-from utils.images import save_image_bytes
+from utils.images import ingest_image
 from config import settings
-from utils.ai_explainer_service import explain_irrigation_async
+from utils.ai_explanation_worker import schedule_explanation
 from controllers.weather_controller import weatherController
 
 class ImageController:
@@ -163,20 +162,19 @@ class ImageController:
                 "quantity": round(max(0, delta), 2)
             }
 
-            ai_report = await explain_irrigation_async(
-                plant=plant, agg={"weather": final_wx, "profile": prof}, 
-                decision=decision, now=datetime.now()
-            )
-
             self.collection.update_one(
                 {"_id": oid},
                 {"$set": {
-                    "ai_analysis_report": ai_report, 
                     "weather_data": final_wx,
                     "last_ai_check": datetime.utcnow(),
                     "water_today": water_today
                 }}
             )
+            ai_report = schedule_explanation(
+                self.collection, oid,
+                plant=plant, agg={"weather": final_wx, "profile": prof},
+                decision=decision, now=datetime.now()
+            )
             return ai_report
 
         except Exception as e:
@@ -187,8 +185,12 @@ class ImageController:
     async def upload_image(self, file: UploadFile, planttype: str = None, location: str = None, sensorid: str = None, notes: str = None) -> dict:
         if not file.content_type.startswith("image/"): raise HTTPException(400, "File non valido")
         imagedata = await file.read()
-        metadata = self.extract_image_metadata(imagedata, file.filename)
-        saved_paths = self.save_image_to_filesystem(imagedata)
+        # Decodifica, metadati e varianti WebP in un solo passaggio, fuori dall'event loop
+        try:
+            ingested = await run_in_threadpool(self.save_image_to_filesystem, imagedata)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        saved_paths, metadata = ingested["saved"], ingested["metadata"]
         wx = self._get_weather_context_fallback()
         doc = {
             "filename": os.path.basename(saved_paths["abs"]),
@@ -234,16 +236,21 @@ class ImageController:
         self.collection.delete_one({"_id": oid})
         return {"status": "success", "message": "Eliminata"}
 
-    def extract_image_metadata(self, imagedata, filename):
-        try:
-            img = Image.open(BytesIO(imagedata))
-            return {"width": img.width, "height": img.height, "format": img.format}
-        except: return {}
+    def mark_image_processed(self, imageid: str, cnnresults: dict = None) -> dict:
+        """Segna l'immagine come processata (stessi campi scritti da ai.batch_classifier)."""
+        oid = self.validate_objectid(imageid)
+        res = self.collection.update_one(
+            {"_id": oid},
+            {"$set": {"processed": True, "processedtimestamp": datetime.utcnow(), "cnnresults": cnnresults},
+             "$unset": {"cnnerror": ""}}
+        )
+        if res.matched_count == 0: raise HTTPException(404, "Non trovata")
+        return {"status": "success", "image": self._enrich_image_for_frontend(self.collection.find_one({"_id": oid}))}
 
     def save_image_to_filesystem(self, imagedata):
         datesubdir = datetime.utcnow().strftime("%Y%m%d")
         subdir = f"plant_images/{datesubdir}"
-        return save_image_bytes(data=imagedata, subdir=subdir, basename=None, maxside=1280, thumbside=384, webpquality=82)
+        return ingest_image(data=imagedata, subdir=subdir, base_name=None, max_side=1280, thumb_side=384, webp_quality=82)
 
     def delete_image_files(self, f1, f2):
         for f in [f1, f2]:
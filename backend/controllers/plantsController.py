@@ -8,14 +8,11 @@ from config import settings
 from controllers.interventionsController import interventions_collection
 from database import db
 from models.plantModel import PlantCreate, PlantUpdate, serialize_plant
-from utils.images import save_image_bytes
+from utils.images import ingest_image
 from controllers.weather_controller import weatherController
-from utils.ai_explainer_service import explain_irrigation_async
+from utils.ai_explanation_worker import schedule_explanation
 
-try:
-    from ai.cnn_service import cnn_classifier
-except ImportError:
-    from ai.cnn_service import cnn_classifier
+from ai.cnn_service import cnn_classifier, ModelNotReadyError, QueueFullError, RETRY_AFTER_SECONDS
 
 try:
     from utils.trefle_service import fetch_plant_by_id, derive_defaults_from_trefle_data
@@ -115,14 +112,26 @@ def delete_plant(user_id: str, plant_id: str) -> bool:
 def save_plant_image(user_id: str, plant_id: str, file_bytes: bytes) -> Optional[dict]:
     plant = plants_collection.find_one({"_id": _oid(plant_id), "userId": _oid(user_id)})
     if not plant: return None
-    saved = save_image_bytes(data=file_bytes, subdir=f"plants/{user_id}/{plant_id}")
     plant_species = plant.get("species", "generic")
-    health_result = cnn_classifier.predict_health(file_bytes, plant_context=plant_species)
+
+    def analyze(image):
+        try:
+            return cnn_classifier.predict_health(image, plant_context=plant_species, origin="plant-image")
+        except ModelNotReadyError as e:
+            raise HTTPException(503, str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+        except QueueFullError as e:
+            raise HTTPException(429, str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    # Una sola decodifica: la CNN lavora sull'immagine orientata mentre le varianti WebP vengono codificate.
+    # Se l'analisi fallisce (modello in caricamento, coda piena) i file appena scritti vengono rimossi.
+    ingested = ingest_image(file_bytes, subdir=f"plants/{user_id}/{plant_id}", analyze=analyze)
+    saved, health_result = ingested["saved"], ingested["analysis"]
     update_payload = {
         "imageUrl": saved["url"],
         "imageThumbUrl": saved["thumbUrl"],
         "healthStatus": health_result["label"],
         "healthAdvice": health_result["advice"],
+        "healthSource": health_result.get("source"),
         "updatedAt": datetime.utcnow()
     }
     plants_collection.update_one({"_id": _oid(plant_id)}, {"$set": update_payload})
@@ -269,25 +278,26 @@ async def calculate_irrigation_for_plant(user_id: str, plant_id: str) -> Dict[st
             "debug_future_rain": future_rain_5days
         }
 
-        # 6. AI EXPLAINER
-        ai_report = await explain_irrigation_async(
-            plant=plant, agg={"weather": final_wx, "profile": prof}, 
-            decision=decision, now=datetime.now()
-        )
-
-        # 7. SALVA I DATI NELLA PIANTA (Per visualizzarli nel frontend)
+        # 6. SALVA I DATI NELLA PIANTA (Per visualizzarli nel frontend)
         plants_collection.update_one(
             {"_id": oid},
             {"$set": {
-                "ai_analysis_report": ai_report,
                 "weather_data": final_wx,
                 "last_ai_check": datetime.utcnow(),
                 "water_today": water_today
             }}
         )
 
+        # 7. AI EXPLAINER IN BACKGROUND (il testo arriva via polling)
+        ai_report = schedule_explanation(
+            plants_collection, oid,
+            plant=plant, agg={"weather": final_wx, "profile": prof},
+            decision=decision, now=datetime.now()
+        )
+
         # Ritorna lo stesso formato che si aspetta il frontend
-        # (Nota: Il frontend legge 'ai_analysis_report' o 'recommendation' dall'oggetto ritornato)
+        # (Nota: Il frontend legge 'ai_analysis_report' o 'recommendation' dall'oggetto ritornato;
+        #  finché explanationStatus è 'pending' il testo va recuperato via polling)
         return ai_report
 
     except Exception as e:
@@ -1,29 +1,36 @@
 import httpx
 from datetime import datetime, timedelta
 
+from utils.outbound import arequest
+
+# Timeout per chiamata (era il default di httpx); la deadline della richiesta può ridurlo
+_HTTP_TIMEOUT = 5.0
+
 class WeatherController:
     def __init__(self):
         self.base_url_forecast = "https://api.open-meteo.com/v1/forecast"
         self.base_url_history = "https://archive-api.open-meteo.com/v1/archive"
         self.base_url_geocoding = "https://geocoding-api.open-meteo.com/v1/search"
         self.base_url_reverse = "https://nominatim.openstreetmap.org/reverse"
+        # Ultimo meteo valido per posizione: servito quando Open-Meteo non risponde
+        self._last_good = {}
 
     async def get_coordinates(self, city: str):
         print(f"   >>> [METEO CHECK] Sto chiedendo a Open-Meteo dove si trova: '{city}'...")
         try:
             params = {"name": city, "count": 1, "language": "it", "format": "json"}
-            async with httpx.AsyncClient() as client:
-                r = await client.get(self.base_url_geocoding, params=params)
-                data = r.json()
-                if "results" in data and len(data["results"]) > 0:
-                    lat = data["results"][0]["latitude"]
-                    lon = data["results"][0]["longitude"]
-                    name_found = data["results"][0]["name"]
-                    country = data["results"][0].get("country", "")
-                    print(f"   >>> [METEO SUCCESS] Trovato! {name_found} ({country}) -> Lat: {lat}, Lon: {lon}")
-                    return lat, lon
-                else:
-                    print(f"   >>> [METEO FAIL] Nessuna città trovata con nome: '{city}'")
+            r = await arequest("open-meteo-geocoding", "GET", self.base_url_geocoding,
+                               timeout=_HTTP_TIMEOUT, params=params)
+            data = r.json()
+            if "results" in data and len(data["results"]) > 0:
+                lat = data["results"][0]["latitude"]
+                lon = data["results"][0]["longitude"]
+                name_found = data["results"][0]["name"]
+                country = data["results"][0].get("country", "")
+                print(f"   >>> [METEO SUCCESS] Trovato! {name_found} ({country}) -> Lat: {lat}, Lon: {lon}")
+                return lat, lon
+            else:
+                print(f"   >>> [METEO FAIL] Nessuna città trovata con nome: '{city}'")
         except Exception as e:
             print(f"[GEOCODING ERROR] {e}")
         return None, None
@@ -31,20 +38,29 @@ class WeatherController:
     async def _get_city_name_from_coords(self, lat, lon):
         try:
             headers = {'User-Agent': 'GreenfieldAdvisorApp/1.0'}
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(
-                    f"{self.base_url_reverse}?lat={lat}&lon={lon}&format=json",
-                    headers=headers,
-                    timeout=5.0
-                )
-                if resp.status_code == 200:
-                    data = resp.json()
-                    addr = data.get("address", {})
-                    return addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
+            resp = await arequest(
+                "nominatim", "GET",
+                f"{self.base_url_reverse}?lat={lat}&lon={lon}&format=json",
+                headers=headers,
+                timeout=5.0
+            )
+            if resp.status_code == 200:
+                data = resp.json()
+                addr = data.get("address", {})
+                return addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
         except Exception as e:
             print(f"[REVERSE GEO ERROR] {e}")
         return None
 
+    async def _get_json(self, provider: str, client: httpx.AsyncClient, url: str, params: dict) -> dict:
+        """GET tramite il circuit breaker del provider; {} se non disponibile."""
+        try:
+            r = await arequest(provider, "GET", url, timeout=_HTTP_TIMEOUT, client=client, params=params)
+            return r.json() if r.status_code == 200 else {}
+        except Exception as e:
+            print(f"[WEATHER WARN] {provider}: {e}")
+            return {}
+
     # FUNZIONE PER CALCOLARE LA LUCE
     def _estimate_lux(self, radiation_mj):
         """
@@ -88,20 +104,23 @@ class WeatherController:
                 end_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
                 start_date = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
                 
-                r_hist = await client.get(self.base_url_history, params={
+                hist_data = await self._get_json("open-meteo-archive", client, self.base_url_history, {
                     "latitude": lat, "longitude": lon,
                     "start_date": start_date, "end_date": end_date,
                     "daily": "precipitation_sum", "timezone": "auto"
                 })
-                hist_data = r_hist.json() if r_hist.status_code == 200 else {}
 
                 # 4. PREVISIONI
-                r_fore = await client.get(self.base_url_forecast, params={
+                fore_data = await self._get_json("open-meteo", client, self.base_url_forecast, {
                     "latitude": lat, "longitude": lon,
                     "daily": "temperature_2m_max,relative_humidity_2m_max,precipitation_sum,et0_fao_evapotranspiration,shortwave_radiation_sum,wind_speed_10m_max",
                     "timezone": "auto"
                 })
-                fore_data = r_fore.json() if r_fore.status_code == 200 else {}
+
+                cache_key = (round(lat, 2), round(lon, 2))
+                if "daily" not in fore_data and cache_key in self._last_good:
+                    print(f"   >>> [METEO CACHE] Open-Meteo non disponibile, uso l'ultimo dato valido per {cache_key}")
+                    return {**self._last_good[cache_key], "stale": True}
 
                 # 5. Parsing Dati
                 rain_trend = []
@@ -156,7 +175,7 @@ class WeatherController:
 
                 print(f"   >>> [METEO DATA] Scaricati dati per Lat:{lat}, Lon:{lon}. Temp: {current_temp}°C, Lux: {lux_val}")
 
-                return {
+                result = {
                     "location": {
                         "name": location_name,
                         "lat": lat,
@@ -178,6 +197,9 @@ class WeatherController:
 
                     "rain_trend": rain_trend
                 }
+                if "daily" in fore_data:
+                    self._last_good[cache_key] = result
+                return result
 
         except Exception as e:
             print(f"[WEATHER ERROR] {e}")
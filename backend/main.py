@@ -11,7 +11,7 @@ if sys.version_info < (3, 10):
     import importlib_metadata
     importlib.metadata.packages_distributions = importlib_metadata.packages_distributions
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
@@ -19,6 +19,10 @@ from config import settings
 from database import db
 from controllers.interventionsController import ensure_interventions_indexes
 from utils.ai_explainer_service import get_ai_explanation
+from utils.ai_anfis_service import anfisService
+from ai.cnn_service import cnn_classifier
+from utils.ai_explanation_cache import ensure_cache_indexes, get_cache_stats
+from utils.outbound import deadline_scope, get_provider_stats, REQUEST_DEADLINE_SECONDS
 
 # Import dei Router
 from routers import interventionsRouter
@@ -63,6 +67,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Budget di tempo per le chiamate esterne di ogni richiesta (meteo, NASA, Trefle, OpenRouter)
+@app.middleware("http")
+async def outbound_deadline(request: Request, call_next):
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
+        return await call_next(request)
+
 # Static Files (per servire le immagini caricate)
 app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
 
@@ -90,10 +100,23 @@ def health():
         "system_check": {
             "ai_api_key": ai_status,
             "ai_model": os.getenv("HF_MODEL", "Default"),
+            "ai_cache": get_cache_stats(),
+            "anfis_model": {
+                "status": "ready" if anfisService.ensure_loaded() else "not_ready (fallback ET0 - pioggia)",
+                "version": anfisService.meta.get("version"),
+            },
+            "cnn_model": cnn_classifier.get_stats(),
+            "external_providers": get_provider_stats(),
             "database": "Connected"
         }
     }
 
+@app.on_event("startup")
+def warmup_cnn():
+    # Import di TensorFlow + caricamento .h5 + inferenza di prova in background:
+    # il server accetta richieste subito, le analisi immagine rispondono 503 finché non è pronto
+    cnn_classifier.start_warmup()
+
 @app.on_event("startup")
 def init_indexes():
     # Indici Utenti
@@ -116,3 +139,9 @@ def init_indexes():
         ensure_interventions_indexes()
     except Exception as e:
         print(f"[WARN] interventions indexes: {e}")
+
+    # Indici Cache spiegazioni AI
+    try:
+        ensure_cache_indexes()
+    except Exception as e:
+        print(f"[WARN] ai cache indexes: {e}")
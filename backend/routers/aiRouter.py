@@ -1,6 +1,13 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from typing import Optional
-from ai.cnn_service import cnn_classifier
+from datetime import datetime
+from ai.cnn_service import cnn_classifier, ModelNotReadyError, QueueFullError, RETRY_AFTER_SECONDS
+from utils.auth import require_roles
+from utils.ai_explainer_service import HF_FALLBACK_MODELS
+from utils.ai_model_telemetry import get_model_stats
+from utils.ai_anfis_service import anfisService, list_versions, activate_version
+from utils.ai_anfis_retrain import start_in_background, get_retrain_status
+from ai import batch_classifier
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
@@ -15,7 +22,89 @@ async def analyze_health(
     try:
         image_data = await file.read()
         # Passa la specie al servizio per il filtro
-        result = cnn_classifier.predict_health(image_data, plant_context=plant_type)
+        result = await cnn_classifier.predict_health_async(image_data, plant_context=plant_type)
         return {"status": "success", "analysis": result}
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admin/llm-stats", summary="Telemetria modelli LLM (admin)")
+def llm_stats(current_user: dict = Depends(require_roles("admin"))):
+    """
+    Success rate, latenza p50/p95, token e stato di esclusione per ogni modello
+    di fallback, insieme all'ordine che verrà usato alla prossima richiesta.
+    """
+    return get_model_stats(HF_FALLBACK_MODELS)
+
+
+@router.get("/admin/cnn-stats", summary="Telemetria classificatore CNN (admin)")
+def cnn_stats(current_user: dict = Depends(require_roles("admin"))):
+    """Stato del modello e distribuzione delle dimensioni dei batch di inferenza."""
+    return cnn_classifier.get_stats()
+
+
+@router.get("/admin/anfis", summary="Versioni modello ANFIS (admin)")
+def anfis_status(current_user: dict = Depends(require_roles("admin"))):
+    """Versione attiva, versioni salvate e stato dell'ultimo retraining."""
+    return {
+        "active": anfisService.meta if anfisService.ensure_loaded() else None,
+        "versions": list_versions(),
+        "retrain": get_retrain_status(),
+    }
+
+
+@router.post("/admin/anfis/retrain", summary="Retraining incrementale ANFIS (admin)", status_code=202)
+def anfis_retrain(
+    epochs: int = 3,
+    replay: float = 1.0,
+    since: Optional[datetime] = None,
+    current_user: dict = Depends(require_roles("admin")),
+):
+    """
+    Aggiorna il modello con gli interventi reali in background; la nuova versione viene attivata
+    (senza riavvio) solo se l'errore sugli interventi di valutazione, esclusi dal training, non peggiora.
+    """
+    if not start_in_background(epochs=epochs, replay=replay, since=since):
+        raise HTTPException(status_code=409, detail="Retraining già in corso")
+    return {"status": "accepted"}
+
+
+@router.post("/admin/anfis/activate/{version}", summary="Attiva una versione ANFIS (admin)")
+def anfis_activate(version: str, current_user: dict = Depends(require_roles("admin"))):
+    """Rende attiva una versione salvata, anche per tornare a una precedente."""
+    try:
+        return {"status": "success", "active": activate_version(version)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/admin/classify-backlog", summary="Stato classificazione batch immagini (admin)")
+def classify_backlog_status(current_user: dict = Depends(require_roles("admin"))):
+    """Immagini ancora da classificare e checkpoint dell'ultimo job."""
+    return batch_classifier.get_job_status()
+
+
+@router.post("/admin/classify-backlog", summary="Classifica le immagini non processate (admin)", status_code=202)
+def classify_backlog(
+    batch_size: int = batch_classifier.JOB_BATCH,
+    max_per_second: float = batch_classifier.JOB_MAX_PER_SECOND,
+    restart: bool = False,
+    current_user: dict = Depends(require_roles("admin")),
+):
+    """Avvia il job in background; riprende dall'ultimo checkpoint salvo restart=true."""
+    if not batch_classifier.start_in_background(batch_size=batch_size, max_per_second=max_per_second, restart=restart):
+        raise HTTPException(status_code=409, detail="Classificazione batch già in corso")
+    return {"status": "accepted"}
+
+
+@router.post("/admin/classify-backlog/stop", summary="Ferma la classificazione batch (admin)")
+def classify_backlog_stop(current_user: dict = Depends(require_roles("admin"))):
+    """Il job si ferma alla fine del blocco corrente; il prossimo avvio riprende da lì."""
+    batch_classifier.stop()
+    return {"status": "stopping"}
@@ -1,4 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 from pydantic import BaseModel, Field
 
@@ -10,7 +12,9 @@ from controllers.plantsController import (
 )
 
 from controllers.ai_irrigazione_controller import compute_for_plant, compute_batch
+from utils.ai_explanation_worker import get_explanation_status, stream_explanation_events
 
+from bson import ObjectId
 from database import db
 
 router = APIRouter(prefix="/api/piante", tags=["piante"])
@@ -61,7 +65,11 @@ async def api_upload_plant_image(
     if len(data) > 8 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="Immagine troppo grande (max 8MB)")
 
-    saved = save_plant_image(current_user["id"], plant_id, data)
+    # Salvataggio + analisi CNN sono bloccanti: fuori dall'event loop
+    try:
+        saved = await run_in_threadpool(save_plant_image, current_user["id"], plant_id, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if saved is None:
         raise HTTPException(status_code=404, detail="Pianta non trovata")
 
@@ -99,6 +107,45 @@ async def api_ai_irrigazione_per_pianta(
     return await compute_for_plant(plant)
 
 
+@router.get("/{plant_id}/ai/irrigazione/spiegazione", summary="Stato spiegazione AI (polling)")
+def api_ai_irrigazione_spiegazione(
+    plant_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Ritorna lo stato della spiegazione LLM generata in background
+    (explanationStatus: pending | ready | failed) e l'ultimo ai_analysis_report.
+    """
+    plant = get_plant(current_user["id"], plant_id)
+    if not plant:
+        raise HTTPException(status_code=404, detail="Pianta non trovata")
+
+    res = get_explanation_status(plants_collection, ObjectId(plant_id))
+    if res is None:
+        raise HTTPException(status_code=404, detail="Pianta non trovata")
+    return res
+
+
+@router.get("/{plant_id}/ai/irrigazione/spiegazione/stream", summary="Spiegazione AI in streaming (SSE)")
+def api_ai_irrigazione_spiegazione_stream(
+    plant_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-Sent Events: 'token' per ogni frammento del testo LLM in generazione,
+    'done' con l'ai_analysis_report salvato quando lo stream termina.
+    """
+    plant = get_plant(current_user["id"], plant_id)
+    if not plant:
+        raise HTTPException(status_code=404, detail="Pianta non trovata")
+
+    return StreamingResponse(
+        stream_explanation_events(plants_collection, ObjectId(plant_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/ai/irrigazione/batch")
 async def api_ai_irrigazione_batch(
     payload: AIPlantBatchIn,
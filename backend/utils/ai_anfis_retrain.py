@@ -0,0 +1,225 @@
+import os
+import copy
+import time
+import zlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+from database import db
+from utils.ai_anfis_service import anfisService, save_version, MODEL_PATH, SCALER_PATH, _version_tag
+
+# Config da ENV
+RETRAIN_BATCH = int(os.getenv("ANFIS_RETRAIN_BATCH", "256"))                 # coppie per passo di partial_fit
+RETRAIN_MAX_GAP_HOURS = float(os.getenv("ANFIS_RETRAIN_MAX_GAP_HOURS", "48"))  # distanza max intervento/meteo
+RETRAIN_HOLDOUT_MOD = int(os.getenv("ANFIS_RETRAIN_HOLDOUT_MOD", "5"))          # 1 intervento su N solo per la valutazione
+
+# Un solo retraining alla volta per processo (CLI o endpoint admin)
+_RUNNING = threading.Lock()
+# Esito dell'ultimo retraining (per l'endpoint admin)
+_LAST_RESULT: Dict[str, Any] = {}
+
+
+def _pipeline(since: Optional[datetime]) -> list:
+    """Irrigazioni eseguite con litri noti, unite al meteo salvato sulla pianta."""
+    match: Dict[str, Any] = {"type": "irrigazione", "status": "done", "liters": {"$gt": 0}}
+    if since is not None:
+        match["executedAt"] = {"$gte": since}
+    return [
+        {"$match": match},
+        # plantId è salvato come stringa (o ObjectId nei documenti più vecchi)
+        {"$addFields": {"pid": {"$convert": {"input": "$plantId", "to": "objectId", "onError": None, "onNull": None}}}},
+        {"$lookup": {"from": "piante", "localField": "pid", "foreignField": "_id", "as": "plant"}},
+        {"$unwind": "$plant"},
+        {"$project": {
+            "_id": 1,
+            "liters": 1,
+            "executedAt": 1,
+            "wx": "$plant.weather_data",
+            "checkedAt": "$plant.last_ai_check",
+        }},
+        {"$sort": {"executedAt": 1}},
+    ]
+
+
+def _pair(doc: Dict[str, Any]) -> Optional[Tuple[list, float]]:
+    """
+    (temp, umidità, pioggia prevista, et0) -> litri. Il meteo della pianta è quello dell'ultima
+    analisi: lo si usa solo se è abbastanza vicino all'intervento da descriverne le condizioni.
+    """
+    wx = doc.get("wx") or {}
+    executed, checked = doc.get("executedAt"), doc.get("checkedAt")
+    if not isinstance(executed, datetime) or not isinstance(checked, datetime):
+        return None
+    if abs(executed - checked) > timedelta(hours=RETRAIN_MAX_GAP_HOURS):
+        return None
+    try:
+        x = [float(wx["temp"]), float(wx["humidity"]), float(wx.get("rainNext24h") or 0.0), float(wx["et0"])]
+        return x, float(doc["liters"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_holdout(doc_id) -> bool:
+    """Divisione fissa per _id: lo stesso intervento resta sempre di valutazione (o di training) tra un run e l'altro."""
+    return zlib.crc32(str(doc_id).encode("utf-8")) % RETRAIN_HOLDOUT_MOD == 0
+
+
+def iter_training_batches(batch_size: int = RETRAIN_BATCH, since: Optional[datetime] = None,
+                          holdout: Optional[bool] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Legge le coppie (meteo, litri) da Mongo a blocchi, senza caricarle tutte in memoria.
+    holdout=False: solo interventi di training; True: solo quelli di valutazione; None: tutti.
+    """
+    cursor = db["interventi"].aggregate(_pipeline(since), allowDiskUse=True, batchSize=batch_size)
+    X, y = [], []
+    for doc in cursor:
+        if holdout is not None and is_holdout(doc.get("_id")) != holdout:
+            continue
+        pair = _pair(doc)
+        if pair is None:
+            continue
+        X.append(pair[0])
+        y.append(pair[1])
+        if len(X) >= batch_size:
+            yield np.array(X), np.array(y)
+            X, y = [], []
+    if X:
+        yield np.array(X), np.array(y)
+
+
+def _mae(model, scaler, X: np.ndarray, y: np.ndarray) -> float:
+    return float(np.mean(np.abs(np.maximum(0.0, model.predict(scaler.transform(X))) - y)))
+
+
+def retrain_incremental(epochs: int = 3, replay: float = 1.0, since: Optional[datetime] = None,
+                        version: Optional[str] = None, activate: bool = True) -> Dict[str, Any]:
+    """
+    Aggiorna il modello attivo con partial_fit sugli interventi reali.
+    - lo scaler resta quello del training sintetico (gli input restano sulla stessa scala);
+    - a ogni blocco reale si aggiungono replay*N campioni sintetici, per non dimenticare
+      le zone del dominio che i dati reali non coprono;
+    - la nuova versione viene sempre salvata, ma attivata solo se l'errore medio sugli
+      interventi di valutazione (1 su ANFIS_RETRAIN_HOLDOUT_MOD, mai visti da partial_fit)
+      non peggiora; senza interventi di valutazione non viene attivata.
+    """
+    if not _RUNNING.acquire(blocking=False):
+        raise RuntimeError("Retraining ANFIS già in corso")
+    try:
+        return _retrain(epochs, replay, since, version, activate)
+    finally:
+        _RUNNING.release()
+
+
+def _retrain(epochs: int = 3, replay: float = 1.0, since: Optional[datetime] = None,
+             version: Optional[str] = None, activate: bool = True) -> Dict[str, Any]:
+    # Da chiamare con _RUNNING acquisito
+    import joblib
+
+    t0 = time.perf_counter()
+    base = joblib.load(MODEL_PATH)
+    scaler = joblib.load(SCALER_PATH)
+    model = copy.deepcopy(base)
+    rng = np.random.default_rng(42)
+
+    seen = 0
+    for epoch in range(epochs):
+        for X, y in iter_training_batches(since=since, holdout=False):
+            if epoch == 0:
+                seen += len(y)
+            n_syn = int(len(y) * replay)
+            if n_syn:
+                Xs, ys = anfisService.generate_synthetic_data(n_syn, seed=int(rng.integers(1 << 31)))
+                X, y = np.vstack([X, Xs]), np.concatenate([y, ys])
+            model.partial_fit(scaler.transform(X), y)
+
+    if seen == 0:
+        print("[ANFIS] Nessun intervento utilizzabile per il retraining.")
+        return {"status": "skipped", "samples": 0}
+
+    # Valutazione fuori campione: stessi interventi per il modello attuale e per il nuovo
+    held, mae_before, mae_after = 0, 0.0, 0.0
+    for X, y in iter_training_batches(since=since, holdout=True):
+        held += len(y)
+        mae_before += _mae(base, scaler, X, y) * len(y)
+        mae_after += _mae(model, scaler, X, y) * len(y)
+    metrics = {"holdoutSamples": held}
+    if held:
+        mae_before, mae_after = mae_before / held, mae_after / held
+        metrics.update(holdoutMaeBefore=round(mae_before, 4), holdoutMaeAfter=round(mae_after, 4))
+
+    parent = anfisService.meta.get("version") if anfisService.ensure_loaded() else None
+    improved = held > 0 and mae_after <= mae_before
+    meta = {
+        "version": version or _version_tag(),
+        "trainedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": "interventi",
+        "parent": parent,
+        "samples": seen,
+        "params": {
+            "hidden_layer_sizes": list(model.hidden_layer_sizes),
+            "learning_rate_init": model.learning_rate_init,
+            "epochs": epochs,
+            "replay": replay,
+            "holdoutMod": RETRAIN_HOLDOUT_MOD,
+        },
+        "metrics": metrics,
+        "retrainSeconds": round(time.perf_counter() - t0, 1),
+    }
+    save_version(model, scaler, meta, activate=activate and improved)
+    meta["activated"] = activate and improved
+
+    result = (f"MAE di valutazione {mae_before:.3f}L → {mae_after:.3f}L su {held}" if held
+              else "nessun intervento di valutazione")
+    print(f"[ANFIS] Retraining su {seen} interventi ({result}), "
+          f"versione {meta['version']} {'attivata' if meta['activated'] else 'salvata (non attivata)'}")
+    return {"status": "success", **meta}
+
+
+def start_in_background(**kwargs) -> bool:
+    """
+    Retraining lanciato dall'endpoint admin, in un thread: l'esito resta in get_retrain_status().
+    Il lock si prende qui, nel thread della richiesta: False se un retraining è già in corso.
+    """
+    global _LAST_RESULT
+    if not _RUNNING.acquire(blocking=False):
+        return False
+    _LAST_RESULT = {"status": "running", "startedAt": datetime.utcnow()}
+
+    def _run():
+        global _LAST_RESULT
+        try:
+            _LAST_RESULT = _retrain(**kwargs)
+        except Exception as e:
+            print(f"[ANFIS] Retraining fallito: {e}")
+            _LAST_RESULT = {"status": "error", "error": str(e)}
+        finally:
+            _RUNNING.release()
+
+    threading.Thread(target=_run, name="anfis-retrain", daemon=True).start()
+    return True
+
+
+def get_retrain_status() -> Dict[str, Any]:
+    return {"running": _RUNNING.locked(), "last": _LAST_RESULT or None}
+
+
+if __name__ == "__main__":
+    # python -m utils.ai_anfis_retrain --epochs 3 --since 2025-01-01
+    cli = argparse.ArgumentParser(description="Retraining incrementale ANFIS dagli interventi reali")
+    cli.add_argument("--epochs", type=int, default=3, help="passate sui dati reali")
+    cli.add_argument("--replay", type=float, default=1.0, help="campioni sintetici per campione reale")
+    cli.add_argument("--since", default=None, help="solo interventi da questa data (YYYY-MM-DD)")
+    cli.add_argument("--tag", default=None, help="etichetta di versione del modello salvato")
+    cli.add_argument("--no-activate", action="store_true", help="salva la versione senza attivarla")
+    args = cli.parse_args()
+    retrain_incremental(
+        epochs=args.epochs,
+        replay=args.replay,
+        since=datetime.strptime(args.since, "%Y-%m-%d") if args.since else None,
+        version=args.tag,
+        activate=not args.no_activate,
+    )
@@ -1,39 +1,328 @@
 import numpy as np
-import random
 import os
-import joblib
-from sklearn.neural_network import MLPRegressor
-from sklearn.preprocessing import StandardScaler
+import json
+import re
+import time
+import shutil
+import argparse
+import threading
+
+# sklearn e joblib servono solo per training ed export: a runtime basta NumPy (vedi NumpyMLP)
 
 # Percorsi assoluti per evitare problemi di cartelle
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "trained_model.pkl")
 SCALER_PATH = os.path.join(BASE_DIR, "scaler.pkl")
+NPZ_PATH = os.path.join(BASE_DIR, "anfis_model.npz")
+MODEL_META_PATH = os.path.join(BASE_DIR, "anfis_model.json")
+# Ogni modello salvato resta in anfis_models/<versione>/; i file qui sopra sono la versione attiva
+VERSIONS_DIR = os.path.join(BASE_DIR, "anfis_models")
+# Ogni quanto i worker controllano se la versione attiva è cambiata (hot-swap senza riavvio)
+RELOAD_CHECK_SECONDS = float(os.getenv("ANFIS_RELOAD_CHECK_SECONDS", "30"))
+GRID_PATH = os.path.join(BASE_DIR, "anfis_grid.npy")
+GRID_META_PATH = os.path.join(BASE_DIR, "anfis_grid.json")
+
+# Surrogato a griglia (opzionale): ANFIS_SURROGATE=1 usa la griglia precalcolata al posto della rete
+USE_SURROGATE = os.getenv("ANFIS_SURROGATE", "0") == "1"
+# Intervalli degli input (temp, umidità, pioggia, et0) e punti per asse
+GRID_BOUNDS = [(0.0, 45.0), (10.0, 100.0), (0.0, 50.0), (0.0, 10.0)]
+GRID_SHAPE = tuple(int(n) for n in os.getenv("ANFIS_GRID_SHAPE", "46,31,51,41").split(","))
+
+# Valori usati al posto dei None: temp, umidità, pioggia, et0
+_INPUT_DEFAULTS = np.array([20.0, 50.0, 0.0, 3.0])
+
+# Spazio di ricerca degli iperparametri (comando 'search')
+SEARCH_HIDDEN_LAYERS = [(16, 8), (32, 16), (64, 32), (32, 16, 8)]
+SEARCH_LEARNING_RATES = [0.001, 0.003, 0.01]
+
+
+def _version_tag() -> str:
+    return time.strftime("v%Y%m%d-%H%M%S")
+
+
+def export_npz(model, scaler, path: str = NPZ_PATH):
+    """Salva pesi del MLPRegressor e statistiche dello StandardScaler in un .npz compatto."""
+    if model.activation != "relu" or model.out_activation_ != "identity":
+        raise ValueError(f"Attivazioni non supportate: {model.activation}/{model.out_activation_}")
+    arrays = {"mean": scaler.mean_, "scale": scaler.scale_}
+    for i, (W, b) in enumerate(zip(model.coefs_, model.intercepts_)):
+        arrays[f"W{i}"] = W
+        arrays[f"b{i}"] = b
+    np.savez(path, n_layers=len(model.coefs_), **arrays)
+
+
+class NumpyMLP:
+    """
+    Inferenza del MLP esportato con export_npz: scaling + matmul/ReLU, solo NumPy.
+    Replica le operazioni di StandardScaler.transform e MLPRegressor.predict.
+    """
+
+    def __init__(self, path: str = NPZ_PATH):
+        with np.load(path) as data:
+            self.mean = data["mean"]
+            self.scale = data["scale"]
+            n = int(data["n_layers"])
+            self.weights = [data[f"W{i}"] for i in range(n)]
+            self.biases = [data[f"b{i}"] for i in range(n)]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        h = (X - self.mean) / self.scale
+        last = len(self.weights) - 1
+        for i, (W, b) in enumerate(zip(self.weights, self.biases)):
+            h = h @ W + b
+            if i < last:
+                np.maximum(h, 0, out=h)
+        return h[:, 0]
+
+
+class GridSurrogate:
+    """
+    Predizioni ANFIS precalcolate su una griglia 4-D (float32, memory-mapped) e
+    interpolazione multilineare: costo O(1) per campione, nessuna dipendenza ML.
+    Gli input fuori dagli intervalli della griglia vengono riportati al bordo.
+    """
+
+    def __init__(self, path: str = GRID_PATH, meta_path: str = GRID_META_PATH):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.values = np.load(path, mmap_mode="r")
+        self.lo = np.array([b[0] for b in self.meta["bounds"]])
+        self.hi = np.array([b[1] for b in self.meta["bounds"]])
+        self.shape = np.array(self.values.shape)
+        self.step = (self.hi - self.lo) / (self.shape - 1)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        pos = (np.clip(X, self.lo, self.hi) - self.lo) / self.step
+        i0 = np.minimum(np.floor(pos).astype(np.intp), self.shape - 2)
+        t = pos - i0
+
+        out = np.zeros(X.shape[0])
+        # 16 vertici della cella: ogni bit di 'corner' sceglie il lato basso/alto di un asse
+        for corner in range(16):
+            bits = [(corner >> d) & 1 for d in range(4)]
+            w = np.ones(X.shape[0])
+            for d, bit in enumerate(bits):
+                w *= t[:, d] if bit else 1.0 - t[:, d]
+            idx = tuple(i0[:, d] + bits[d] for d in range(4))
+            out += w * self.values[idx]
+        return out
+
+
+def _grid_axes(shape=GRID_SHAPE, bounds=GRID_BOUNDS):
+    return [np.linspace(lo, hi, n) for (lo, hi), n in zip(bounds, shape)]
+
+
+def build_grid(kernel: "NumpyMLP", shape=GRID_SHAPE, n_check: int = 100000) -> dict:
+    """
+    Valuta il modello su tutti i punti della griglia e la salva in GRID_PATH (+ metadati).
+    Misura l'errore dell'interpolazione rispetto al modello vero su punti casuali.
+    """
+    t0 = time.perf_counter()
+    axes = _grid_axes(shape)
+    values = np.lib.format.open_memmap(GRID_PATH, mode="w+", dtype=np.float32, shape=tuple(shape))
+    # A blocchi lungo il primo asse, per non materializzare tutta la griglia in float64
+    rest = np.stack(np.meshgrid(*axes[1:], indexing="ij"), axis=-1).reshape(-1, 3)
+    for i, temp in enumerate(axes[0]):
+        X = np.column_stack([np.full(len(rest), temp), rest])
+        values[i] = kernel.predict(X).reshape(shape[1:])
+    values.flush()
+    del values
+
+    meta = {"bounds": GRID_BOUNDS, "shape": list(shape), "builtAt": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        with open(MODEL_META_PATH, "r", encoding="utf-8") as f:
+            meta["modelVersion"] = json.load(f).get("version")
+    except (OSError, ValueError):
+        meta["modelVersion"] = None
+    with open(GRID_META_PATH, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    # Errore rispetto alla rete su campioni casuali dentro gli intervalli
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(lo, hi, n_check) for lo, hi in GRID_BOUNDS])
+    err = np.abs(GridSurrogate().predict(X) - kernel.predict(X))
+    meta["maxAbsError"] = round(float(err.max()), 4)
+    meta["meanAbsError"] = round(float(err.mean()), 5)
+    meta["buildSeconds"] = round(time.perf_counter() - t0, 2)
+    with open(GRID_META_PATH, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    print(f"[ANFIS] Griglia {tuple(shape)} salvata in {GRID_PATH}: errore max {meta['maxAbsError']}L, "
+          f"medio {meta['meanAbsError']}L ({meta['buildSeconds']}s)")
+    return meta
+
+
+# File di una versione -> percorso attivo (il .npz per ultimo: è quello che fa scattare il reload)
+_ARTIFACTS = [
+    ("trained_model.pkl", MODEL_PATH),
+    ("scaler.pkl", SCALER_PATH),
+    ("anfis_model.json", MODEL_META_PATH),
+    ("anfis_model.npz", NPZ_PATH),
+]
+
+
+_VERSION_RE = re.compile(r"^[\w.-]+$")
+
+
+def _version_dir(version: str) -> str:
+    """Cartella della versione; il nome arriva anche da un path param, quindi niente separatori né '.'/'..'."""
+    if not isinstance(version, str) or not _VERSION_RE.match(version) or version in (".", ".."):
+        raise ValueError(f"Nome di versione ANFIS non valido: '{version}'")
+    return os.path.join(VERSIONS_DIR, version)
+
+
+def save_version(model, scaler, meta: dict, activate: bool = True, service: "AnfisIrrigationModel" = None) -> str:
+    """Salva il modello in anfis_models/<versione>/ e, se richiesto, lo rende attivo."""
+    import joblib
+
+    vdir = _version_dir(meta["version"])
+    os.makedirs(vdir, exist_ok=True)
+    joblib.dump(model, os.path.join(vdir, "trained_model.pkl"))
+    joblib.dump(scaler, os.path.join(vdir, "scaler.pkl"))
+    export_npz(model, scaler, os.path.join(vdir, "anfis_model.npz"))
+    with open(os.path.join(vdir, "anfis_model.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    if activate:
+        activate_version(meta["version"], service)
+    return vdir
+
+
+def activate_version(version: str, service: "AnfisIrrigationModel" = None) -> dict:
+    """
+    Rende attiva una versione salvata (anche per tornare indietro). Ogni file viene copiato
+    e poi sostituito con os.replace: chi legge trova sempre un file completo.
+    Il servizio di questo processo si aggiorna subito, gli altri worker entro RELOAD_CHECK_SECONDS.
+    """
+    vdir = _version_dir(version)
+    if not os.path.isdir(vdir):
+        raise FileNotFoundError(f"Versione ANFIS '{version}' non trovata")
+
+    for name, dest in _ARTIFACTS:
+        tmp = dest + ".tmp"
+        shutil.copyfile(os.path.join(vdir, name), tmp)
+        os.replace(tmp, dest)
+
+    (service or anfisService).reload()
+    with open(MODEL_META_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions() -> list:
+    """Metadati delle versioni salvate, dalla più recente."""
+    versions = []
+    if os.path.isdir(VERSIONS_DIR):
+        for name in os.listdir(VERSIONS_DIR):
+            try:
+                with open(os.path.join(VERSIONS_DIR, name, "anfis_model.json"), "r", encoding="utf-8") as f:
+                    versions.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    versions.sort(key=lambda m: m.get("trainedAt", ""), reverse=True)
+    return versions
+
 
 class AnfisIrrigationModel:
     def __init__(self):
-        # Usiamo un MLPRegressor (Rete Neurale) per simulare l'apprendimento
-        self.model = MLPRegressor(
-            hidden_layer_sizes=(16, 8), 
-            activation='relu',
-            solver='adam',
-            max_iter=2000, 
-            random_state=42
-        )
-        self.scaler = StandardScaler()
+        self.model = None
+        self.scaler = None
+        self.kernel = None
         self.is_trained = False
-        
-        # Tenta il caricamento, se fallisce o non esiste il modello, addestra subito nuovamente
-        if not self.load_model():
-            print("[ANFIS] Modello non trovato o da rigenerare. Avvio Training...")
-            self.train_model()
+        self.meta = {}
+
+        # Caricamento pigro al primo utilizzo: l'import non legge file e non addestra.
+        # Il training si lancia a parte: python -m utils.ai_anfis_service train
+        self._load_attempted = False
+        self._lock = threading.Lock()
+        self._loaded_stamp = None
+        self._checked_at = 0.0
+
+    def ensure_loaded(self) -> bool:
+        """Carica il modello al primo utilizzo; True se pronto per l'inferenza."""
+        if not self._load_attempted:
+            with self._lock:
+                if not self._load_attempted:
+                    if not self.load_model():
+                        print("[ANFIS] Modello non disponibile: uso il fallback ET0 - pioggia. "
+                              "Addestrare con: python -m utils.ai_anfis_service train")
+                    self._load_attempted = True
+                    self._checked_at = time.time()
+        elif time.time() - self._checked_at > RELOAD_CHECK_SECONDS:
+            self._checked_at = time.time()
+            self.reload_if_changed()
+        return self.is_trained
+
+    @staticmethod
+    def _artifact_stamp():
+        try:
+            return os.path.getmtime(NPZ_PATH)
+        except OSError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        """Ricarica se il .npz attivo è cambiato (nuova versione attivata da un altro processo)."""
+        stamp = self._artifact_stamp()
+        if stamp is None or stamp == self._loaded_stamp:
+            return False
+        return self.reload()
+
+    def reload(self) -> bool:
+        """
+        Hot-swap: il nuovo modello viene caricato in un'istanza separata e poi sostituito
+        in blocco, così le predizioni in corso usano sempre un kernel completo.
+        """
+        fresh = AnfisIrrigationModel()
+        if not fresh.load_model():
+            return False
+        with self._lock:
+            self.kernel, self.model, self.scaler = fresh.kernel, fresh.model, fresh.scaler
+            self.meta = fresh.meta
+            self._loaded_stamp = fresh._loaded_stamp
+            self.is_trained = True
+            self._load_attempted = True
+        print(f"[ANFIS] Modello aggiornato a caldo: versione {self.meta.get('version')}")
+        return True
 
     def load_model(self):
-        """Carica il modello se esiste su disco"""
+        """
+        Carica il modello da disco: prima il .npz (solo NumPy); se manca ma esistono
+        i .pkl di sklearn, li carica e genera il .npz per gli avvii successivi.
+        """
+        # Letto prima dei file: se cambiano durante il caricamento, il prossimo controllo ricarica
+        self._loaded_stamp = self._artifact_stamp()
+        if os.path.exists(MODEL_META_PATH):
+            try:
+                with open(MODEL_META_PATH, "r", encoding="utf-8") as f:
+                    self.meta = json.load(f)
+            except Exception as e:
+                print(f"[ANFIS] Metadati modello illeggibili: {e}")
+        if USE_SURROGATE and os.path.exists(GRID_PATH) and os.path.exists(GRID_META_PATH):
+            try:
+                self.kernel = GridSurrogate()
+                self.is_trained = True
+                print(f"[ANFIS] Surrogato a griglia caricato (errore max {self.kernel.meta.get('maxAbsError')}L).")
+                if self.kernel.meta.get("modelVersion") != self.meta.get("version"):
+                    print("[ANFIS] Attenzione: griglia calcolata su un'altra versione del modello, rigenerarla.")
+                return True
+            except Exception as e:
+                print(f"[ANFIS] Errore caricamento griglia: {e}")
+
+        if os.path.exists(NPZ_PATH):
+            try:
+                self.kernel = NumpyMLP(NPZ_PATH)
+                self.is_trained = True
+                print("[ANFIS] Modello caricato da disco (npz).")
+                return True
+            except Exception as e:
+                print(f"[ANFIS] Errore caricamento npz: {e}")
+
         if os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
             try:
+                import joblib
                 self.model = joblib.load(MODEL_PATH)
                 self.scaler = joblib.load(SCALER_PATH)
+                export_npz(self.model, self.scaler)
+                self.kernel = NumpyMLP(NPZ_PATH)
                 self.is_trained = True
                 print("[ANFIS] Modello caricato da disco.")
                 return True
@@ -42,67 +331,147 @@ class AnfisIrrigationModel:
                 return False
         return False
 
-    def generate_synthetic_data(self, n_samples=2000):
-        X = []
-        y = []
-        
-        for _ in range(n_samples):
-            # 1. Variabili di Input (Range realistici e vari)
-            temp = random.uniform(0, 45)      # Da 0°C a 45°C
-            hum = random.uniform(10, 100)     # Da 10% a 100%
-            
-            # Pioggia: Più probabile se l'umidità è alta
-            if hum > 70 and random.random() > 0.6:
-                rain = random.uniform(0, 50)  # Fino a 50mm
-            else:
-                rain = 0.0
-            
-            # ET0: Dipende molto dalla temperatura
-            et0 = (temp * 0.15) + random.uniform(0, 1.5)
-            et0 = max(0.5, et0)
-
-            #2.
-            # Fabbisogno Base = ET0 * coeff (es. 1.0)
-            water_need = et0 * 1.0
-            if temp > 30: water_need *= 1.2    
-            if hum < 30: water_need *= 1.1     
-            
-            # Sottrazione Pioggia (Efficiente al 80%)
-            effective_rain = rain * 0.8
-            water_need -= effective_rain
-            
-            # Limite fisico: l'acqua non può essere negativa
-            water_need = max(0.0, water_need)
-            water_need += random.uniform(-0.1, 0.1)
-            water_need = max(0.0, water_need)
-
-            X.append([temp, hum, rain, et0])
-            y.append(water_need)
-            
-        return np.array(X), np.array(y)
-
-    def train_model(self):
+    def generate_synthetic_data(self, n_samples=2000, seed=None):
+        """Dataset sintetico, generato a colonne con NumPy (milioni di campioni in pochi secondi)."""
+        rng = np.random.default_rng(seed)
+
+        # 1. Variabili di Input (Range realistici e vari)
+        temp = rng.uniform(0, 45, n_samples)      # Da 0°C a 45°C
+        hum = rng.uniform(10, 100, n_samples)     # Da 10% a 100%
+
+        # Pioggia: Più probabile se l'umidità è alta (fino a 50mm)
+        rainy = (hum > 70) & (rng.random(n_samples) > 0.6)
+        rain = np.where(rainy, rng.uniform(0, 50, n_samples), 0.0)
+
+        # ET0: Dipende molto dalla temperatura
+        et0 = np.maximum(0.5, temp * 0.15 + rng.uniform(0, 1.5, n_samples))
+
+        #2.
+        # Fabbisogno Base = ET0 * coeff (es. 1.0)
+        water_need = et0 * 1.0
+        water_need = np.where(temp > 30, water_need * 1.2, water_need)
+        water_need = np.where(hum < 30, water_need * 1.1, water_need)
+
+        # Sottrazione Pioggia (Efficiente al 80%)
+        water_need = water_need - rain * 0.8
+
+        # Limite fisico: l'acqua non può essere negativa
+        water_need = np.maximum(0.0, water_need)
+        water_need = np.maximum(0.0, water_need + rng.uniform(-0.1, 0.1, n_samples))
+
+        return np.column_stack([temp, hum, rain, et0]), water_need
+
+    def _save_artifacts(self, meta: dict):
+        """Salva una nuova versione (.pkl, .npz, metadati) e la rende attiva."""
+        save_version(self.model, self.scaler, meta, activate=True, service=self)
+
+    def train_model(self, n_samples=2000, version=None):
         """Esegue il TRAINING del modello e salva i file."""
+        from sklearn.neural_network import MLPRegressor
+        from sklearn.preprocessing import StandardScaler
+
         print("[ANFIS] Generazione dataset e training in corso...")
+
+        # Usiamo un MLPRegressor (Rete Neurale) per simulare l'apprendimento
+        self.model = MLPRegressor(
+            hidden_layer_sizes=(16, 8), 
+            activation='relu',
+            solver='adam',
+            max_iter=2000, 
+            random_state=42
+        )
+        self.scaler = StandardScaler()
         
         # 1. Genera dati
-        X_train, y_train = self.generate_synthetic_data()
+        X_train, y_train = self.generate_synthetic_data(n_samples, seed=42)
         
         # 2. Normalizzazione dei dati
         X_scaled = self.scaler.fit_transform(X_train)
         
         # 3. Addestra
         self.model.fit(X_scaled, y_train)
-        self.is_trained = True
-        
-        # 4. Salva
-        joblib.dump(self.model, MODEL_PATH)
-        joblib.dump(self.scaler, SCALER_PATH)
-        
         score = self.model.score(X_scaled, y_train)
+
+        # 4. Salva
+        self._save_artifacts({
+            "version": version or _version_tag(),
+            "trainedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": "synthetic",
+            "samples": int(n_samples),
+            "params": {"hidden_layer_sizes": list(self.model.hidden_layer_sizes), "learning_rate_init": self.model.learning_rate_init},
+            "metrics": {"trainR2": round(float(score), 4)},
+        })
+
         print(f"[ANFIS] Training completato. R^2 Score: {score:.4f}")
         return {"status": "success", "accuracy": score}
 
+    def search_hyperparameters(self, n_samples=200000, hidden_layers=SEARCH_HIDDEN_LAYERS,
+                               learning_rates=SEARCH_LEARNING_RATES, cv=5, n_jobs=-1, version=None):
+        """
+        Ricerca a griglia con cross-validation (tutti i core con n_jobs=-1) su architettura
+        e learning rate; il migliore per R^2 medio viene riaddestrato su tutto il dataset e salvato.
+        """
+        from sklearn.model_selection import GridSearchCV
+        from sklearn.neural_network import MLPRegressor
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler
+
+        t0 = time.perf_counter()
+        X, y = self.generate_synthetic_data(n_samples, seed=42)
+        print(f"[ANFIS] Dataset sintetico: {n_samples} campioni in {time.perf_counter() - t0:.2f}s")
+
+        pipe = Pipeline([
+            ("scaler", StandardScaler()),
+            ("mlp", MLPRegressor(activation="relu", solver="adam", max_iter=500,
+                                 early_stopping=True, random_state=42)),
+        ])
+        search = GridSearchCV(
+            pipe,
+            param_grid={
+                "mlp__hidden_layer_sizes": [tuple(h) for h in hidden_layers],
+                "mlp__learning_rate_init": list(learning_rates),
+            },
+            scoring={"r2": "r2", "rmse": "neg_root_mean_squared_error"},
+            refit="r2",
+            cv=cv,
+            n_jobs=n_jobs,
+            verbose=1,
+        )
+        search.fit(X, y)
+
+        best = search.best_index_
+        results = search.cv_results_
+        self.scaler = search.best_estimator_.named_steps["scaler"]
+        self.model = search.best_estimator_.named_steps["mlp"]
+
+        meta = {
+            "version": version or _version_tag(),
+            "trainedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": "synthetic",
+            "samples": int(n_samples),
+            "params": {
+                "hidden_layer_sizes": list(self.model.hidden_layer_sizes),
+                "learning_rate_init": self.model.learning_rate_init,
+            },
+            "metrics": {
+                "cvFolds": cv,
+                "cvR2": round(float(results["mean_test_r2"][best]), 4),
+                "cvR2Std": round(float(results["std_test_r2"][best]), 4),
+                "cvRmse": round(float(-results["mean_test_rmse"][best]), 4),
+            },
+            "candidates": [
+                {"params": {k.split("__", 1)[1]: (list(v) if isinstance(v, tuple) else v) for k, v in p.items()},
+                 "cvR2": round(float(r2), 4)}
+                for p, r2 in zip(results["params"], results["mean_test_r2"])
+            ],
+            "searchSeconds": round(time.perf_counter() - t0, 1),
+        }
+        self._save_artifacts(meta)
+
+        print(f"[ANFIS] Migliore: {meta['params']} → R^2 CV {meta['metrics']['cvR2']} "
+              f"(RMSE {meta['metrics']['cvRmse']}L), versione {meta['version']}")
+        return meta
+
     def predict(self, temp, humidity, rain, et0):
         """Usa il modello per prevedere l'irrigazione"""
         # Gestione valori None
@@ -111,18 +480,60 @@ class AnfisIrrigationModel:
         if rain is None: rain = 0.0
         if et0 is None: et0 = 3.0
 
-        if not self.is_trained:
-            print("[ANFIS] Modello non addestrato, uso fallback.")
+        # Modello non pronto: fallback esplicito sul bilancio ET0 - pioggia
+        if not self.ensure_loaded():
             return max(0.0, (et0 * 1.0) - rain)
 
-        # Prepara input
-        input_data = np.array([[temp, humidity, rain, et0]])
-        # Normalizza input usando lo stesso scaler del training
-        input_scaled = self.scaler.transform(input_data)
-        
-        # Predizione
-        prediction = self.model.predict(input_scaled)[0]
+        # Prepara input e predizione (scaling incluso nel kernel NumPy)
+        input_data = np.array([[temp, humidity, rain, et0]], dtype=float)
+        prediction = self.kernel.predict(input_data)[0]
         return max(0.0, round(prediction, 2))
 
+    def predict_many(self, temps, hums, rains, et0s) -> np.ndarray:
+        """
+        Come predict ma per N campioni in una sola passata: i None diventano i default
+        di predict, lo scaler e la rete vengono chiamati una volta sola sull'intera matrice.
+        Ritorna un array di N litri (arrotondati a 2 decimali, mai negativi).
+        """
+        X = np.array([temps, hums, rains, et0s], dtype=float).T.reshape(-1, 4)
+        if X.shape[0] == 0:
+            return np.zeros(0)
+
+        # Gestione valori None (NaN dopo la conversione), colonna per colonna
+        X = np.where(np.isnan(X), _INPUT_DEFAULTS, X)
+
+        if not self.ensure_loaded():
+            return np.maximum(0.0, X[:, 3] * 1.0 - X[:, 2])
+
+        predictions = self.kernel.predict(X)
+        return np.maximum(0.0, np.round(predictions, 2))
+
 # Istanza globale
-anfisService = AnfisIrrigationModel()
\ No newline at end of file
+anfisService = AnfisIrrigationModel()
+
+
+if __name__ == "__main__":
+    # python -m utils.ai_anfis_service train   → addestra e salva .pkl + .npz
+    # python -m utils.ai_anfis_service search  → ricerca iperparametri in CV e salva il migliore
+    # python -m utils.ai_anfis_service export  → rigenera anfis_model.npz dai .pkl
+    # python -m utils.ai_anfis_service grid    → precalcola la griglia del surrogato (ANFIS_SURROGATE=1)
+    cli = argparse.ArgumentParser(description="Strumenti modello ANFIS")
+    cli.add_argument("command", choices=["train", "search", "export", "grid"])
+    cli.add_argument("--samples", type=int, default=None, help="campioni sintetici (train: 2000, search: 200000)")
+    cli.add_argument("--cv", type=int, default=5, help="fold di cross-validation (search)")
+    cli.add_argument("--jobs", type=int, default=-1, help="processi paralleli, -1 = tutti i core (search)")
+    cli.add_argument("--tag", default=None, help="etichetta di versione del modello salvato")
+    cli.add_argument("--shape", default=None, help="punti per asse temp,umidità,pioggia,et0 (es. 46,31,51,41)")
+    args = cli.parse_args()
+    if args.command == "grid":
+        shape = tuple(int(n) for n in args.shape.split(",")) if args.shape else GRID_SHAPE
+        build_grid(NumpyMLP(NPZ_PATH), shape)
+    elif args.command == "train":
+        anfisService.train_model(n_samples=args.samples or 2000, version=args.tag)
+    elif args.command == "search":
+        anfisService.search_hyperparameters(n_samples=args.samples or 200000, cv=args.cv,
+                                            n_jobs=args.jobs, version=args.tag)
+    elif args.command == "export":
+        import joblib
+        export_npz(joblib.load(MODEL_PATH), joblib.load(SCALER_PATH))
+        print(f"[ANFIS] Esportato {NPZ_PATH}")
@@ -1,9 +1,14 @@
 import os
+import json
+import time
 import asyncio
 import logging
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
 from datetime import datetime
-import httpx
+
+from utils.ai_explanation_cache import get_cached_explanation, store_explanation
+from utils.ai_model_telemetry import record_call, record_cancelled, ranked_models, is_probe
+from utils.outbound import arequest, astream, remaining_time, OutboundError
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +23,25 @@ HF_FALLBACK_MODELS = [
     "google/gemini-2.0-pro-exp-02-05:free",             # Fallback 3
 ]
 
+# Hedging: se il modello in corso non risponde entro HEDGE_DELAY si avvia anche il successivo.
+# Oltre EXPLAIN_DEADLINE si rinuncia e si usa _fallback_text.
+HEDGE_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DELAY_SECONDS", "4"))
+EXPLAIN_DEADLINE_SECONDS = float(os.getenv("AI_EXPLAIN_DEADLINE_SECONDS", "30"))
+
+# Numero massimo di piante per prompt nelle analisi batch
+BATCH_MAX_PLANTS = int(os.getenv("AI_BATCH_MAX_PLANTS", "8"))
+# Un prompt batch genera ~350 token per pianta: la deadline cresce con il blocco, fino a BATCH_DEADLINE
+BATCH_DEADLINE_SECONDS = float(os.getenv("AI_BATCH_DEADLINE_SECONDS", "90"))
+BATCH_SECONDS_PER_PLANT = float(os.getenv("AI_BATCH_SECONDS_PER_PLANT", "7"))
+# Piante per blocco: quante ne stanno nella deadline batch (almeno 2, altrimenti non è un batch)
+BATCH_CHUNK_PLANTS = max(2, min(BATCH_MAX_PLANTS, int(
+    (BATCH_DEADLINE_SECONDS - EXPLAIN_DEADLINE_SECONDS) // max(BATCH_SECONDS_PER_PLANT, 1e-3))))
+
+
+def _batch_deadline(n_plants: int) -> float:
+    return min(BATCH_DEADLINE_SECONDS, EXPLAIN_DEADLINE_SECONDS + BATCH_SECONDS_PER_PLANT * n_plants)
+
+
 def _fmt(v, unit: Optional[str] = None):
     if v is None: return "n/d"
     try:
@@ -56,26 +80,38 @@ def _fallback_text(reason: str, decision: Dict[str, Any]) -> str:
     return f"💧 CONSIGLIO: {action}. (Analisi AI momentaneamente non disponibile: {reason})"
 
 
-def _prepare_prompt(plant: Dict[str, Any], agg: Dict[str, Any], decision: Dict[str, Any], now: datetime) -> str:
-    meta_wx = agg.get("weather") or {}
+def _fert_instruction(decision: Dict[str, Any]) -> str:
+    # Info Concimazione
+    fert_info = decision.get("debug_fertilizer_info") 
     
+    # Istruzione Concimazione
+    if fert_info:
+        return f"L'utente ha già concimato ({fert_info}). Rispondi: '🌿 CONCIMAZIONE: Non necessaria (Già effettuata: {fert_info}).'"
+    return "Nessuna concimazione recente. Consiglia una concimazione NPK equilibrata."
+
+
+def _weather_line(agg: Dict[str, Any], decision: Dict[str, Any]) -> str:
+    meta_wx = agg.get("weather") or {}
+    past_rain = _fmt(decision.get("debug_past_rain"), "mm")
+    future_rain = _fmt(decision.get("debug_future_rain"), "mm")
+    return f"{_fmt(meta_wx.get('temp'), '°C')}, Pioggia 5gg passati: {past_rain}, previsti: {future_rain}."
+
+
+_FORMAT_RULES = """[REGOLE RIGIDE DI FORMATTAZIONE]
+1. Usa SOLO ed ESCLUSIVAMENTE le emoji indicate nel formato qui sotto (💧, 🌿, 💡) all'inizio della riga.
+2. VIETATO inserire altre emoji (niente faccine, niente mani che salutano, niente frutti) all'interno delle frasi.
+3. Tono: Professionale, diretto, niente saluti iniziali (tipo "Ciao!"). Vai dritto al punto.
+4. Non usare termini tecnici complessi (no "ANFIS")."""
+
+
+def _prepare_prompt(plant: Dict[str, Any], agg: Dict[str, Any], decision: Dict[str, Any], now: datetime) -> str:
     rec = decision.get("recommendation")
     qty = decision.get("quantity", 0)
     
     # Dati Nascosti 
     calc_val = _fmt(decision.get("debug_anfis"), "L")
     user_water = _fmt(decision.get("debug_user_water"), "L")
-    past_rain = _fmt(decision.get("debug_past_rain"), "mm")
-    future_rain = _fmt(decision.get("debug_future_rain"), "mm")
-
-    # Info Concimazione
-    fert_info = decision.get("debug_fertilizer_info") 
-    
-    # Istruzione Concimazione
-    if fert_info:
-        fert_instr = f"L'utente ha già concimato ({fert_info}). Rispondi: '🌿 CONCIMAZIONE: Non necessaria (Già effettuata: {fert_info}).'"
-    else:
-        fert_instr = "Nessuna concimazione recente. Consiglia una concimazione NPK equilibrata."
+    fert_instr = _fert_instruction(decision)
 
     season = _get_season(now)
 
@@ -85,7 +121,7 @@ Sei un ASSISTENTE AGRONOMO professionale e sintetico.
 [DATI E CONDIZIONI]
 Pianta: {plant.get('name')}
 Stagione: {season}
-Meteo: {_fmt(meta_wx.get('temp'), '°C')}, Pioggia 5gg passati: {past_rain}, previsti: {future_rain}.
+Meteo: {_weather_line(agg, decision)}
 Acqua data oggi: {user_water}
 
 [RISULTATO ANALISI]
@@ -93,11 +129,7 @@ Acqua data oggi: {user_water}
 - Consiglio: {rec} (Qtà: {qty}L)
 - Istruzione Concimazione: {fert_instr}
 
-[REGOLE RIGIDE DI FORMATTAZIONE]
-1. Usa SOLO ed ESCLUSIVAMENTE le emoji indicate nel formato qui sotto (💧, 🌿, 💡) all'inizio della riga.
-2. VIETATO inserire altre emoji (niente faccine, niente mani che salutano, niente frutti) all'interno delle frasi.
-3. Tono: Professionale, diretto, niente saluti iniziali (tipo "Ciao!"). Vai dritto al punto.
-4. Non usare termini tecnici complessi (no "ANFIS").
+{_FORMAT_RULES}
 
 FORMATO RISPOSTA OBBLIGATORIO:
 💧 IRRIGAZIONE: [Testo del consiglio, senza emoji aggiuntive]
@@ -106,11 +138,80 @@ FORMATO RISPOSTA OBBLIGATORIO:
 """.strip()
 
 
-async def _call_hf_text_generation_async(model: str, prompt: str) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+def _prepare_batch_prompt(entries: List[Dict[str, Any]], now: datetime) -> str:
+    """
+    Un solo prompt per più piante: blocco meteo condiviso (se identico) e una scheda per pianta.
+    La risposta attesa è un oggetto JSON {plantId: testo}.
+    """
+    weather_lines = {_weather_line(e["agg"], e["decision"]) for e in entries}
+    shared_weather = weather_lines.pop() if len(weather_lines) == 1 else None
+
+    cards = []
+    for e in entries:
+        decision = e["decision"]
+        lines = [f"### ID: {e['id']}", f"Pianta: {e['plant'].get('name')}"]
+        if not shared_weather:
+            lines.append(f"Meteo: {_weather_line(e['agg'], decision)}")
+        lines += [
+            f"Acqua data oggi: {_fmt(decision.get('debug_user_water'), 'L')}",
+            f"- Fabbisogno calcolato: {_fmt(decision.get('debug_anfis'), 'L')}",
+            f"- Consiglio: {decision.get('recommendation')} (Qtà: {decision.get('quantity', 0)}L)",
+            f"- Istruzione Concimazione: {_fert_instruction(decision)}",
+        ]
+        cards.append("\n".join(lines))
+
+    weather_block = f"Meteo (uguale per tutte le piante): {shared_weather}\n" if shared_weather else ""
+    ids = ", ".join(f'"{e["id"]}"' for e in entries)
+    cards_block = "\n\n".join(cards)
+
+    return f"""
+Sei un ASSISTENTE AGRONOMO professionale e sintetico. Analizza separatamente ciascuna pianta.
+
+[DATI COMUNI]
+Stagione: {_get_season(now)}
+{weather_block}
+[PIANTE]
+{cards_block}
+
+{_FORMAT_RULES}
+
+FORMATO RISPOSTA OBBLIGATORIO:
+Rispondi SOLO con un oggetto JSON valido, senza testo prima o dopo, con esattamente queste chiavi: {ids}.
+Il valore di ogni chiave è una stringa di tre righe separate da \\n:
+💧 IRRIGAZIONE: [Testo del consiglio, senza emoji aggiuntive]
+🌿 CONCIMAZIONE: [Testo del consiglio, senza emoji aggiuntive]
+💡 NOTE: [Breve nota tecnica, senza emoji aggiuntive]
+""".strip()
+
+
+def _parse_batch_response(text: str, ids: List[str]) -> Dict[str, str]:
+    """Estrae {plantId: testo} dalla risposta JSON; le chiavi mancanti o vuote vengono ignorate."""
+    if not text:
+        return {}
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        logger.warning("⚠️ Risposta batch non è JSON valido")
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    out = {}
+    for pid in ids:
+        val = data.get(pid)
+        if isinstance(val, str) and val.strip():
+            out[pid] = val.strip()
+    return out
+
+
+def _build_request(model: str, prompt: str, stream: bool = False,
+                   max_tokens: int = 800) -> Tuple[Optional[Dict[str, str]], Dict[str, Any]]:
     api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("HF_API_KEY")
     if not api_key:
-        logger.error("❌ Nessuna API key trovata (OPENROUTER_API_KEY o HF_API_KEY)")
-        return None, None, "No Key"
+        return None, {}
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -126,58 +227,324 @@ async def _call_hf_text_generation_async(model: str, prompt: str) -> Tuple[Optio
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.3, 
-        "max_tokens": 800
+        "max_tokens": max_tokens
     }
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+
+# Sonde di modelli esclusi ancora in corso dopo la fine dell'hedging (riferimenti forti per il GC)
+_PROBE_TASKS: Set[asyncio.Task] = set()
+
+
+def _provider(model: str) -> str:
+    # Un circuit breaker per modello: i 429 dei modelli free sono per modello e non devono fermare gli altri
+    return f"openrouter:{model}"
+
+
+async def _call_hf_text_generation_async(model: str, prompt: str,
+                                        max_tokens: int = 800) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    headers, payload = _build_request(model, prompt, max_tokens=max_tokens)
+    if not headers:
+        logger.error("❌ Nessuna API key trovata (OPENROUTER_API_KEY o HF_API_KEY)")
+        return None, None, "No Key"
 
     try:
         logger.info(f"🔄 Tentativo con modello: {model}")
-        async with httpx.AsyncClient(timeout=45.0) as cli:
-            r = await cli.post(HF_API_URL, headers=headers, json=payload)
-            
-            if r.status_code == 200:
-                j = r.json()
-                content = j.get("choices", [])[0].get("message", {}).get("content")
-                tokens = j.get("usage", {}).get("total_tokens")
-                
-                if content:
-                    logger.info(f"✅ SUCCESSO con modello: {model} (tokens: {tokens})")
-                    return content.strip(), tokens, None
-                else:
-                    logger.warning(f"⚠️ Modello {model} - Risposta vuota")
-                    return None, None, "Empty response"
+        r = await arequest(_provider(model), "POST", HF_API_URL, timeout=45.0, headers=headers, json=payload)
+
+        if r.status_code == 200:
+            j = r.json()
+            content = j.get("choices", [])[0].get("message", {}).get("content")
+            tokens = j.get("usage", {}).get("total_tokens")
+
+            if content:
+                logger.info(f"✅ SUCCESSO con modello: {model} (tokens: {tokens})")
+                return content.strip(), tokens, None
             else:
+                logger.warning(f"⚠️ Modello {model} - Risposta vuota")
+                return None, None, "Empty response"
+        else:
+            error_msg = f"Status {r.status_code}"
+            logger.warning(f"⚠️ Modello {model} fallito: {error_msg}")
+            logger.debug(f"Response body: {r.text[:200]}")
+            return None, None, error_msg
+
+    except OutboundError:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Errore con {model}: {str(e)}")
+        return None, None, str(e)
+
+
+async def _stream_hf_text_generation_async(model: str, prompt: str,
+                                          on_token: Callable[[str], None]) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """
+    Variante streaming (stream: true): passa ogni frammento a 'on_token' appena arriva
+    e ritorna il testo completo come _call_hf_text_generation_async.
+    """
+    headers, payload = _build_request(model, prompt, stream=True)
+    if not headers:
+        logger.error("❌ Nessuna API key trovata (OPENROUTER_API_KEY o HF_API_KEY)")
+        return None, None, "No Key"
+
+    parts: List[str] = []
+    tokens = None
+    try:
+        logger.info(f"🔄 Tentativo (stream) con modello: {model}")
+        async with astream(_provider(model), "POST", HF_API_URL, timeout=45.0, headers=headers, json=payload) as r:
+            if r.status_code != 200:
                 error_msg = f"Status {r.status_code}"
                 logger.warning(f"⚠️ Modello {model} fallito: {error_msg}")
-                logger.debug(f"Response body: {r.text[:200]}")
                 return None, None, error_msg
-                
+
+            async for line in r.aiter_lines():
+                # Righe SSE: "data: {...}"; i commenti (": OPENROUTER PROCESSING") si ignorano
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    j = json.loads(data)
+                except ValueError:
+                    continue
+                tokens = (j.get("usage") or {}).get("total_tokens", tokens)
+                choices = j.get("choices") or []
+                chunk = (choices[0].get("delta") or {}).get("content") if choices else None
+                if chunk:
+                    parts.append(chunk)
+                    on_token(chunk)
+
+    except OutboundError:
+        raise
     except Exception as e:
         logger.error(f"❌ Errore con {model}: {str(e)}")
+        if not parts:
+            return None, None, str(e)
+        # Stream interrotto a metà: il testo parziale è già arrivato al client
+
+    text = "".join(parts).strip()
+    if not text:
+        logger.warning(f"⚠️ Modello {model} - Risposta vuota")
+        return None, None, "Empty response"
+    logger.info(f"✅ SUCCESSO (stream) con modello: {model} (tokens: {tokens})")
+    return text, tokens, None
+
+
+async def _tracked_call(model: str, prompt: str, on_token: Optional[Callable[[str], None]] = None,
+                        max_tokens: int = 800) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """
+    Chiamata al modello con registrazione di esito, latenza e token. Non contano le cancellazioni
+    né le chiamate saltate (circuito aperto, tempo della richiesta esaurito): non dicono nulla sul modello.
+    """
+    started = time.monotonic()
+    try:
+        if on_token:
+            text, tokens, err = await _stream_hf_text_generation_async(model, prompt, on_token)
+        else:
+            text, tokens, err = await _call_hf_text_generation_async(model, prompt, max_tokens)
+    except asyncio.CancelledError:
+        # Hedging perso: il modello era ancora in corsa, la latenza vale almeno il tempo trascorso
+        record_cancelled(model, time.monotonic() - started)
+        raise
+    except OutboundError as e:
+        logger.info(f"⏭️ Modello {model} saltato: {e}")
         return None, None, str(e)
+    record_call(model, ok=bool(text), latency=time.monotonic() - started, tokens=tokens, err=err)
+    return text, tokens, err
+
 
+async def _hedged_generation(models: List[str], prompt: str, hedge_delay: float = None, deadline: float = None,
+                             on_token: Optional[Callable[[str], None]] = None,
+                             max_tokens: int = 800) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """
+    Avvia il primo modello; se entro 'hedge_delay' non arriva risposta (o arriva un errore)
+    avvia anche il successivo. Vince la prima risposta valida, le altre richieste vengono cancellate.
+    Ritorna (testo, tokens, modello) oppure (None, None, None) allo scadere di 'deadline'.
 
-async def explain_irrigation_async(*, plant: Dict[str, Any], agg: Dict[str, Any], decision: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    Con 'on_token' le chiamate sono in streaming: vince il primo modello che emette un token,
+    e da quel momento la deadline non interrompe più lo stream in corso.
+
+    Un modello in prova (is_probe) parte insieme al primo e non viene cancellato: se un altro
+    vince, la sonda finisce in background e registra comunque il suo esito nella telemetria.
+    """
+    hedge_delay = HEDGE_DELAY_SECONDS if hedge_delay is None else hedge_delay
+    deadline = EXPLAIN_DEADLINE_SECONDS if deadline is None else deadline
+    # Mai oltre il tempo rimasto alla richiesta che ci ha chiamato
+    budget = remaining_time()
+    if budget is not None:
+        deadline = min(deadline, budget)
+
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+    queue = list(models)
+    running: Dict[asyncio.Task, str] = {}
+    probes: Set[asyncio.Task] = set()
+    owner: Dict[str, Optional[str]] = {"model": None}
+
+    def _forward(model: str) -> Callable[[str], None]:
+        def _cb(chunk: str):
+            if owner["model"] is None:
+                # Primo token: questo modello si aggiudica lo stream, gli altri vengono cancellati
+                owner["model"] = model
+                for t, m in running.items():
+                    if m != model and t not in probes:
+                        t.cancel()
+            if owner["model"] == model:
+                on_token(chunk)
+        return _cb
+
+    def _launch_next():
+        model = queue.pop(0)
+        logger.info(f"📡 [{len(models) - len(queue)}/{len(models)}] Avvio modello: {model}")
+        cb = _forward(model) if on_token else None
+        task = asyncio.create_task(_tracked_call(model, prompt, cb, max_tokens))
+        running[task] = model
+        if is_probe(model):
+            probes.add(task)
+
+    _launch_next()
+    if queue and is_probe(queue[0]):
+        # Sonda: subito, senza aspettare che il primo modello rallenti
+        _launch_next()
+    try:
+        while running:
+            remaining = expires_at - loop.time()
+            if owner["model"] is None and remaining <= 0:
+                logger.warning(f"⏱️ Deadline di {deadline:.1f}s superata")
+                break
+
+            if owner["model"] is not None:
+                wait_for = None
+            else:
+                wait_for = min(hedge_delay, remaining) if queue else remaining
+            done, _ = await asyncio.wait(running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                # Nessuna risposta entro l'hedge delay: si affianca il modello successivo
+                if queue and owner["model"] is None:
+                    _launch_next()
+                continue
+
+            for task in done:
+                model = running.pop(task)
+                if task.cancelled():
+                    continue
+                text, tokens, err = task.result()
+                if text:
+                    return text, tokens, model
+                logger.warning(f"⏭️ Modello {model} fallito (errore: {err})")
+                if queue and owner["model"] is None and task not in probes:
+                    _launch_next()
+    finally:
+        for task in running:
+            if task in probes:
+                _PROBE_TASKS.add(task)
+                task.add_done_callback(_PROBE_TASKS.discard)
+            else:
+                task.cancel()
+
+    return None, None, None
+
+
+async def explain_irrigation_async(*, plant: Dict[str, Any], agg: Dict[str, Any], decision: Dict[str, Any], now: datetime,
+                                   on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Genera la spiegazione LLM della decisione irrigua.
+    Se 'on_token' è fornito il testo viene anche inoltrato a frammenti man mano che arriva (SSE).
+    """
     api_key = os.getenv("HF_API_KEY") or os.getenv("OPENROUTER_API_KEY")
     if not api_key:
         logger.error("❌ Manca API Key nel .env")
         return {"text": _fallback_text("Manca API Key", decision), "usedLLM": False}
 
-    logger.info(f"🚀 Inizio ciclo fallback con {len(HF_FALLBACK_MODELS)} modelli")
     prompt = _prepare_prompt(plant, agg, decision, now)
-    
-    for i, model in enumerate(HF_FALLBACK_MODELS, 1):
-        logger.info(f"📡 [{i}/{len(HF_FALLBACK_MODELS)}] Provo modello: {model}")
-        text, tokens, err = await _call_hf_text_generation_async(model, prompt)
-        
-        if text:
-            logger.info(f"🎉 SUCCESS! Modello {model} ha risposto correttamente!")
-            return {"text": text, "usedLLM": True, "model": model, "tokens": tokens}
-        
-        logger.warning(f"⏭️ Passo al prossimo modello (errore: {err})")
-        await asyncio.sleep(1)
+
+    # Prompt identici (stesse condizioni) -> stessa risposta: niente chiamata OpenRouter
+    cached = get_cached_explanation(HF_FALLBACK_MODELS, prompt)
+    if cached:
+        logger.info(f"♻️ Spiegazione servita dalla cache (modello: {cached.get('model')})")
+        if on_token:
+            on_token(cached["text"])
+        return {**cached, "usedLLM": True, "cached": True}
+
+    # Ordine dinamico: i modelli in errore (es. 429 continui) scendono o vengono esclusi
+    models = ranked_models(HF_FALLBACK_MODELS)
+    logger.info(f"🚀 Inizio fallback con hedging su {len(models)} modelli: {models}")
+    text, tokens, model = await _hedged_generation(models, prompt, on_token=on_token)
+
+    if text:
+        logger.info(f"🎉 SUCCESS! Modello {model} ha risposto correttamente!")
+        store_explanation(model, prompt, text, tokens)
+        return {"text": text, "usedLLM": True, "model": model, "tokens": tokens}
 
     logger.error("❌ TUTTI I MODELLI HANNO FALLITO - Uso fallback testuale")
     return {"text": _fallback_text("Server occupati", decision), "usedLLM": False}
 
 
+async def explain_irrigation_batch_async(entries: List[Dict[str, Any]], now: datetime) -> Dict[str, Dict[str, Any]]:
+    """
+    Spiegazioni per più piante con un solo prompt strutturato (a blocchi di BATCH_CHUNK_PLANTS,
+    ciascuno con una deadline proporzionale al numero di piante).
+    entries: [{"id", "plant", "agg", "decision"}]. Ritorna {id: report}.
+    Le piante già in cache non entrano nel prompt; quelle saltate dal modello
+    ripiegano su explain_irrigation_async singole.
+    """
+    reports: Dict[str, Dict[str, Any]] = {}
+    api_key = os.getenv("HF_API_KEY") or os.getenv("OPENROUTER_API_KEY")
+    todo = []
+
+    for e in entries:
+        if not api_key:
+            reports[e["id"]] = {"text": _fallback_text("Manca API Key", e["decision"]), "usedLLM": False}
+            continue
+        cached = get_cached_explanation(HF_FALLBACK_MODELS, _prepare_prompt(e["plant"], e["agg"], e["decision"], now))
+        if cached:
+            reports[e["id"]] = {**cached, "usedLLM": True, "cached": True}
+        else:
+            todo.append(e)
+
+    for i in range(0, len(todo), BATCH_CHUNK_PLANTS):
+        chunk = todo[i:i + BATCH_CHUNK_PLANTS]
+        if len(chunk) < 2:
+            continue
+        ids = [e["id"] for e in chunk]
+        prompt = _prepare_batch_prompt(chunk, now)
+
+        # In cache sotto il prompt batch: il testo di un prompt multi-pianta non risponde a quello singolo
+        cached = get_cached_explanation(HF_FALLBACK_MODELS, prompt)
+        if cached:
+            text, model = cached["text"], cached.get("model")
+            logger.info(f"♻️ Batch di {len(chunk)} piante servito dalla cache (modello: {model})")
+        else:
+            models = ranked_models(HF_FALLBACK_MODELS)
+            logger.info(f"📦 Prompt batch per {len(chunk)} piante su {len(models)} modelli")
+            text, tokens, model = await _hedged_generation(models, prompt, deadline=_batch_deadline(len(chunk)),
+                                                           max_tokens=min(4000, 350 * len(chunk)))
+        parsed = _parse_batch_response(text, ids)
+        logger.info(f"📦 Batch: {len(parsed)}/{len(chunk)} piante spiegate (modello: {model})")
+        if parsed and not cached:
+            store_explanation(model, prompt, text, tokens)
+
+        for e in chunk:
+            pid = e["id"]
+            if pid in parsed:
+                reports[pid] = {"text": parsed[pid], "usedLLM": True, "model": model, "batched": True,
+                                **({"cached": True} if cached else {})}
+
+    missing = [e for e in todo if e["id"] not in reports]
+    if missing:
+        logger.info(f"↩️ {len(missing)} piante senza risposta batch: chiamate singole")
+        singles = await asyncio.gather(*[
+            explain_irrigation_async(plant=e["plant"], agg=e["agg"], decision=e["decision"], now=now)
+            for e in missing
+        ])
+        for e, report in zip(missing, singles):
+            reports[e["id"]] = report
+
+    return reports
+
+
 get_ai_explanation = explain_irrigation_async
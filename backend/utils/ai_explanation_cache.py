@@ -0,0 +1,132 @@
+import os
+import re
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+from pymongo import ASCENDING, errors
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Config da ENV (TTL = 0 disabilita la cache)
+_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "21600"))   # 6 ore
+_CACHE_MAX_ITEMS = int(os.getenv("AI_CACHE_MAX_ITEMS", "512"))         # voci in memoria
+
+cache_collection = db["ai_explanation_cache"]
+
+# LRU in memoria davanti a Mongo: key -> {"value": {...}, "expires_at": ts}
+_LRU: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+_STATS = {"memoryHits": 0, "mongoHits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Spazi multipli e righe vuote non cambiano la risposta del modello."""
+    return re.sub(r"\s+", " ", (prompt or "")).strip()
+
+
+def cache_key(model: str, prompt: str) -> str:
+    raw = f"{model}\n{_normalize_prompt(prompt)}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _enabled() -> bool:
+    return _CACHE_TTL_SECONDS > 0
+
+
+def _lru_get(key: str) -> Optional[Dict[str, Any]]:
+    entry = _LRU.get(key)
+    if entry is None:
+        return None
+    if time.time() > entry["expires_at"]:
+        _LRU.pop(key, None)
+        return None
+    _LRU.move_to_end(key)
+    return entry["value"]
+
+
+def _lru_put(key: str, value: Dict[str, Any], expires_at: float):
+    _LRU[key] = {"value": value, "expires_at": expires_at}
+    _LRU.move_to_end(key)
+    while len(_LRU) > _CACHE_MAX_ITEMS:
+        _LRU.popitem(last=False)
+
+
+def get_cached_explanation(models: List[str], prompt: str) -> Optional[Dict[str, Any]]:
+    """
+    Cerca una risposta già generata per il prompt con uno dei modelli indicati
+    (in ordine di preferenza). Prima la LRU in memoria, poi Mongo.
+    """
+    if not _enabled():
+        return None
+
+    keys = [cache_key(m, prompt) for m in models]
+    for key in keys:
+        hit = _lru_get(key)
+        if hit:
+            _STATS["memoryHits"] += 1
+            return hit
+
+    try:
+        docs = {
+            d["_id"]: d for d in cache_collection.find(
+                {"_id": {"$in": keys}, "expiresAt": {"$gt": datetime.utcnow()}}
+            )
+        }
+    except errors.PyMongoError as e:
+        _STATS["errors"] += 1
+        logger.warning(f"⚠️ Cache AI non raggiungibile: {e}")
+        docs = {}
+
+    for key in keys:
+        doc = docs.get(key)
+        if doc:
+            value = {"text": doc["text"], "model": doc.get("model"), "tokens": doc.get("tokens")}
+            remaining = (doc["expiresAt"] - datetime.utcnow()).total_seconds()
+            _lru_put(key, value, time.time() + max(0.0, remaining))
+            _STATS["mongoHits"] += 1
+            return value
+
+    _STATS["misses"] += 1
+    return None
+
+
+def store_explanation(model: str, prompt: str, text: str, tokens: Optional[int] = None):
+    if not _enabled() or not text:
+        return
+
+    key = cache_key(model, prompt)
+    value = {"text": text, "model": model, "tokens": tokens}
+    _lru_put(key, value, time.time() + _CACHE_TTL_SECONDS)
+    _STATS["stores"] += 1
+
+    now = datetime.utcnow()
+    try:
+        cache_collection.update_one(
+            {"_id": key},
+            {"$set": {**value, "createdAt": now, "expiresAt": now + timedelta(seconds=_CACHE_TTL_SECONDS)}},
+            upsert=True
+        )
+    except errors.PyMongoError as e:
+        _STATS["errors"] += 1
+        logger.warning(f"⚠️ Salvataggio cache AI fallito: {e}")
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    hits = _STATS["memoryHits"] + _STATS["mongoHits"]
+    lookups = hits + _STATS["misses"]
+    return {
+        **_STATS,
+        "hitRate": round(hits / lookups, 3) if lookups else 0.0,
+        "memoryItems": len(_LRU),
+        "ttlSeconds": _CACHE_TTL_SECONDS,
+    }
+
+
+def ensure_cache_indexes():
+    # TTL nativo di Mongo: elimina i documenti appena superano expiresAt
+    cache_collection.create_index([("expiresAt", ASCENDING)], expireAfterSeconds=0, name="ttl_ai_cache")
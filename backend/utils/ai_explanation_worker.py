@@ -0,0 +1,287 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Set, List, AsyncIterator
+from datetime import datetime, timedelta
+from pymongo.collection import Collection
+
+from utils.ai_explainer_service import explain_irrigation_async, explain_irrigation_batch_async, _fallback_text
+from utils.outbound import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+# Stati della spiegazione LLM salvati in ai_analysis_report.explanationStatus
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+# Config da ENV
+EXPLAIN_CONCURRENCY = int(os.getenv("AI_EXPLAIN_CONCURRENCY", "4"))
+EXPLAIN_STALE_SECONDS = int(os.getenv("AI_EXPLAIN_STALE_SECONDS", "300"))
+# SSE senza job in questo processo: attesa massima leggendo il documento
+STREAM_WAIT_SECONDS = float(os.getenv("AI_STREAM_WAIT_SECONDS", "120"))
+STREAM_POLL_SECONDS = 1.0
+
+# Riferimenti forti ai task in corso (altrimenti il GC può cancellarli)
+_RUNNING: Set[asyncio.Task] = set()
+_SEMAPHORE: Optional[asyncio.Semaphore] = None
+
+
+class _JobStream:
+    """Inoltra i token di un job in corso a tutti i client SSE collegati."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.parts: List[str] = []
+        self.report: Optional[Dict[str, Any]] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    def push(self, chunk: str):
+        self.parts.append(chunk)
+        for q in self._subscribers:
+            q.put_nowait(chunk)
+
+    def finish(self, report: Optional[Dict[str, Any]]):
+        self.report = report
+        for q in self._subscribers:
+            q.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue()
+        # Chi si collega a metà riceve subito il testo già generato
+        if self.parts:
+            q.put_nowait("".join(self.parts))
+        if self.report is not None:
+            q.put_nowait(None)
+        self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        if q in self._subscribers:
+            self._subscribers.remove(q)
+
+
+# Stream dei job in corso, per documento (str(_id))
+_STREAMS: Dict[str, _JobStream] = {}
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _SEMAPHORE
+    if _SEMAPHORE is None:
+        _SEMAPHORE = asyncio.Semaphore(EXPLAIN_CONCURRENCY)
+    return _SEMAPHORE
+
+
+def _pending_report(decision: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+    return {
+        "text": None,
+        "usedLLM": False,
+        "explanationStatus": STATUS_PENDING,
+        "jobId": job_id,
+        "recommendation": decision.get("recommendation"),
+        "requestedAt": datetime.utcnow(),
+    }
+
+
+async def _run_job(collection: Collection, oid, job_id: str, stream: _JobStream, *, plant: Dict[str, Any],
+                   agg: Dict[str, Any], decision: Dict[str, Any], now: datetime):
+    report: Optional[Dict[str, Any]] = None
+    try:
+        async with _semaphore():
+            try:
+                report = await explain_irrigation_async(
+                    plant=plant, agg=agg, decision=decision, now=now, on_token=stream.push
+                )
+                # Testo di ripiego (nessun modello ha risposto): non è una spiegazione LLM conclusa
+                report["explanationStatus"] = STATUS_READY if report.get("usedLLM") else STATUS_FAILED
+            except Exception as e:
+                logger.error(f"❌ Spiegazione AI fallita per {oid}: {e}")
+                report = {
+                    "text": _fallback_text("Errore interno", decision),
+                    "usedLLM": False,
+                    "explanationStatus": STATUS_FAILED,
+                }
+
+        report["jobId"] = job_id
+        report["recommendation"] = decision.get("recommendation")
+        report["completedAt"] = datetime.utcnow()
+
+        # Scrive solo se nel frattempo non è partita un'analisi più recente
+        res = collection.update_one(
+            {"_id": oid, "ai_analysis_report.jobId": job_id},
+            {"$set": {"ai_analysis_report": report}}
+        )
+        if res.matched_count == 0:
+            logger.info(f"⏭️ Job {job_id} superato da un'analisi più recente, risultato scartato")
+    finally:
+        stream.finish(report)
+        if _STREAMS.get(str(oid)) is stream:
+            del _STREAMS[str(oid)]
+
+
+def schedule_explanation(collection: Collection, oid, *, plant: Dict[str, Any], agg: Dict[str, Any],
+                         decision: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """
+    Salva subito un report 'pending' e avvia la generazione LLM in background.
+    Ritorna il report pending da restituire al client.
+    """
+    job_id = uuid.uuid4().hex
+    report = _pending_report(decision, job_id)
+
+    if oid is None:
+        # Nessun documento su cui scrivere: la spiegazione non sarebbe mai recuperabile
+        report["text"] = _fallback_text("ID pianta non valido", decision)
+        report["explanationStatus"] = STATUS_FAILED
+        return report
+
+    collection.update_one({"_id": oid}, {"$set": {"ai_analysis_report": report}})
+
+    stream = _JobStream(job_id)
+    _STREAMS[str(oid)] = stream
+    # Il task copia il contesto corrente: senza detach erediterebbe la deadline della richiesta
+    with deadline_scope(None, detach=True):
+        task = asyncio.create_task(
+            _run_job(collection, oid, job_id, stream, plant=plant, agg=agg, decision=decision, now=now)
+        )
+    _RUNNING.add(task)
+    task.add_done_callback(_RUNNING.discard)
+    return report
+
+
+async def _run_batch_job(collection: Collection, jobs: List[Dict[str, Any]], now: datetime):
+    entries = [{"id": str(j["oid"]), **j} for j in jobs]
+    reports: Dict[str, Dict[str, Any]] = {}
+    try:
+        async with _semaphore():
+            try:
+                reports = await explain_irrigation_batch_async(entries, now)
+            except Exception as e:
+                logger.error(f"❌ Spiegazione AI batch fallita: {e}")
+
+        for e in entries:
+            report = reports.get(e["id"])
+            if report:
+                report["explanationStatus"] = STATUS_READY if report.get("usedLLM") else STATUS_FAILED
+            else:
+                report = {
+                    "text": _fallback_text("Errore interno", e["decision"]),
+                    "usedLLM": False,
+                    "explanationStatus": STATUS_FAILED,
+                }
+            report["jobId"] = e["jobId"]
+            report["recommendation"] = e["decision"].get("recommendation")
+            report["completedAt"] = datetime.utcnow()
+            reports[e["id"]] = report
+            collection.update_one(
+                {"_id": e["oid"], "ai_analysis_report.jobId": e["jobId"]},
+                {"$set": {"ai_analysis_report": report}}
+            )
+    finally:
+        for e in entries:
+            stream = e["stream"]
+            stream.finish(reports.get(e["id"]))
+            if _STREAMS.get(e["id"]) is stream:
+                del _STREAMS[e["id"]]
+
+
+def schedule_batch_explanation(collection: Collection, jobs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Come schedule_explanation ma per più piante: un solo job in background
+    genera tutte le spiegazioni con prompt multi-pianta.
+    jobs: [{"oid", "resultId", "plant", "agg", "decision", "now"}]. Ritorna {resultId: report}
+    (resultId = id della pianta nella risposta, str(oid) se manca): pending, oppure failed se l'ID non è valido.
+    """
+    reports: Dict[str, Dict[str, Any]] = {}
+    valid = []
+    for job in jobs:
+        job_id = uuid.uuid4().hex
+        report = _pending_report(job["decision"], job_id)
+        if job.get("oid") is None:
+            report["text"] = _fallback_text("ID pianta non valido", job["decision"])
+            report["explanationStatus"] = STATUS_FAILED
+            if job.get("resultId"):
+                reports[job["resultId"]] = report
+            continue
+
+        collection.update_one({"_id": job["oid"]}, {"$set": {"ai_analysis_report": report}})
+        stream = _JobStream(job_id)
+        _STREAMS[str(job["oid"])] = stream
+        valid.append({**job, "jobId": job_id, "stream": stream})
+        reports[job.get("resultId") or str(job["oid"])] = report
+
+    if valid:
+        with deadline_scope(None, detach=True):
+            task = asyncio.create_task(_run_batch_job(collection, valid, valid[0]["now"]))
+        _RUNNING.add(task)
+        task.add_done_callback(_RUNNING.discard)
+    return reports
+
+
+def get_explanation_status(collection: Collection, oid) -> Optional[Dict[str, Any]]:
+    """
+    Stato corrente della spiegazione per il polling del frontend.
+    Ritorna None se il documento non esiste.
+    """
+    doc = collection.find_one({"_id": oid}, {"ai_analysis_report": 1})
+    if not doc:
+        return None
+
+    report = doc.get("ai_analysis_report") or {}
+    status = report.get("explanationStatus")
+    if status is None:
+        # Report salvati prima dell'elaborazione asincrona
+        status = STATUS_READY if report.get("text") else None
+
+    # Job perso (es. riavvio del server durante la generazione)
+    requested_at = report.get("requestedAt")
+    if status == STATUS_PENDING and isinstance(requested_at, datetime):
+        if datetime.utcnow() - requested_at > timedelta(seconds=EXPLAIN_STALE_SECONDS):
+            status = STATUS_FAILED
+            report = {**report, "text": _fallback_text("Analisi scaduta", report), "explanationStatus": status}
+
+    return {"explanationStatus": status, "ai_analysis_report": report}
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_explanation_events(collection: Collection, oid) -> AsyncIterator[str]:
+    """
+    Eventi SSE per la spiegazione di un documento:
+    - 'token' {text} per ogni frammento generato dal job in corso;
+    - 'done' {explanationStatus, ai_analysis_report} solo con stato finale (ready/failed).
+    Se il job non gira in questo processo (altro worker uvicorn, stream già chiuso) si legge
+    il documento ogni STREAM_POLL_SECONDS; oltre STREAM_WAIT_SECONDS lo stream si chiude
+    senza 'done' e il client ripiega sul polling.
+    """
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + STREAM_WAIT_SECONDS
+    relayed = None
+    while True:
+        stream = _STREAMS.get(str(oid))
+        if stream is not None and stream is not relayed:
+            relayed = stream
+            q = stream.subscribe()
+            try:
+                while True:
+                    chunk = await q.get()
+                    if chunk is None:
+                        break
+                    yield _sse("token", {"text": chunk})
+            finally:
+                stream.unsubscribe(q)
+            report = stream.report
+            if report is not None:
+                yield _sse("done", {"explanationStatus": report.get("explanationStatus"), "ai_analysis_report": report})
+                return
+
+        status = await loop.run_in_executor(None, get_explanation_status, collection, oid)
+        if status is None or status.get("explanationStatus") != STATUS_PENDING:
+            yield _sse("done", status or {"explanationStatus": None})
+            return
+        if loop.time() >= expires_at:
+            return
+        await asyncio.sleep(STREAM_POLL_SECONDS)
@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence
+import os
+import json
 import math
+import numpy as np
 
 # Helpers: fuzzy membership
 
@@ -31,6 +34,19 @@ def trap(x, a, b, c, d):
 def clamp01(v):
     return max(0.0, min(1.0, float(v)))
 
+# Versioni NumPy: stessa aritmetica dei casi scalari, NaN = valore mancante (None)
+def tri_np(x: np.ndarray, a, b, c) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(x < b, (x - a) / (b - a + 1e-9), (c - x) / (c - b + 1e-9))
+    out = np.where(x == b, 1.0, out)
+    return np.where((x <= a) | (x >= c) | np.isnan(x), 0.0, out)
+
+def trap_np(x: np.ndarray, a, b, c, d) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(x < b, (x - a) / (b - a + 1e-9), (d - x) / (d - c + 1e-9))
+    out = np.where((x >= b) & (x <= c), 1.0, out)
+    return np.where((x <= a) | (x >= d) | np.isnan(x), 0.0, out)
+
 # Baseline per stage (fallback)
 def baseline_from_stage(stage: Optional[str]) -> int:
     """
@@ -72,6 +88,43 @@ def _days_since_last(last_dt: Optional[datetime], now: datetime) -> Optional[int
         return None
 
 # Fuzzification
+# Variabile -> (segnale di input, [(termine, funzione, parametri)])
+MEMBERSHIPS = {
+    # Suolo (in %, 0..100)
+    "soil": ("soilMoisture", [
+        ("dry",   "trap", (0, 15, 30, 45)),
+        ("moist", "tri",  (35, 55, 75)),
+        ("wet",   "trap", (70, 80, 100, 110)),
+    ]),
+    # Pioggia (mm / 24h)
+    "rain": ("rainNext24h", [
+        ("low",    "trap", (-1, 0, 1.5, 2.5)),
+        ("medium", "tri",  (2.0, 3.5, 5.0)),
+        ("high",   "trap", (4.0, 6.0, 10.0, 20.0)),
+    ]),
+    # Rapporto giorni/intervallo (daysSinceLast / baselineInterval)
+    "ratio": ("ratio", [
+        ("early",   "trap", (-0.1, 0.0, 0.6, 0.8)),
+        ("due",     "tri",  (0.8, 1.0, 1.2)),
+        ("overdue", "trap", (1.0, 1.3, 2.0, 3.0)),
+    ]),
+    # Temperatura (°C)
+    "temp": ("temp", [
+        ("low",      "trap", (-5, 0, 10, 15)),
+        ("moderate", "tri",  (15, 22, 28)),
+        ("high",     "trap", (26, 30, 36, 42)),
+    ]),
+    # ET0 (mm/day), opzionale
+    "et0": ("et0", [
+        ("low",      "trap", (-0.1, 0.0, 1.5, 2.0)),
+        ("moderate", "tri",  (1.5, 3.0, 4.5)),
+        ("high",     "trap", (4.0, 5.0, 7.0, 9.0)),
+    ]),
+}
+
+_MF = {"tri": tri, "trap": trap}
+_MF_NP = {"tri": tri_np, "trap": trap_np}
+
 def fuzzify_inputs(signals: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
     """
     Ritorna membership per:
@@ -81,150 +134,172 @@ def fuzzify_inputs(signals: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
     - temp: low, moderate, high
     - et0: low, moderate, high (se disponibile)
     """
-    soil = signals.get("soilMoisture")  # 0..100
-    rain = signals.get("rainNext24h")   # mm
-    ratio = signals.get("ratio")        # daysSinceLast / baselineInterval
-    temp  = signals.get("temp")         # °C
-    et0   = signals.get("et0")          # mm/day approx
-
     out = {}
+    for var, (signal, terms) in MEMBERSHIPS.items():
+        x = signals.get(signal)
+        # ET0 assente -> nessuna membership (la regola R6 non si attiva)
+        if var == "et0" and not isinstance(x, (int, float)):
+            out[var] = {}
+            continue
+        out[var] = {term: clamp01(_MF[kind](x, *params)) for term, kind, params in terms}
+    return out
 
-    # Suolo (in %)
-    out["soil"] = {
-        "dry":  trap(soil, 0, 15, 30, 45),
-        "moist":tri(soil, 35, 55, 75),
-        "wet":  trap(soil, 70, 80, 100, 110),
-    }
-
-    # Pioggia (mm / 24h)
-    out["rain"] = {
-        "low":    trap(rain, -1, 0, 1.5, 2.5),
-        "medium": tri(rain, 2.0, 3.5, 5.0),
-        "high":   trap(rain, 4.0, 6.0, 10.0, 20.0),
-    }
-
-    # Rapporto giorni/intervallo
-    out["ratio"] = {
-        "early":   trap(ratio, -0.1, 0.0, 0.6, 0.8),
-        "due":     tri(ratio, 0.8, 1.0, 1.2),
-        "overdue": trap(ratio, 1.0, 1.3, 2.0, 3.0),
-    }
-
-    # Temperatura (°C)
-    out["temp"] = {
-        "low":      trap(temp, -5, 0, 10, 15),
-        "moderate": tri(temp, 15, 22, 28),
-        "high":     trap(temp, 26, 30, 36, 42),
+def fuzzify_many(signals: Dict[str, np.ndarray]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Come fuzzify_inputs ma su array (una riga per pianta); i NaN valgono come None."""
+    return {
+        var: {term: np.clip(_MF_NP[kind](signals[signal], *params), 0.0, 1.0) for term, kind, params in terms}
+        for var, (signal, terms) in MEMBERSHIPS.items()
     }
 
-    # ET0 (mm/day) se presente
-    if isinstance(et0, (int, float)):
-        out["et0"] = {
-            "low":      trap(et0, -0.1, 0.0, 1.5, 2.0),
-            "moderate": tri(et0, 1.5, 3.0, 4.5),
-            "high":     trap(et0, 4.0, 5.0, 7.0, 9.0),
-        }
-    else:
-        out["et0"] = {}
+# Rule base (dati): "if" è un OR di congiunzioni (AND) di letterali "variabile.termine";
+# il prefisso "!" nega il termine (1 - membership). Una regola si attiva con peso > 0.
+ACTIONS = ("irrigate_today", "irrigate_tomorrow", "skip")
+
+RULE_BASE = [
+    {"id": "R1", "if": [["rain.high"], ["soil.wet"]], "then": "skip",
+     "because": "Pioggia alta o suolo già bagnato"},
+    {"id": "R2", "if": [["rain.medium", "soil.moist"]], "then": "irrigate_tomorrow",
+     "because": "Pioggia media e suolo umido → meglio rimandare"},
+    {"id": "R3", "if": [["ratio.overdue", "rain.low", "!soil.wet"]], "then": "irrigate_today",
+     "because": "Intervallo superato, poca pioggia e suolo non bagnato"},
+    {"id": "R4", "if": [["ratio.due", "rain.low", "!soil.wet"]], "then": "irrigate_tomorrow",
+     "because": "Intervallo in arrivo, poca pioggia e suolo non bagnato"},
+    {"id": "R5", "if": [["temp.high", "soil.dry"]], "then": "irrigate_today",
+     "because": "Fa caldo e il suolo è secco"},
+    # R6 (opzionale): senza ET0 le sue membership valgono 0 e la regola non si attiva
+    {"id": "R6", "if": [["et0.high", "soil.dry"]], "then": "irrigate_today",
+     "because": "Evapotraspirazione elevata e suolo secco"},
+]
+
+# Se nessuna regola ha dato peso, default: skip (peso minimo)
+DEFAULT_RULE = {"id": "R0", "then": "skip", "weight": 0.2, "because": "Nessuna condizione critica"}
+
+# File JSON opzionale {"rules": [...], "default": {...}} che sostituisce RULE_BASE senza toccare il codice
+_RULES_FILE = os.getenv("AI_FUZZY_RULES_FILE")
+
+# Colonne del vettore di membership, nell'ordine di MEMBERSHIPS
+MEMBERSHIP_COLUMNS = [(var, term) for var, (_, terms) in MEMBERSHIPS.items() for term, _, _ in terms]
+_TERMS_BY_VAR = [(var, [term for term, _, _ in terms]) for var, (_, terms) in MEMBERSHIPS.items()]
+
+
+class RulePlan:
+    """
+    Rule base compilata in un piano piatto di indici.
+    Le membership stanno in un vettore esteso [mu, 1 - mu] (2M colonne):
+    ogni letterale è un indice in quel vettore, ogni congiunzione un segmento
+    di 'literals' (min), ogni regola un segmento di congiunzioni (max).
+    """
 
-    # clamp
-    for grp in out.values():
-        for k, v in list(grp.items()):
-            grp[k] = clamp01(v)
+    def __init__(self, rules: List[Dict[str, Any]], default: Dict[str, Any]):
+        columns = {c: j for j, c in enumerate(MEMBERSHIP_COLUMNS)}
+        m = len(columns)
+
+        literals: List[int] = []
+        conj_starts: List[int] = []
+        rule_starts: List[int] = []
+        # Percorso scalare: (indici positivi, indici negati, regola) per congiunzione
+        self.conjunctions: List[tuple] = []
+
+        for r_idx, rule in enumerate(rules):
+            if rule.get("then") not in ACTIONS:
+                raise ValueError(f"Regola {rule.get('id')}: azione sconosciuta '{rule.get('then')}'")
+            if not rule.get("if") or not all(rule["if"]):
+                raise ValueError(f"Regola {rule.get('id')}: antecedente vuoto")
+
+            rule_starts.append(len(conj_starts))
+            for conj in rule["if"]:
+                conj_starts.append(len(literals))
+                positive, negated = [], []
+                for lit in conj:
+                    key = tuple(lit.lstrip("!").split(".", 1))
+                    if key not in columns:
+                        raise ValueError(f"Regola {rule.get('id')}: termine sconosciuto '{lit}'")
+                    j = columns[key]
+                    if lit.startswith("!"):
+                        negated.append(j)
+                        literals.append(j + m)
+                    else:
+                        positive.append(j)
+                        literals.append(j)
+                self.conjunctions.append((tuple(positive), tuple(negated), r_idx))
+
+        self.rules = rules
+        self.default = default
+        self.literals = np.array(literals, dtype=np.intp)
+        self.conj_starts = np.array(conj_starts, dtype=np.intp)
+        self.rule_starts = np.array(rule_starts, dtype=np.intp)
+        self.rule_action = np.array([ACTIONS.index(r["then"]) for r in rules], dtype=np.intp)
+
+    def evaluate(self, mu: List[float]) -> List[float]:
+        """
+        Pesi delle regole per una pianta (mu nell'ordine di MEMBERSHIP_COLUMNS).
+        Una congiunzione si scarta al primo letterale positivo non attivo,
+        senza allocare nulla per le regole che non scattano.
+        """
+        weights = [0.0] * len(self.rules)
+        for positive, negated, r in self.conjunctions:
+            w = 1.0
+            for j in positive:
+                v = mu[j]
+                if v < w:
+                    w = v
+                    if w <= 0.0:
+                        break
+            if w <= 0.0:
+                continue
+            for j in negated:
+                v = 1.0 - mu[j]
+                if v < w:
+                    w = v
+            if w > weights[r]:
+                weights[r] = w
+        return weights
+
+    def evaluate_many(self, mu: np.ndarray) -> np.ndarray:
+        """Pesi delle regole su una matrice (piante, M) di membership → (piante, regole)."""
+        ext = np.concatenate([mu, 1.0 - mu], axis=1)
+        conj = np.minimum.reduceat(ext[:, self.literals], self.conj_starts, axis=1)
+        return np.maximum.reduceat(conj, self.rule_starts, axis=1)
+
+
+def load_rule_base() -> RulePlan:
+    rules, default = RULE_BASE, DEFAULT_RULE
+    if _RULES_FILE:
+        with open(_RULES_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rules = data.get("rules", rules)
+        default = data.get("default", default)
+    return RulePlan(rules, default)
+
+
+RULES = load_rule_base()
 
-    return out
 
-# Rule base
 def evaluate_rules(deg: Dict[str, Dict[str, float]]) -> list:
     """
     Ritorna lista di regole attivate: [{id, action, weight, because}, ...]
     action ∈ {"irrigate_today","irrigate_tomorrow","skip"}
     """
-    soil = deg.get("soil", {})
-    rain = deg.get("rain", {})
-    ratio = deg.get("ratio", {})
-    temp = deg.get("temp", {})
-    et0  = deg.get("et0", {})
+    mu = []
+    for var, terms in _TERMS_BY_VAR:
+        grp = deg.get(var) or {}
+        mu.extend([grp.get(t, 0.0) for t in terms])
 
     rules = []
+    for r, w in zip(RULES.rules, RULES.evaluate(mu)):
+        if w > 0:
+            rules.append({"id": r["id"], "action": r["then"], "weight": w, "because": r["because"]})
 
-    # R1: rain high OR soil wet -> skip
-    r1 = max(rain.get("high", 0), soil.get("wet", 0))
-    if r1 > 0:
-        rules.append({
-            "id": "R1",
-            "action": "skip",
-            "weight": r1,
-            "because": "Pioggia alta o suolo già bagnato"
-        })
-
-    # R2: rain medium AND soil moist -> irrigate_tomorrow
-    r2 = min(rain.get("medium", 0), soil.get("moist", 0))
-    if r2 > 0:
-        rules.append({
-            "id": "R2",
-            "action": "irrigate_tomorrow",
-            "weight": r2,
-            "because": "Pioggia media e suolo umido → meglio rimandare"
-        })
-
-    # R3: overdue AND rain low AND (soil NOT wet) -> irrigate_today
-    not_wet = 1.0 - soil.get("wet", 0)
-    r3 = min(ratio.get("overdue", 0), rain.get("low", 0), not_wet)
-    if r3 > 0:
-        rules.append({
-            "id": "R3",
-            "action": "irrigate_today",
-            "weight": r3,
-            "because": "Intervallo superato, poca pioggia e suolo non bagnato"
-        })
-
-    # R4: due AND rain low AND (soil NOT wet) -> irrigate_tomorrow
-    r4 = min(ratio.get("due", 0), rain.get("low", 0), not_wet)
-    if r4 > 0:
-        rules.append({
-            "id": "R4",
-            "action": "irrigate_tomorrow",
-            "weight": r4,
-            "because": "Intervallo in arrivo, poca pioggia e suolo non bagnato"
-        })
-
-    # R5: temp high AND soil dry -> irrigate_today
-    r5 = min(temp.get("high", 0), soil.get("dry", 0))
-    if r5 > 0:
-        rules.append({
-            "id": "R5",
-            "action": "irrigate_today",
-            "weight": r5,
-            "because": "Fa caldo e il suolo è secco"
-        })
-
-    # R6 (opzionale): et0 high AND soil dry -> irrigate_today
-    if et0:
-        r6 = min(et0.get("high", 0), soil.get("dry", 0))
-        if r6 > 0:
-            rules.append({
-                "id": "R6",
-                "action": "irrigate_today",
-                "weight": r6,
-                "because": "Evapotraspirazione elevata e suolo secco"
-            })
-
-    # Se nessuna regola ha dato peso, default: skip (peso minimo)
     if not rules:
-        rules.append({
-            "id": "R0",
-            "action": "skip",
-            "weight": 0.2,
-            "because": "Nessuna condizione critica"
-        })
+        d = RULES.default
+        rules.append({"id": d["id"], "action": d["then"], "weight": d["weight"], "because": d["because"]})
 
     # ordina per peso desc
     rules.sort(key=lambda r: r["weight"], reverse=True)
     return rules
 
 def aggregate_scores(rules: list) -> Dict[str, float]:
-    scores = {"irrigate_today": 0.0, "irrigate_tomorrow": 0.0, "skip": 0.0}
+    scores = {a: 0.0 for a in ACTIONS}
     for r in rules:
         a = r["action"]
         scores[a] = max(scores[a], r["weight"])  # max-aggregation
@@ -317,4 +392,90 @@ def compute(*, plant: Dict[str, Any], weather: Optional[Dict[str, Any]], now: da
             "actionScores": scores,  # {"irrigate_today":w,..}
         }
     }
-    return result
\ No newline at end of file
+    return result
+
+# API vettoriale (molte piante in una volta)
+def _as_array(values: Sequence[Optional[float]], n: int) -> np.ndarray:
+    if values is None:
+        return np.full(n, np.nan)
+    return np.asarray(values, dtype=float).reshape(n)
+
+def compute_many(*, soil: Sequence[Optional[float]], rain: Sequence[Optional[float]],
+                 ratio: Sequence[Optional[float]], temp: Sequence[Optional[float]],
+                 et0: Optional[Sequence[Optional[float]]] = None, with_tech: bool = False) -> Dict[str, Any]:
+    """
+    Versione vettoriale di fuzzify_inputs → evaluate_rules → aggregate_scores → choose_action.
+    Ogni argomento è una sequenza con un valore per pianta (None/NaN = dato mancante).
+    Ritorna liste parallele: {recommendation, confidence, reason[, tech]}, identiche
+    a quelle del percorso scalare pianta per pianta.
+    """
+    n = len(soil)
+    signals = {
+        "soilMoisture": _as_array(soil, n),
+        "rainNext24h": _as_array(rain, n),
+        "ratio": _as_array(ratio, n),
+        "temp": _as_array(temp, n),
+        "et0": _as_array(et0, n),
+    }
+    deg = fuzzify_many(signals)
+    mu = np.stack([deg[var][term] for var, term in MEMBERSHIP_COLUMNS], axis=1)
+    weights = RULES.evaluate_many(mu)                          # (n, R)
+    active = weights > 0
+    fired = active.any(axis=1)
+
+    # Max-aggregation per azione; senza regole attive vale la regola di default
+    scores = np.zeros((n, len(ACTIONS)))
+    for k in range(len(ACTIONS)):
+        cols = RULES.rule_action == k
+        if cols.any():
+            scores[:, k] = np.where(active[:, cols], weights[:, cols], 0.0).max(axis=1)
+    scores[~fired, ACTIONS.index(RULES.default["then"])] = RULES.default["weight"]
+
+    # choose_action: argmax prende il primo a parità, come il sort stabile
+    best = scores.argmax(axis=1)
+    ordered = np.sort(scores, axis=1)
+    best_w, second_w = ordered[:, -1], ordered[:, -2]
+    confidence = best_w / (best_w + second_w + 1e-9)
+
+    # build_reason: la regola più forte a favore dell'azione scelta (prima a parità)
+    candidate = np.where(active & (RULES.rule_action[None, :] == best[:, None]), weights, -1.0)
+    top_rule = candidate.argmax(axis=1)
+
+    actions = [ACTIONS[k] for k in best.tolist()]
+    result = {
+        "recommendation": actions,
+        "confidence": [float(round(c, 3)) for c in confidence.tolist()],
+        "reason": [
+            RULES.rules[j]["because"] if f else RULES.default["because"]
+            for j, f in zip(top_rule.tolist(), fired.tolist())
+        ],
+    }
+
+    if with_tech:
+        result["tech"] = [_tech_row(i, deg, signals, weights, active, fired, scores) for i in range(n)]
+    return result
+
+def _tech_row(i: int, deg, signals, weights, active, fired, scores) -> Dict[str, Any]:
+    """Ricostruisce il blocco 'tech' di compute per la pianta i."""
+    memberships = {}
+    for var, terms in deg.items():
+        if var == "et0" and np.isnan(signals["et0"][i]):
+            memberships[var] = {}
+        else:
+            memberships[var] = {term: float(v[i]) for term, v in terms.items()}
+
+    if fired[i]:
+        rules = [
+            {"id": r["id"], "action": r["then"], "weight": float(weights[i, j]), "because": r["because"]}
+            for j, r in enumerate(RULES.rules) if active[i, j]
+        ]
+        rules.sort(key=lambda r: r["weight"], reverse=True)
+    else:
+        d = RULES.default
+        rules = [{"id": d["id"], "action": d["then"], "weight": d["weight"], "because": d["because"]}]
+
+    return {
+        "memberships": memberships,
+        "rules": rules,
+        "actionScores": {a: float(scores[i, k]) for k, a in enumerate(ACTIONS)},
+    }
@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# Config da ENV
+_WINDOW = int(os.getenv("AI_TELEMETRY_WINDOW", "50"))                 # ultime N chiamate per modello
+_EJECT_AFTER = int(os.getenv("AI_EJECT_AFTER_FAILURES", "3"))          # errori consecutivi prima dell'esclusione
+_EJECT_SECONDS = float(os.getenv("AI_EJECT_SECONDS", "120"))           # prima esclusione
+_EJECT_MAX_SECONDS = float(os.getenv("AI_EJECT_MAX_SECONDS", "900"))   # tetto del backoff esponenziale
+_PROBE_TIMEOUT_SECONDS = 60.0                                            # validità della prenotazione di una sonda
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class _ModelHealth:
+    def __init__(self, model: str):
+        self.model = model
+        # (timestamp, ok, latency_s, tokens, errore); ok=None = chiamata cancellata (hedging perso):
+        # la latenza è solo un limite inferiore, non conta né come successo né come errore
+        self.calls = deque(maxlen=_WINDOW)
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probe_reserved_at = 0.0
+
+    def record(self, ok: bool, latency: float, tokens: Optional[int], err: Optional[str]):
+        self.calls.append((time.time(), ok, latency, tokens, err))
+        self.probe_reserved_at = 0.0
+
+        if ok:
+            if self.ejections:
+                logger.info(f"💚 Modello {self.model} di nuovo disponibile")
+            self.consecutive_failures = 0
+            self.ejections = 0
+            self.ejected_until = 0.0
+            return
+
+        self.consecutive_failures += 1
+        rate_limited = "429" in (err or "")
+        # In prova (già escluso in passato): basta un errore per tornare fuori
+        if rate_limited or self.ejections > 0 or self.consecutive_failures >= _EJECT_AFTER:
+            # Backoff esponenziale: 120s, 240s, 480s... fino al tetto
+            duration = min(_EJECT_MAX_SECONDS, _EJECT_SECONDS * (2 ** self.ejections))
+            self.ejections += 1
+            self.ejected_until = time.time() + duration
+            logger.warning(f"🚫 Modello {self.model} escluso per {duration:.0f}s (errore: {err})")
+
+    def record_cancelled(self, elapsed: float):
+        self.calls.append((time.time(), None, elapsed, None, None))
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def needs_probe(self, now: float) -> bool:
+        """Esclusione scaduta ma nessun successo da allora: serve una chiamata di prova."""
+        return self.ejections > 0 and not self.is_ejected(now)
+
+    def is_probing(self, now: float) -> bool:
+        return self.needs_probe(now) and now - self.probe_reserved_at < _PROBE_TIMEOUT_SECONDS
+
+    def try_reserve_probe(self, now: float, reserve: bool = True) -> bool:
+        if now - self.probe_reserved_at < _PROBE_TIMEOUT_SECONDS:
+            return False
+        if reserve:
+            self.probe_reserved_at = now
+        return True
+
+    def completed(self) -> List[tuple]:
+        return [c for c in self.calls if c[1] is not None]
+
+    def latencies(self) -> List[float]:
+        # Successi + cancellate (censurate: almeno quel tempo), altrimenti p50/p95 premiano solo i vincitori
+        return [c[2] for c in self.calls if c[1] is not False]
+
+    def success_rate(self) -> Optional[float]:
+        done = self.completed()
+        if not done:
+            return None
+        return sum(1 for c in done if c[1]) / len(done)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        latencies = self.latencies()
+        tokens = [c[3] for c in self.calls if c[1] and isinstance(c[3], int)]
+        rate = self.success_rate()
+        return {
+            "model": self.model,
+            "calls": len(self.calls),
+            "cancelled": sum(1 for c in self.calls if c[1] is None),
+            "successRate": round(rate, 3) if rate is not None else None,
+            "latencyP50": round(_percentile(latencies, 0.50), 3) if latencies else None,
+            "latencyP95": round(_percentile(latencies, 0.95), 3) if latencies else None,
+            "avgTokens": round(sum(tokens) / len(tokens), 1) if tokens else None,
+            "totalTokens": sum(tokens),
+            "consecutiveFailures": self.consecutive_failures,
+            "ejected": self.is_ejected(now),
+            "ejectedForSeconds": round(max(0.0, self.ejected_until - now), 1),
+            "lastError": next((c[4] for c in reversed(self.calls) if c[1] is False), None),
+        }
+
+
+_HEALTH: Dict[str, _ModelHealth] = {}
+
+
+def _health(model: str) -> _ModelHealth:
+    if model not in _HEALTH:
+        _HEALTH[model] = _ModelHealth(model)
+    return _HEALTH[model]
+
+
+def record_call(model: str, ok: bool, latency: float, tokens: Optional[int] = None, err: Optional[str] = None):
+    _health(model).record(ok, latency, tokens, err)
+
+
+def record_cancelled(model: str, elapsed: float):
+    """Chiamata cancellata perché un altro modello ha risposto prima: campione censurato di latenza."""
+    _health(model).record_cancelled(elapsed)
+
+
+def is_probe(model: str) -> bool:
+    """True se il modello è la sonda prenotata da ranked_models: va lanciata subito e portata a termine."""
+    return _health(model).is_probing(time.time())
+
+
+def ranked_models(models: List[str], reserve_probe: bool = True) -> List[str]:
+    """
+    Riordina i modelli in base alla telemetria recente:
+    - i modelli sani, per success rate (con prior ottimistico) e poi latenza p50;
+    - un solo modello in prova (esclusione scaduta) in seconda posizione: l'hedging lo
+      lancia insieme al primo (is_probe) e non lo cancella, così la prova arriva sempre
+      a un esito senza rallentare la risposta del modello migliore;
+    - i modelli esclusi non vengono proposti, a meno che lo siano tutti.
+    A parità di statistiche resta l'ordine statico di HF_FALLBACK_MODELS.
+    """
+    now = time.time()
+    healthy, probes, ejected = [], [], []
+
+    for idx, model in enumerate(models):
+        h = _health(model)
+        if h.is_ejected(now):
+            ejected.append((h.ejected_until, idx, model))
+        elif h.needs_probe(now):
+            probes.append(model)
+        else:
+            done = h.completed()
+            ok = sum(1 for c in done if c[1])
+            smoothed = (ok + 1) / (len(done) + 1)
+            p50 = _percentile(h.latencies(), 0.50)
+            healthy.append((-round(smoothed, 1), p50 if p50 is not None else float("inf"), idx, model))
+
+    order = [m for *_, m in sorted(healthy)]
+
+    for model in probes:
+        if _health(model).try_reserve_probe(now, reserve=reserve_probe):
+            order.insert(min(1, len(order)), model)
+            break
+
+    if not order:
+        # Tutti esclusi: meglio tentare comunque, partendo da chi rientra prima
+        order = [m for *_, m in sorted(ejected)] or probes
+
+    return order
+
+
+def get_model_stats(models: List[str]) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "order": ranked_models(models, reserve_probe=False),
+        "models": [_health(m).stats(now) for m in models],
+        "config": {
+            "window": _WINDOW,
+            "ejectAfterFailures": _EJECT_AFTER,
+            "ejectSeconds": _EJECT_SECONDS,
+            "ejectMaxSeconds": _EJECT_MAX_SECONDS,
+        },
+    }
@@ -1,9 +1,10 @@
 import os
 import time
 from typing import Optional, Dict, Any
-import httpx
 from datetime import datetime
 
+from utils.outbound import request as outbound_request
+
 # Cache in memoria
 _SOIL_CACHE: Dict[str, Dict[str, Any]] = {}
 
@@ -78,8 +79,9 @@ def get_soil_moisture(lat: float, lng: float) -> Optional[Dict[str, Any]]:
         return None
 
     key = _grid_key(lat, lng)
-    if key in _SOIL_CACHE and not _expired(_SOIL_CACHE[key]):
-        return _SOIL_CACHE[key]["value"]
+    cached = _SOIL_CACHE.get(key)
+    if cached and not _expired(cached):
+        return cached["value"]
 
     params = {
         "latitude": lat,
@@ -90,12 +92,12 @@ def get_soil_moisture(lat: float, lng: float) -> Optional[Dict[str, Any]]:
     }
 
     try:
-        with httpx.Client(timeout=6.0) as cli:
-            r = cli.get(OPEN_METEO_URL, params=params)
-            r.raise_for_status()
-            j = r.json()
+        r = outbound_request("open-meteo", "GET", OPEN_METEO_URL, timeout=6.0, params=params)
+        r.raise_for_status()
+        j = r.json()
     except Exception:
-        return None
+        # Provider giù: meglio un dato scaduto che nessun dato
+        return cached["value"] if cached else None
 
     hourly = j.get("hourly", {}) or {}
     times = hourly.get("time", []) or []
@@ -1,22 +1,22 @@
+import os
 from pathlib import Path
 from uuid import uuid4
 from io import BytesIO
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Callable, Any, Tuple
 from PIL import Image, ImageOps
 
 from config import settings
 
 ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "JPG"}
 
+# Thread per la codifica WebP (Pillow rilascia il GIL durante encode/resize)
+ENCODE_WORKERS = int(os.getenv("IMAGE_ENCODE_WORKERS", "2"))
+_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="img-encode")
+
 def _ensure_dir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
-def _open_image(data: bytes) -> Image.Image:
-    img = Image.open(BytesIO(data))
-    img.load()
-    img = ImageOps.exif_transpose(img)
-    return img
-
 def _resize_max(img: Image.Image, max_side: int) -> Image.Image:
     w, h = img.size
     if max(w, h) <= max_side:
@@ -24,50 +24,27 @@ def _resize_max(img: Image.Image, max_side: int) -> Image.Image:
     scale = max_side / float(max(w, h))
     return img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
 
-def save_image_bytes(
-    data: bytes,
-    subdir: str,
-    base_name: Optional[str] = None,
-    max_side: int = 1280,
-    thumb_side: int = 384,
-    webp_quality: int = 82
-) -> Dict[str, str]:
+def decode_upload(data: bytes) -> Tuple[Image.Image, Dict[str, Any]]:
     """
-    Salva immagine in WEBP.
-    Ritorna sia URL pubblici, sia path relativi/assoluti per eventuale delete.
+    Unica decodifica di un upload: immagine RGB già ruotata secondo l'EXIF + metadati
+    (dimensioni dopo la rotazione, formato originale). ValueError se non è un'immagine.
     """
-    root = Path(settings.UPLOAD_DIR).resolve()
-    _ensure_dir(root)
-
-    
-    target_dir = (root / subdir).resolve()
-    _ensure_dir(target_dir)
-
-    # Apertura & validazione
     try:
-        img = _open_image(data)
+        raw = Image.open(BytesIO(data))
+        raw.load()
     except Exception:
         raise ValueError("File non riconosciuto come immagine valida")
 
-    fmt = (img.format or "").upper()
+    # exif_transpose restituisce una copia senza .format: lo si legge prima
+    fmt = (raw.format or "").upper()
+    img = ImageOps.exif_transpose(raw)
     if fmt == "JPG":
         fmt = "JPEG"
-    img = img.convert("RGB")
+    metadata = {"width": img.width, "height": img.height, "format": fmt or None}
+    return img.convert("RGB"), metadata
 
-    uid = base_name or uuid4().hex[:10]
-    main_name = f"{uid}.webp"
-    thumb_name = f"{uid}_sm.webp"
-
-    # Main
-    main_img = _resize_max(img, max_side)
-    main_path = target_dir / main_name
-    main_img.save(main_path, format="WEBP", quality=webp_quality, method=6)
-
-    # Thumb
-    th_img = _resize_max(img, thumb_side)
-    thumb_path = target_dir / thumb_name
-    th_img.save(thumb_path, format="WEBP", quality=webp_quality, method=6)
 
+def _public_paths(subdir: str, main_name: str, thumb_name: str, main_path: Path, thumb_path: Path) -> Dict[str, str]:
     # Percorsi relativi
     rel_main = f"uploads/{subdir}/{main_name}"
     rel_thumb = f"uploads/{subdir}/{thumb_name}"
@@ -84,4 +61,88 @@ def save_image_bytes(
         "relThumb": rel_thumb,
         "abs": str(main_path),
         "absThumb": str(thumb_path),
-    }
\ No newline at end of file
+    }
+
+
+def ingest_image(
+    data: bytes,
+    subdir: str,
+    base_name: Optional[str] = None,
+    max_side: int = 1280,
+    thumb_side: int = 384,
+    webp_quality: int = 82,
+    analyze: Optional[Callable[[Image.Image], Any]] = None
+) -> Dict[str, Any]:
+    """
+    Pipeline di ingestione: decodifica UNA volta e passa la stessa immagine in memoria a
+    metadati, varianti WebP e (opzionale) analisi. Le due codifiche WebP girano nel pool
+    mentre 'analyze' (es. la CNN) lavora sull'immagine decodificata e orientata nel thread
+    chiamante: sono tutte letture di immagini già caricate, nessuno le modifica.
+    Se l'analisi o un salvataggio falliscono, i file scritti vengono rimossi e l'errore risale.
+    Ritorna {"saved": <come save_image_bytes>, "metadata": {...}, "analysis": <risultato di analyze>}.
+    """
+    img, metadata = decode_upload(data)
+
+    root = Path(settings.UPLOAD_DIR).resolve()
+    target_dir = (root / subdir).resolve()
+    _ensure_dir(target_dir)
+
+    uid = base_name or uuid4().hex[:10]
+    main_name = f"{uid}.webp"
+    thumb_name = f"{uid}_sm.webp"
+    main_path = target_dir / main_name
+    thumb_path = target_dir / thumb_name
+
+    # La miniatura parte dalla versione già ridotta: molti meno pixel da filtrare, al prezzo
+    # di un doppio ricampionamento (a 384px la differenza non si vede)
+    main_img = _resize_max(img, max_side)
+    th_img = _resize_max(main_img, thumb_side)
+
+    jobs = [
+        _pool.submit(main_img.save, main_path, format="WEBP", quality=webp_quality, method=6),
+        _pool.submit(th_img.save, thumb_path, format="WEBP", quality=webp_quality, method=6),
+    ]
+    analysis = None
+    try:
+        if analyze is not None:
+            analysis = analyze(img)
+    except BaseException:
+        for job in jobs:
+            job.exception()
+        _remove_files(main_path, thumb_path)
+        raise
+    try:
+        for job in jobs:
+            job.result()
+    except Exception:
+        _remove_files(main_path, thumb_path)
+        raise
+
+    return {
+        "saved": _public_paths(subdir, main_name, thumb_name, main_path, thumb_path),
+        "metadata": metadata,
+        "analysis": analysis,
+    }
+
+
+def _remove_files(*paths: Path):
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def save_image_bytes(
+    data: bytes,
+    subdir: str,
+    base_name: Optional[str] = None,
+    max_side: int = 1280,
+    thumb_side: int = 384,
+    webp_quality: int = 82
+) -> Dict[str, str]:
+    """
+    Salva immagine in WEBP.
+    Ritorna sia URL pubblici, sia path relativi/assoluti per eventuale delete.
+    """
+    return ingest_image(data, subdir, base_name, max_side, thumb_side, webp_quality)["saved"]
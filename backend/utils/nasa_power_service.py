@@ -1,9 +1,10 @@
 import os
 from typing import Optional, Dict, Any
-import httpx
 from datetime import datetime, timezone
 import math
 
+from utils.outbound import request as outbound_request
+
 NASA_POWER_BASE = os.getenv("NASA_POWER_BASE_URL", "https://power.larc.nasa.gov")
 NASA_TIMEOUT = float(os.getenv("NASA_POWER_TIMEOUT", "6"))
 
@@ -76,10 +77,9 @@ def get_daily_point(lat: float, lng: float, now: Optional[datetime] = None) -> O
             f"&latitude={lat}&longitude={lng}&community=AG&format=JSON"
         )
 
-        with httpx.Client(timeout=NASA_TIMEOUT) as cli:
-            r = cli.get(url)
-            r.raise_for_status()
-            j = r.json()
+        r = outbound_request("nasa-power", "GET", url, timeout=NASA_TIMEOUT)
+        r.raise_for_status()
+        j = r.json()
 
         data = j.get("properties", {}).get("parameter", {})
         t_mean = _san(_first_value(data.get("T2M")))
@@ -0,0 +1,212 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Config da ENV
+_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", "3"))          # errori consecutivi prima dell'apertura
+_OPEN_SECONDS = float(os.getenv("CB_OPEN_SECONDS", "30"))                  # durata del circuito aperto
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))  # budget per richiesta HTTP
+_MIN_TIMEOUT_SECONDS = 0.5                                                 # sotto questa soglia non vale la pena chiamare
+
+
+class OutboundError(Exception):
+    """Chiamata esterna non eseguita (circuito aperto o tempo esaurito)."""
+    pass
+
+
+class CircuitOpenError(OutboundError):
+    pass
+
+
+class DeadlineExceededError(OutboundError):
+    pass
+
+
+class _Breaker:
+    """
+    Circuit breaker per provider:
+    - chiuso: le chiamate passano, si contano gli errori consecutivi;
+    - aperto (dopo N errori): si fallisce subito per _OPEN_SECONDS;
+    - semi-aperto: passa una sola chiamata di prova, che decide se richiudere.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probe_at = 0.0
+        self.calls = 0
+        self.short_circuited = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def is_open(self, now: float) -> bool:
+        return self.failures >= _FAILURE_THRESHOLD and now < self.opened_until
+
+    def allow(self) -> bool:
+        now = time.time()
+        with self._lock:
+            if self.failures < _FAILURE_THRESHOLD:
+                return True
+            if now < self.opened_until or now - self.probe_at < _OPEN_SECONDS:
+                self.short_circuited += 1
+                return False
+            self.probe_at = now
+            return True
+
+    def success(self):
+        with self._lock:
+            self.calls += 1
+            if self.failures >= _FAILURE_THRESHOLD:
+                logger.info(f"💚 Provider {self.name} di nuovo raggiungibile")
+            self.failures = 0
+            self.opened_until = 0.0
+            self.probe_at = 0.0
+
+    def failure(self, err: str):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.last_error = err
+            self.probe_at = 0.0
+            if self.failures >= _FAILURE_THRESHOLD:
+                self.opened_until = time.time() + _OPEN_SECONDS
+                logger.warning(f"🚫 Provider {self.name} non disponibile: circuito aperto per {_OPEN_SECONDS:.0f}s ({err})")
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "state": "open" if self.is_open(now) else ("half-open" if self.failures >= _FAILURE_THRESHOLD else "closed"),
+            "consecutiveFailures": self.failures,
+            "openForSeconds": round(max(0.0, self.opened_until - now), 1),
+            "calls": self.calls,
+            "shortCircuited": self.short_circuited,
+            "lastError": self.last_error,
+        }
+
+
+_BREAKERS: Dict[str, _Breaker] = {}
+
+# Istante (time.monotonic) entro cui devono finire le chiamate esterne della richiesta corrente
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("outbound_deadline", default=None)
+
+
+def _breaker(provider: str) -> _Breaker:
+    if provider not in _BREAKERS:
+        _BREAKERS[provider] = _Breaker(provider)
+    return _BREAKERS[provider]
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float], detach: bool = False):
+    """
+    Limita a 'seconds' il tempo delle chiamate esterne nel blocco.
+    Un blocco annidato non estende mai il budget del chiamante; con detach=True
+    si riparte da zero (job in background che sopravvivono alla richiesta).
+    """
+    current = None if detach else _DEADLINE.get()
+    new = None if seconds is None else time.monotonic() + seconds
+    if current is not None:
+        new = current if new is None else min(new, current)
+    token = _DEADLINE.set(new)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Secondi rimasti alla richiesta corrente (None = nessun limite)."""
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _begin(provider: str, timeout: float) -> float:
+    """Verifica circuito e budget; ritorna il timeout effettivo della chiamata."""
+    remaining = remaining_time()
+    if remaining is not None:
+        if remaining < _MIN_TIMEOUT_SECONDS:
+            raise DeadlineExceededError(f"{provider}: tempo della richiesta esaurito")
+        timeout = min(timeout, remaining)
+    if not _breaker(provider).allow():
+        raise CircuitOpenError(f"{provider}: circuito aperto, chiamata saltata")
+    return timeout
+
+
+def _record(provider: str, r: httpx.Response):
+    # 5xx e 429: il provider è in difficoltà. Gli altri 4xx sono errori nostri, il provider risponde
+    if r.status_code >= 500 or r.status_code == 429:
+        _breaker(provider).failure(f"HTTP {r.status_code}")
+    else:
+        _breaker(provider).success()
+
+
+def request(provider: str, method: str, url: str, *, timeout: float,
+            client: Optional[httpx.Client] = None, **kwargs) -> httpx.Response:
+    """
+    Chiamata HTTP sincrona protetta da circuit breaker e deadline di richiesta.
+    Solleva OutboundError se la chiamata viene saltata; gli errori httpx passano al chiamante.
+    """
+    t = _begin(provider, timeout)
+    try:
+        if client is not None:
+            r = client.request(method, url, timeout=t, **kwargs)
+        else:
+            with httpx.Client(timeout=t) as cli:
+                r = cli.request(method, url, **kwargs)
+    except Exception as e:
+        _breaker(provider).failure(str(e) or type(e).__name__)
+        raise
+    _record(provider, r)
+    return r
+
+
+async def arequest(provider: str, method: str, url: str, *, timeout: float,
+                   client: Optional[httpx.AsyncClient] = None, **kwargs) -> httpx.Response:
+    """Variante asincrona di request()."""
+    t = _begin(provider, timeout)
+    try:
+        if client is not None:
+            r = await client.request(method, url, timeout=t, **kwargs)
+        else:
+            async with httpx.AsyncClient(timeout=t) as cli:
+                r = await cli.request(method, url, **kwargs)
+    except Exception as e:
+        _breaker(provider).failure(str(e) or type(e).__name__)
+        raise
+    _record(provider, r)
+    return r
+
+
+@asynccontextmanager
+async def astream(provider: str, method: str, url: str, *, timeout: float, **kwargs) -> AsyncIterator[httpx.Response]:
+    """Variante streaming: gli errori durante la lettura del body contano come fallimenti."""
+    t = _begin(provider, timeout)
+    try:
+        async with httpx.AsyncClient(timeout=t) as cli:
+            async with cli.stream(method, url, **kwargs) as r:
+                yield r
+    except Exception as e:
+        _breaker(provider).failure(str(e) or type(e).__name__)
+        raise
+    _record(provider, r)
+
+
+def get_provider_stats() -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "providers": {name: b.stats(now) for name, b in _BREAKERS.items()},
+        "config": {
+            "failureThreshold": _FAILURE_THRESHOLD,
+            "openSeconds": _OPEN_SECONDS,
+            "requestDeadlineSeconds": REQUEST_DEADLINE_SECONDS,
+        },
+    }
@@ -3,6 +3,8 @@ from typing import Any, Dict, List, Optional, Union
 import httpx
 from functools import lru_cache
 
+from utils.outbound import request as outbound_request, OutboundError
+
 TREFLE_TOKEN = os.getenv("TREFLE_TOKEN")  # obbligatorio
 TREFLE_BASE_URL = (os.getenv("TREFLE_BASE_URL", "https://trefle.io/api/v1") or "").rstrip("/")
 DEFAULT_TIMEOUT = 12.0
@@ -41,10 +43,12 @@ def _get(path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     url = f"{TREFLE_BASE_URL}/{path.lstrip('/')}"
     try:
         with _client() as cli:
-            r = cli.get(url, params=params or {})
+            r = outbound_request("trefle", "GET", url, timeout=DEFAULT_TIMEOUT, client=cli, params=params or {})
             if r.status_code >= 400:
                 raise TrefleError(f"HTTP {r.status_code} – {r.text}")
             return r.json()
+    except OutboundError as e:
+        raise TrefleError(f"Trefle non disponibile: {str(e)}")
     except httpx.RequestError as e:
         raise TrefleError(f"Errore di rete verso Trefle: {str(e)}")
 
@@ -1,9 +1,10 @@
 import os
 import time
 from typing import Optional, Dict, Any, List
-import httpx
 from datetime import datetime
 
+from utils.outbound import request as outbound_request
+
 _WEATHER_CACHE: Dict[str, Dict[str, Any]] = {}
 
 # Config da ENV
@@ -67,8 +68,9 @@ def get_weather(lat: float, lng: float) -> Optional[Dict[str, Any]]:
         return None
 
     key = _grid_key(lat, lng)
-    if key in _WEATHER_CACHE and not _expired(_WEATHER_CACHE[key]):
-        return _WEATHER_CACHE[key]["value"]
+    cached = _WEATHER_CACHE.get(key)
+    if cached and not _expired(cached):
+        return cached["value"]
 
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
@@ -82,12 +84,12 @@ def get_weather(lat: float, lng: float) -> Optional[Dict[str, Any]]:
     }
 
     try:
-        with httpx.Client(timeout=6.0) as cli:
-            r = cli.get(url, params=params)
-            r.raise_for_status()
-            j = r.json()
+        r = outbound_request("open-meteo", "GET", url, timeout=6.0, params=params)
+        r.raise_for_status()
+        j = r.json()
     except Exception:
-        return None
+        # Provider giù: meglio un dato scaduto che nessun dato
+        return cached["value"] if cached else None
 
     #current
     temp = j.get("current_weather", {}).get("temperature")
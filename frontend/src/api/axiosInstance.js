@@ -25,6 +25,14 @@ let onTokenRefreshed = (token) => {};      // idem
 export const setAccessTokenSupplier = (fn) => (getAccessToken = fn);
 export const setOnTokenRefreshed = (fn) => (onTokenRefreshed = fn);
 
+// Header Authorization per le chiamate fuori da axios (es. stream SSE via fetch)
+export const authHeaders = () => {
+  const token = getAccessToken?.();
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
+export { API_BASE_URL };
+
 //Coda richieste mentre il refresh è in corso
 let isRefreshing = false;
 let pendingRequests = [];
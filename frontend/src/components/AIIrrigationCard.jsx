@@ -102,6 +102,7 @@ const AIIrrigationCard = ({
     const effectiveResult = recommendation || plant?.ai_analysis_report;
     const rawLLMText = effectiveResult?.text || effectiveResult?.explanationLLM;   
     const llmText = cleanText(rawLLMText); 
+    const explanationPending = effectiveResult?.explanationStatus === 'pending';
     
     const temp = weather?.temp; 
     const hum = weather?.humidity;
@@ -198,6 +199,11 @@ const AIIrrigationCard = ({
                             <RefreshCw className="h-4 w-4 animate-spin" />
                             Analisi in corso...
                         </div>
+                    ) : explanationPending && !llmText ? (
+                        <div className="w-full py-2 bg-purple-50 text-purple-700 rounded-md text-sm font-medium flex items-center justify-center gap-2 border border-purple-200 border-dashed animate-pulse">
+                            <RefreshCw className="h-4 w-4 animate-spin" />
+                            Spiegazione AI in arrivo...
+                        </div>
                     ) : llmText ? (
                         <p className="text-sm text-gray-700 leading-relaxed whitespace-pre-line animate-in fade-in">{llmText}</p>
                     ) : (
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useCallback } from 'react';
 import { Brain, ArrowLeft, RefreshCw } from 'lucide-react';
-import { api } from '../api/axiosInstance';
+import { api, authHeaders, API_BASE_URL } from '../api/axiosInstance';
 import AIIrrigationCard from '../components/AIIrrigationCard';
 
 function getPlaceholderImage(plant) {
@@ -8,6 +8,10 @@ function getPlaceholderImage(plant) {
   return `https://source.unsplash.com/featured/800x450?${q},garden,botany`;
 }
 
+// Polling della spiegazione LLM: ogni 2s, per al massimo ~2 minuti
+const EXPLANATION_POLL_MS = 2000;
+const EXPLANATION_POLL_MAX = 60;
+
 const AIIrrigationPage = ({ onBack }) => {
   const [plants, setPlants] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -17,6 +21,74 @@ const AIIrrigationPage = ({ onBack }) => {
   const [weatherMap, setWeatherMap] = useState({});
   const [error, setError] = useState(null);
 
+  // 1b. POLLING SPIEGAZIONE LLM (generata in background dal backend)
+  const pollExplanation = useCallback(async (plantId) => {
+    for (let i = 0; i < EXPLANATION_POLL_MAX; i++) {
+      await new Promise(r => setTimeout(r, EXPLANATION_POLL_MS));
+      try {
+        const { data } = await api.get(`/api/piante/${plantId}/ai/irrigazione/spiegazione`);
+        if (data?.explanationStatus && data.explanationStatus !== 'pending') {
+          setRecommendations(prev => ({
+            ...prev,
+            [plantId]: {
+              ...prev[plantId],
+              explanationLLM: data.ai_analysis_report?.text,
+              explanationStatus: data.explanationStatus
+            }
+          }));
+          return;
+        }
+      } catch (e) {
+        console.error("Errore polling spiegazione", e);
+      }
+    }
+    setRecommendations(prev => ({ ...prev, [plantId]: { ...prev[plantId], explanationStatus: 'failed' } }));
+  }, []);
+
+  // 1c. STREAMING SPIEGAZIONE LLM (SSE): il testo compare man mano che viene generato
+  const streamExplanation = useCallback(async (plantId) => {
+    const res = await fetch(`${API_BASE_URL}/api/piante/${plantId}/ai/irrigazione/spiegazione/stream`, {
+      headers: authHeaders(),
+      credentials: 'include'
+    });
+    if (!res.ok || !res.body) throw new Error(`Stream HTTP ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const raw of events) {
+        const event = raw.match(/^event: (.*)$/m)?.[1];
+        const payload = raw.match(/^data: (.*)$/m)?.[1];
+        if (!payload) continue;
+        const data = JSON.parse(payload);
+        if (event === 'token') {
+          text += data.text;
+          setRecommendations(prev => ({ ...prev, [plantId]: { ...prev[plantId], explanationLLM: text } }));
+        } else if (event === 'done') {
+          // Stato ancora pending (job in un altro processo): decide il polling
+          if (data.explanationStatus === 'pending') return false;
+          setRecommendations(prev => ({
+            ...prev,
+            [plantId]: {
+              ...prev[plantId],
+              explanationLLM: data.ai_analysis_report?.text ?? text,
+              explanationStatus: data.explanationStatus
+            }
+          }));
+          return true;
+        }
+      }
+    }
+    return false;
+  }, []);
+
   // 1. CHIAMATA AI
   const askForAdvice = useCallback(async (plant) => {
     if (!plant?.id) return;
@@ -24,6 +96,12 @@ const AIIrrigationPage = ({ onBack }) => {
     try {
       const { data } = await api.post(`/api/piante/${plant.id}/ai/irrigazione`, {});
       setRecommendations(prev => ({ ...prev, [plant.id]: data }));
+      if (data?.explanationStatus === 'pending') {
+        // Se lo stream non è disponibile si ripiega sul polling
+        streamExplanation(plant.id)
+          .then(ok => { if (!ok) pollExplanation(plant.id); })
+          .catch(() => pollExplanation(plant.id));
+      }
     } catch (err) {
       console.error("Errore AI", err);
       setRecommendations(prev => ({ 
@@ -33,7 +111,7 @@ const AIIrrigationPage = ({ onBack }) => {
     } finally {
       setLoadingPlants(prev => { const s = new Set(prev); s.delete(plant.id); return s; });
     }
-  }, []);
+  }, [pollExplanation, streamExplanation]);
 
   // 2. METEO LIVE
   const fetchPlantWeather = useCallback(async (plant) => {